@@ -0,0 +1,62 @@
+"""Revenue and volume reports for the analytics window.
+
+Everything is read from the ``monthly_summary`` table (see migration 6),
+which triggers keep in step with the documents, so a report over years of
+history aggregates one row per month, client and product rather than every
+document line.
+"""
+from collections import namedtuple
+
+import database
+from document_store import TVA_RATE
+
+# Grouping key -> (column title, SQL expression)
+GROUPINGS = {
+    'client': ("Client", "coalesce(clients.name, '')"),
+    'product': ("Produit", 'monthly_summary.product'),
+    'client_type': ("Type de client", "coalesce(clients.client_type, '')"),
+    'month': ("Mois", 'monthly_summary.month'),
+}
+
+SummaryRow = namedtuple('SummaryRow', 'key quantity lines ht tva ttc')
+
+
+def summarize(group_by, doc_type=None, month_from=None, month_to=None, client=None):
+    """Quantity, line count and HT/TVA/TTC totals per ``group_by`` value.
+
+    Months are ``AAAA-MM`` strings and inclusive.  Months are returned in
+    calendar order, other groupings by decreasing HT total.
+    """
+    _, key = GROUPINGS[group_by]
+    sql = f'''SELECT {key}, sum(monthly_summary.quantity), sum(monthly_summary.line_count),
+                     sum(monthly_summary.total_ht)
+              FROM monthly_summary LEFT JOIN clients ON clients.id = monthly_summary.client_id
+              WHERE 1=1'''
+    params = []
+    if doc_type:
+        sql += ' AND monthly_summary.doc_type = ?'
+        params.append(doc_type)
+    if month_from:
+        sql += ' AND monthly_summary.month >= ?'
+        params.append(month_from)
+    if month_to:
+        sql += ' AND monthly_summary.month <= ?'
+        params.append(month_to)
+    if client:
+        sql += ' AND clients.name = ?'
+        params.append(client)
+    sql += ' GROUP BY 1 ORDER BY ' + ('1' if group_by == 'month' else '4 DESC')
+    return [SummaryRow(key, quantity, lines, ht, ht * TVA_RATE, ht * (1 + TVA_RATE))
+            for key, quantity, lines, ht in database.fetch_all(sql, params)]
+
+
+def grand_total(rows):
+    """A :class:`SummaryRow` adding up ``rows``."""
+    quantity = sum(row.quantity for row in rows)
+    lines = sum(row.lines for row in rows)
+    ht = sum(row.ht for row in rows)
+    return SummaryRow("Total", quantity, lines, ht, ht * TVA_RATE, ht * (1 + TVA_RATE))
+
+
+def last_document_id():
+    return database.fetch_one('SELECT max(id) FROM documents')[0]
@@ -0,0 +1,214 @@
+"""Generate documents in bulk from an order sheet, without the GUI.
+
+    python batch_invoices.py commandes.xlsx --output factures/ [--workers 4]
+
+The sheet (xlsx or csv) needs one row per product line with the columns
+client, type, numero, produit, quantite, prix_unitaire and optionally
+bon_de_commande (English names are accepted too); rows sharing a type and
+number make up one multi-line document, which is only generated if all of
+its rows are valid.  Every row is checked against the clients table and the
+PDFs are rendered in parallel to staging files; the documents that rendered
+are then inserted and their files put in place in a single transaction (see
+issue_pipeline), so a failure keeps none of them.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import database
+import issue_pipeline
+from client_repository import get_repository
+from document_store import document_exists
+from issue_pipeline import IssueRequest
+from pdf_generator import create_pdf, document_filename
+from sheet_columns import map_columns
+
+DOC_TYPES = ('devis', 'facture')
+
+# Accepted (accent-insensitive) header names for each field
+COLUMN_ALIASES = {
+    'client': ('client', 'client_name', 'nom_client'),
+    'type': ('type', 'type_document'),
+    'number': ('number', 'numero', 'n°', 'no'),
+    'product': ('product', 'produit', 'designation'),
+    'quantity': ('quantity', 'quantite'),
+    'unit_price': ('unit_price', 'prix_unitaire', 'pu'),
+    'purchase_order': ('purchase_order', 'bon_de_commande', 'po'),
+}
+REQUIRED = ('client', 'type', 'number', 'product', 'quantity', 'unit_price')
+
+
+def _parse_number(value):
+    return float(str(value).replace('\u00a0', '').replace(' ', '').replace(',', '.'))
+
+
+def read_order_sheet(path):
+    """Return the rows of the sheet as dicts keyed by field name."""
+    import pandas as pd
+    if path.lower().endswith('.csv'):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False, sep=None, engine='python')
+    else:
+        df = pd.read_excel(path, dtype=str, keep_default_na=False)
+    columns = {df.columns[index]: field for index, field in map_columns(df.columns, COLUMN_ALIASES).items()}
+    missing = [field for field in REQUIRED if field not in columns.values()]
+    if missing:
+        raise ValueError(f"Colonnes manquantes : {', '.join(missing)}")
+    df = df[list(columns)].rename(columns=columns)
+    return df.to_dict('records')
+
+
+def validate_orders(rows, date_str):
+    """Group sheet rows into documents; return (jobs, (line, message) errors).
+
+    Each job is (first sheet line, create_pdf arguments without the file
+    name, IssueRequest without a path).  A document with any invalid row is
+    rejected as a whole rather than issued without that line.
+    """
+    clients = get_repository()
+    documents = {}
+    rejected = set()  # (type, number) of documents with an invalid row
+    errors = []
+    for line, row in enumerate(rows, start=2):  # line 1 is the header
+        client_name = str(row.get('client', '')).strip()
+        doc_type = str(row.get('type', '')).strip().lower()
+        doc_number = str(row.get('number', '')).strip()
+        product = str(row.get('product', '')).strip()
+        purchase_order = str(row.get('purchase_order', '')).strip()
+        key = (doc_type, doc_number)
+        client = clients.get(client_name)
+        message = None
+        if client is None:
+            message = f"client inconnu « {client_name} »"
+        elif doc_type not in DOC_TYPES:
+            message = f"type de document invalide « {doc_type} »"
+        elif not doc_number or not product:
+            message = "numéro ou produit manquant"
+        else:
+            try:
+                quantity = _parse_number(row['quantity'])
+                unit_price = _parse_number(row['unit_price'])
+            except ValueError:
+                message = "la quantité et le prix unitaire doivent être des nombres"
+        if message is None:
+            document = documents.get(key)
+            if document is None:
+                if document_exists(doc_type, doc_number):
+                    message = f"{doc_type} n° {doc_number} existe déjà"
+                else:
+                    document = documents[key] = {
+                        'line': line, 'client': client, 'purchase_order': purchase_order, 'lines': []}
+            elif document['client'] is not client:
+                message = f"{doc_type} n° {doc_number} est déjà attribué à un autre client"
+        if message is not None:
+            errors.append((line, message))
+            if doc_type in DOC_TYPES and doc_number:
+                rejected.add(key)
+            continue
+        document['purchase_order'] = document['purchase_order'] or purchase_order
+        document['lines'].append((product, quantity, unit_price))
+
+    jobs = []
+    for (doc_type, doc_number), document in documents.items():
+        if (doc_type, doc_number) in rejected:
+            errors.append((document['line'], f"{doc_type} n° {doc_number} non généré : une de ses lignes est invalide"))
+            continue
+        client = document['client']
+        pdf_args = (client.name, client.nif, client.rc, client.address,
+                    client.preferences, doc_type, doc_number,
+                    document['purchase_order'], document['lines'], date_str)
+        request = IssueRequest(client, doc_type, doc_number, date_str,
+                               document['purchase_order'], document['lines'], None)
+        jobs.append((document['line'], pdf_args, request))
+    return jobs, errors
+
+
+def _render_one(task):
+    line, pdf_path, pdf_args = task
+    try:
+        create_pdf(pdf_path, *pdf_args)
+    except Exception as e:
+        return line, str(e)
+    return line, None
+
+
+def render_all(tasks, workers=None):
+    """Render (line, path, args) tasks in a process pool; yield (line, error)."""
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_render_one, tasks, chunksize=chunksize)
+
+
+def run_batch(sheet_path, output_dir, workers=None, date_str=None):
+    """Generate every valid document of the sheet and return a report dict."""
+    date_str = date_str or datetime.now().strftime("%Y-%m-%d")
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    jobs, errors = validate_orders(read_order_sheet(sheet_path), date_str)
+
+    tasks = []
+    requests = {}
+    for line, pdf_args, request in jobs:
+        doc_type, doc_number = pdf_args[5], pdf_args[6]
+        path = os.path.join(output_dir, document_filename(doc_type, pdf_args[0], doc_number, date_str))
+        tasks.append((line, path + '.part', pdf_args))
+        requests[line] = request._replace(path=path)
+
+    render_started = time.perf_counter()
+    staged = []
+    for line, error in render_all(tasks, workers):
+        if error:
+            errors.append((line, f"échec de la génération du PDF : {error}"))
+        else:
+            request = requests[line]
+            staged.append((request, request.doc_number, request.path + '.part'))
+    render_time = time.perf_counter() - render_started
+
+    try:
+        issue_pipeline.commit(staged)
+    finally:
+        for _, _, staging_path in staged:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+
+    errors.sort()
+    return {
+        'documents': len(staged),
+        'errors': errors,
+        'render_seconds': render_time,
+        'total_seconds': time.perf_counter() - started,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération de documents en lot à partir d'un bordereau de commandes.")
+    parser.add_argument('sheet', help="fichier .xlsx ou .csv des commandes")
+    parser.add_argument('-o', '--output', default='documents', help="dossier de sortie des PDF")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="nombre de processus de rendu")
+    parser.add_argument('--date', default=None, help="date des documents (AAAA-MM-JJ), aujourd'hui par défaut")
+    parser.add_argument('--db', default=None, help="chemin de la base de données")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = args.db
+    database.migrate()
+    try:
+        report = run_batch(args.sheet, args.output, args.workers, args.date)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+
+    for line, message in report['errors']:
+        print(f"Ligne {line} : {message}", file=sys.stderr)
+    rate = report['documents'] / report['render_seconds'] if report['render_seconds'] else 0.0
+    print(f"{report['documents']} document(s) généré(s), {len(report['errors'])} erreur(s)")
+    print(f"Rendu : {report['render_seconds']:.2f} s ({rate:.1f} docs/s), total : {report['total_seconds']:.2f} s")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
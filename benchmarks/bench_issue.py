@@ -0,0 +1,85 @@
+"""Document issue throughput: one transaction per document versus batches.
+
+Run from the repository root:  python benchmarks/bench_issue.py [count]
+
+"rows only" commits already-rendered documents without writing files, which
+isolates the database inserts; "full pipeline" renders and writes every PDF
+through issue_pipeline.issue / issue_many.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import issue_pipeline
+from client_repository import Client
+from issue_pipeline import IssueRequest
+
+CLIENT = Client(1, 'Client Benchmark', '30400224', '200721', 'Nouakchott', None, {})
+LINES = [('Ciment 42.5', 12.5, 2450.0), ('Fer à béton 12', 40.0, 380.0)]
+DATE = '2026-01-31'
+
+
+def fresh_database(tmp, name):
+    database.close_all()
+    database.DB_PATH = os.path.join(tmp, name)
+    database.migrate()
+    database.execute('INSERT INTO clients (id, name) VALUES (?, ?)', (CLIENT.id, CLIENT.name))
+
+
+def requests(count, prefix, output_dir=None):
+    return [IssueRequest(CLIENT, 'facture', f'{prefix}-{i}', DATE, 'PO-1', LINES,
+                         os.path.join(output_dir, f'{prefix}-{i}.pdf') if output_dir else None)
+            for i in range(count)]
+
+
+def rows_only(tmp, count, batched):
+    fresh_database(tmp, f'rows-{batched}.db')
+    staged = [(request, request.doc_number, b'') for request in requests(count, 'R')]
+    start = time.perf_counter()
+    if batched:
+        issue_pipeline.commit(staged)
+    else:
+        for entry in staged:
+            issue_pipeline.commit([entry])
+    return count / (time.perf_counter() - start)
+
+
+def full_pipeline(tmp, count, batched):
+    fresh_database(tmp, f'full-{batched}.db')
+    output_dir = os.path.join(tmp, f'out-{batched}')
+    os.makedirs(output_dir)
+    batch = requests(count, 'P', output_dir)
+    issue_pipeline.render(batch[0], 'warm-up')  # imports, fonts, letterhead
+    start = time.perf_counter()
+    if batched:
+        issue_pipeline.issue_many(batch)
+    else:
+        for request in batch:
+            issue_pipeline.issue(request)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        single = rows_only(tmp, count, batched=False)
+        batched = rows_only(tmp, count, batched=True)
+        print(f"{count} documents, rows only")
+        print(f"  one transaction per document : {single:10.0f} inserts/s")
+        print(f"  one transaction for all      : {batched:10.0f} inserts/s ({batched / single:.1f}x)")
+
+        rendered = max(1, count // 20)
+        single = full_pipeline(tmp, rendered, batched=False)
+        batched = full_pipeline(tmp, rendered, batched=True)
+        print(f"{rendered} documents, full pipeline (render + row + file)")
+        print(f"  issue() per document         : {single:10.1f} docs/s")
+        print(f"  issue_many()                 : {batched:10.1f} docs/s")
+        database.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Per-document render time of create_pdf with and without its caches.
+
+Run from the repository root:  python benchmarks/bench_render.py [count]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_assets
+import pdf_generator
+from pdf_generator import create_pdf
+
+SAMPLE = ('Client Benchmark', '30400224', '200721', 'Nouakchott', {},
+          'facture', 'F-0001', 'PO-45001', [('Ciment 42.5', 12.5, 2450.0)],
+          '2026-01-31')
+
+
+class _DirectLetterhead:
+    """Stand-in that draws the letterhead from scratch on every document."""
+
+    def stamp(self, c):
+        c.saveState()
+        pdf_generator.draw_letterhead(c)
+        c.restoreState()
+
+
+def run(count, mode):
+    get_letterhead = pdf_generator.get_letterhead
+    if mode != 'template':
+        pdf_generator.get_letterhead = _DirectLetterhead
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.pdf')
+            create_pdf(path, *SAMPLE)  # warm-up (imports, fonts)
+            start = time.perf_counter()
+            for _ in range(count):
+                if mode == 'cold':
+                    pdf_assets.clear()
+                create_pdf(path, *SAMPLE)
+            return (time.perf_counter() - start) / count * 1000
+    finally:
+        pdf_generator.get_letterhead = get_letterhead
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    cold = run(count, 'cold')
+    assets = run(count, 'assets')
+    template = run(count, 'template')
+    print(f"{count} documents")
+    print(f"  images re-encoded per document : {cold:8.2f} ms/doc")
+    print(f"  cached images                  : {assets:8.2f} ms/doc")
+    print(f"  cached images + letterhead     : {template:8.2f} ms/doc")
+    print(f"  speed-up                       : {cold / template:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
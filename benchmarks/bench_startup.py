@@ -0,0 +1,108 @@
+"""Cold-start cost of the GUI: module import breakdown and time to first window.
+
+Run from the repository root:  python benchmarks/bench_startup.py [runs]
+
+Each run starts a fresh interpreter.  The import breakdown comes from
+``python -X importtime`` and lists the direct imports of quotation_app by
+cumulative time.  Time to first window is measured from interpreter start
+until the main window has been built and painted; it needs a display and is
+skipped without one.
+"""
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Child script: build the main window against a scratch database, paint it and
+# report the elapsed time instead of asking for the document type.
+FIRST_WINDOW = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import database
+database.DB_PATH = {db!r}
+import quotation_app
+imported = time.perf_counter()
+
+def painted(self):
+    # Checked before painting: the background warm-up starts once Tk is idle
+    heavy = [m for m in ('reportlab', 'pandas', 'pdf2image', 'openpyxl') if m in sys.modules]
+    self.update()
+    print(json.dumps({{'import': imported - start, 'window': time.perf_counter() - start,
+                      'heavy': heavy}}))
+    sys.stdout.flush()
+    self.destroy()
+    sys.exit(0)
+
+quotation_app.QuotationApp.ask_doc_type_and_number = painted
+quotation_app.QuotationApp()
+'''
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_breakdown():
+    """Return (total_us, [(cumulative_us, module)]) for ``import quotation_app``,
+    its direct imports sorted slowest first."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import quotation_app'],
+                            cwd=ROOT, capture_output=True, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            entries.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    # -X importtime prints a module after everything it imported, indented
+    # one level (two spaces) deeper.
+    index = max(i for i, entry in enumerate(entries) if entry[2] == 'quotation_app')
+    total, depth, _ = entries[index]
+    direct = []
+    for cumulative, child_depth, name in reversed(entries[:index]):
+        if child_depth <= depth:
+            break
+        if child_depth == depth + 2:
+            direct.append((cumulative, name))
+    return total, sorted(direct, reverse=True)
+
+
+def first_window(runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        script = FIRST_WINDOW.format(root=ROOT, db=os.path.join(tmp, 'bench.db'))
+        samples = []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, '-c', script], cwd=tmp,
+                                    capture_output=True, text=True)
+            if result.returncode != 0 or not result.stdout.strip():
+                return None, result.stderr.strip().splitlines()[-1:] or ['unknown error']
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        return samples, None
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    totals = []
+    for _ in range(runs):
+        total, direct = import_breakdown()
+        totals.append(total)
+    print(f"import quotation_app       : {statistics.median(totals) / 1000:8.1f} ms (median of {runs})")
+    print("slowest direct imports (last run, cumulative):")
+    for cumulative, name in direct[:10]:
+        print(f"  {name:<24} : {cumulative / 1000:8.1f} ms")
+
+    samples, error = first_window(runs)
+    if samples is None:
+        print(f"time to first window       : skipped ({error[0]})")
+        return
+    print(f"time to first window       : {statistics.median(s['window'] for s in samples) * 1000:8.1f} ms"
+          f" (imports {statistics.median(s['import'] for s in samples) * 1000:.1f} ms)")
+    heavy = samples[-1]['heavy']
+    print(f"heavy modules at first paint: {', '.join(heavy) if heavy else 'none'}")
+
+
+if __name__ == '__main__':
+    main()
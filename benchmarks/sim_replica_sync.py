@@ -0,0 +1,134 @@
+"""Two desks working on replicas of one share, then syncing.
+
+Run from the repository root:  python benchmarks/sim_replica_sync.py [documents]
+
+A temporary directory stands in for the network share.  Each desk issues
+``documents`` automatically numbered documents while the share is reachable
+and edits the same client.  The share then goes away: automatic numbering
+must be refused, and both desks issue a document under the same number typed
+by hand.  Once the share is back both sync (twice, so each sees the other's
+changes).  The script checks that the share and both replicas end up with the
+same clients and documents, that no automatic number was handed out twice,
+that the later client edit won and that exactly the hand-typed clash was
+reported, and exits with status 1 if not.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import issue_pipeline
+import replica
+from client_repository import get_repository
+from issue_pipeline import IssueRequest
+
+LINES = [('Ciment 42.5', 10.0, 2450.0)]
+
+
+def use(path):
+    """Act as the desk working on ``path``."""
+    database.DB_PATH = path
+    get_repository().invalidate()
+
+
+def snapshot(path):
+    conn = database.connect(path)
+    try:
+        clients = conn.execute('SELECT uid, name, nif, rc, address, client_type, version FROM clients ORDER BY uid').fetchall()
+        documents = conn.execute('''SELECT documents.uid, clients.uid, type, number, duplicate, date, total_ht
+                                    FROM documents LEFT JOIN clients ON clients.id = documents.client_id
+                                    ORDER BY documents.uid''').fetchall()
+    finally:
+        conn.close()
+    return clients, documents
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        share = os.path.join(tmp, 'share', 'clients.db')
+        os.makedirs(os.path.dirname(share))
+        use(share)
+        database.migrate()
+        get_repository().add('Client Partagé', '30400224', '200721', 'Nouakchott', 'ciment', {})
+        database.close_all()
+
+        desks = {}
+        for name in ('A', 'B'):
+            local = replica.open_replica(share, os.path.join(tmp, f'desk{name}.db'))
+            desks[name] = (local, replica.ReplicaSync(share, local))
+
+        # Online work: both desks issue documents and edit the same client
+        for name, (local, _) in desks.items():
+            use(local)
+            repository = get_repository()
+            shared = repository.get('Client Partagé')
+            own = repository.add(f'Client {name}', '', '', '', 'beton', {})
+            repository.add('Client Commun', '', '', f'créé par {name}', 'ciment', {})
+            for i in range(count):
+                client = shared if i % 2 else own
+                issue_pipeline.issue(IssueRequest(client, 'facture', None, '2026-05-01', f'PO-{name}-{i}', LINES, None))
+            time.sleep(0.01)  # B's edit is the later one
+            repository.update('Client Partagé', 'Client Partagé', shared.nif, shared.rc,
+                              f'adresse {name}', 'ciment', {})
+            database.close_all()
+
+        # Offline work: no automatic numbers, and a clash of typed numbers
+        share_dir = os.path.dirname(share)
+        os.rename(share_dir, share_dir + '.off')
+        for name, (local, sync) in desks.items():
+            use(local)
+            client = get_repository().get('Client Partagé')
+            try:
+                issue_pipeline.issue(IssueRequest(client, 'facture', None, '2026-05-02', '', LINES, None))
+                problems.append(f"desk {name} numbered a document offline")
+            except replica.ShareUnavailable:
+                pass
+            issue_pipeline.issue(IssueRequest(client, 'facture', 'F-MANUEL-1', '2026-05-02', '', LINES, None))
+            if sync.sync_once() is not None or sync.last_error is None:
+                problems.append(f"desk {name} synced without the share")
+            database.close_all()
+        os.rename(share_dir + '.off', share_dir)
+
+        started = time.perf_counter()
+        for name in ('A', 'B', 'A', 'B'):
+            if desks[name][1].sync_once() is None:
+                problems.append(f"sync of desk {name} failed: {desks[name][1].last_error}")
+                break
+        elapsed = time.perf_counter() - started
+
+        expected = snapshot(share)
+        for name, (local, _) in desks.items():
+            if snapshot(local) != expected:
+                problems.append(f"desk {name} differs from the share")
+        clients, documents = expected
+        addresses = {row[1]: row[4] for row in clients}
+        if addresses.get('Client Partagé') != 'adresse B':
+            problems.append("the later client edit did not win")
+        if len([row for row in clients if row[1] == 'Client Commun']) != 1:
+            problems.append("clients created on both desks were not merged")
+        if len(documents) != 2 * count + 2:
+            problems.append(f"{len(documents)} documents instead of {2 * count + 2}")
+        if len({(row[2], row[3], row[4]) for row in documents}) != len(documents):
+            problems.append("duplicate (type, number, duplicate) slots")
+        if any(row[4] for row in documents if row[3] != 'F-MANUEL-1'):
+            problems.append("an automatic number was handed out twice")
+        conflicts = sum(len(sync.take_conflicts()) for _, sync in desks.values())
+        if conflicts != 1:
+            problems.append(f"{conflicts} numbering conflicts reported instead of 1")
+        database.close_all()
+
+    print(f"2 desks x {count + 1} documents synced in {elapsed:.2f} s; {conflicts} numbering conflict(s) reported")
+    for problem in problems:
+        print(f"  FAIL {problem}")
+    if not problems:
+        print("  OK   share and replicas converged")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Many processes issuing documents at once must get unique, gapless numbers.
+
+Run from the repository root:  python benchmarks/stress_numbering.py [processes] [documents]
+
+Every process issues ``documents`` invoices and quotes against the same
+scratch database through issue_pipeline.issue, as the application does.
+busy_timeout is lowered so the retry with backoff in database.retry_on_busy
+is exercised too.  The script then checks that each
+type's numbers run from 1 to the number issued, without duplicates or holes,
+and exits with status 1 if not.
+"""
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import document_store
+import issue_pipeline
+from client_repository import get_repository
+from issue_pipeline import IssueRequest
+
+DATE = '2026-03-15'
+LINES = [('Ciment 42.5', 1.0, 2450.0)]
+BUSY_TIMEOUT = 1000  # ms
+
+
+def _issue(task):
+    path, worker, count = task
+    database.DB_PATH = path
+    database.get_connection().execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+    client = get_repository().get('Client Stress')
+    numbers = []
+    for i in range(count):
+        doc_type = 'facture' if (worker + i) % 2 else 'devis'
+        request = IssueRequest(client, doc_type, None, DATE, f'PO-{worker}-{i}', LINES, None)
+        numbers.append((doc_type, issue_pipeline.issue(request).doc_number))
+    return numbers
+
+
+def check(path, issued):
+    """Return a list of problems with the numbers stored in ``path``."""
+    database.DB_PATH = path
+    problems = []
+    for doc_type in document_store.NUMBER_PREFIXES:
+        stored = [row[0] for row in database.fetch_all(
+            'SELECT number FROM documents WHERE type=?', (doc_type,))]
+        expected = [document_store.format_number(doc_type, 2026, n) for n in range(1, len(stored) + 1)]
+        if len(set(stored)) != len(stored):
+            problems.append(f"{doc_type}: duplicate numbers")
+        if sorted(stored) != expected:
+            problems.append(f"{doc_type}: numbers are not 1..{len(stored)}")
+        returned = sorted(number for t, number in issued if t == doc_type)
+        if returned != sorted(stored):
+            problems.append(f"{doc_type}: numbers returned differ from the database")
+    return problems
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    documents = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'stress.db')
+        database.DB_PATH = path
+        database.migrate()
+        database.execute("INSERT INTO clients (id, name) VALUES (1, 'Client Stress')")
+        database.close_all()
+
+        start = time.perf_counter()
+        with Pool(processes) as pool:
+            results = pool.map(_issue, [(path, worker, documents) for worker in range(processes)])
+        elapsed = time.perf_counter() - start
+
+        issued = [entry for numbers in results for entry in numbers]
+        problems = check(path, issued)
+        database.close_all()
+
+    print(f"{len(issued)} documents from {processes} processes in {elapsed:.2f} s"
+          f" ({len(issued) / elapsed:.0f} docs/s)")
+    for problem in problems:
+        print(f"  FAIL {problem}")
+    if not problems:
+        print("  OK   numbers unique and gapless for every type")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
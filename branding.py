@@ -0,0 +1,22 @@
+"""Company details printed on every document and shown in the app.
+
+Kept free of heavy imports so the GUI can read them at startup without
+loading ReportLab.
+"""
+LOGO_PATH = 'MAFCI.png'  # Place your company logo here
+IBAN = 'MR130030000101006313901-73'
+
+COMPANY_INFO = [
+    "Société Mauritano-Française des ciments",
+    "Tel:+222 45 29 85 56 / mob:+222 45 29 48 17",
+    "Email : info@mafci.mr",
+    "Route de Rosso, Zone Port, Nouakchott-Mauritanie",
+    "Capital: 431.000.000 MRU",
+    "RC: 200721 / NIF: 30400224",
+]
+BANK_INFO = [
+    "Banque : BAMIS",
+    "Compte :  00001 01006313901-73",
+    f"IBAN : {IBAN}",
+    "Devise : MRU",
+]
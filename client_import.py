@@ -0,0 +1,202 @@
+"""Import or update many clients at once from a distributor list.
+
+    python client_import.py clients.xlsx [--db clients.db]
+
+The sheet (xlsx or csv) needs a name column and may have nif, rc, address
+and client_type columns (French names such as nom, adresse or type_client
+are accepted too).  Rows are read and written in chunks of CHUNK_SIZE: names
+are normalized, the NIF (digits only), RC and client type validated, and
+each chunk is upserted with one executemany.  The whole import is a single transaction.
+Existing clients are matched by name regardless of case; their empty cells
+in the sheet leave the stored value alone.
+"""
+import argparse
+import csv
+import re
+import sqlite3
+import sys
+import time
+from itertools import islice
+
+import database
+import history_query
+from client_repository import get_repository
+from sheet_columns import map_columns, normalize_header
+
+CHUNK_SIZE = 500
+
+COLUMN_ALIASES = {
+    'name': ('name', 'nom', 'client', 'raison_sociale'),
+    'nif': ('nif',),
+    'rc': ('rc', 'registre_commerce'),
+    'address': ('address', 'adresse'),
+    'client_type': ('client_type', 'type', 'type_client', 'type_de_client'),
+}
+CLIENT_TYPES = ('ciment', 'beton')
+# Current NIFs have 8 digits, but older ones are shorter (and may start
+# with 0): only the digits are checked.
+NIF_PATTERN = re.compile(r'\d{1,14}')
+RC_PATTERN = re.compile(r'[0-9A-Z][0-9A-Z/.-]{0,19}')
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # NIF and RC typed as numbers in Excel
+    return ' '.join(str(value).split())
+
+
+def _read_xlsx(path):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+
+def read_rows(path):
+    """Yield (sheet line, {field: text}) for each non-empty row of the sheet."""
+    rows = _read_csv(path) if path.lower().endswith('.csv') else _read_xlsx(path)
+    header = next(rows, None) or ()
+    columns = map_columns(header, COLUMN_ALIASES)
+    if 'name' not in columns.values():
+        raise ValueError("Colonne manquante : name (nom du client)")
+    for line, row in enumerate(rows, start=2):  # line 1 is the header
+        values = {field: _cell(row[index]) if index < len(row) else ''
+                  for index, field in columns.items()}
+        if any(values.values()):
+            yield line, values
+
+
+def validate(values):
+    """Return ((name, nif, rc, address, client_type), None) or (None, message)."""
+    name = values.get('name', '')
+    nif = values.get('nif', '').replace(' ', '')
+    rc = values.get('rc', '').upper()
+    client_type = normalize_header(values.get('client_type', ''))
+    if not name:
+        return None, "nom du client manquant"
+    if nif and not NIF_PATTERN.fullmatch(nif):
+        return None, f"NIF invalide « {nif} » (chiffres uniquement)"
+    if rc and not RC_PATTERN.fullmatch(rc):
+        return None, f"RC invalide « {rc} »"
+    if client_type and client_type not in CLIENT_TYPES:
+        return None, f"type de client invalide « {values['client_type']} »"
+    return (name, nif, rc, values.get('address', ''), client_type), None
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _merge(row, stored):
+    # Empty cells keep what is already stored
+    return row[:1] + tuple(new or old or '' for new, old in zip(row[1:], stored))
+
+
+def import_clients(path):
+    """Import the clients of the sheet and return a report dict."""
+    started = time.perf_counter()
+    inserted = updated = unchanged = 0
+    rejected = []
+    seen = {}  # casefolded name -> sheet line
+    repository = get_repository()
+    with database.transaction(immediate=True) as conn:
+        known = {name.casefold(): name for name, in conn.execute('SELECT name FROM clients')}
+        for chunk in _chunks(read_rows(path), CHUNK_SIZE):
+            valid = []
+            for line, values in chunk:
+                row, error = validate(values)
+                if error is None:
+                    key = row[0].casefold()
+                    if key in seen:
+                        error = f"client « {row[0]} » déjà présent ligne {seen[key]}"
+                    else:
+                        seen[key] = line
+                if error:
+                    rejected.append((line, error))
+                    continue
+                valid.append((known.get(key, row[0]),) + row[1:])
+
+            names = [row[0] for row in valid]
+            stored = {}
+            if names:
+                stored = {row[0]: tuple(row[1:]) for row in conn.execute(
+                    'SELECT name, nif, rc, address, client_type FROM clients WHERE name IN (%s)'
+                    % ','.join('?' * len(names)), names)}
+            changes = []
+            for row in valid:
+                if row[0] not in stored:
+                    inserted += 1
+                    changes.append(row)
+                    continue
+                merged = _merge(row, stored[row[0]])
+                if merged[1:] == tuple(value or '' for value in stored[row[0]]):
+                    unchanged += 1
+                else:
+                    updated += 1
+                    changes.append(merged)
+            repository.upsert_many(changes)
+    repository.invalidate()
+    # Cached history pages show client names
+    history_query.invalidate()
+
+    elapsed = time.perf_counter() - started
+    processed = inserted + updated + unchanged + len(rejected)
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': unchanged,
+        'rejected': rejected,
+        'seconds': elapsed,
+        'rate': processed / elapsed if elapsed else 0.0,
+    }
+
+
+def format_report(report):
+    return (f"{report['inserted']} client(s) ajouté(s), {report['updated']} mis à jour, "
+            f"{report['unchanged']} inchangé(s), {len(report['rejected'])} rejeté(s) "
+            f"en {report['seconds']:.2f} s ({report['rate']:.0f} lignes/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import ou mise à jour de clients à partir d'un fichier Excel ou CSV.")
+    parser.add_argument('sheet', help="fichier .xlsx ou .csv des clients")
+    parser.add_argument('--db', default=None, help="chemin de la base de données")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = args.db
+    database.migrate()
+    try:
+        report = import_clients(args.sheet)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+
+    for line, message in report['rejected']:
+        print(f"Ligne {line} : {message}", file=sys.stderr)
+    print(format_report(report))
+    return 1 if report['rejected'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Type-ahead client combobox.
+
+Typing narrows the dropdown to the best matches from
+``ClientRepository.search`` (name, any word of the name, NIF or RC, ignoring
+case and accents) instead of listing every client.  Return or leaving the
+field settles on a client: the text is replaced by its exact name and
+``<<ComboboxSelected>>`` is generated, as when picking from the list.
+"""
+from tkinter import ttk
+
+from client_repository import get_repository
+
+MAX_MATCHES = 20
+# Keys that move around the field rather than change the text
+NAVIGATION_KEYS = {'Return', 'KP_Enter', 'Tab', 'Escape', 'Up', 'Down', 'Left', 'Right', 'Home', 'End',
+                   'Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R'}
+
+
+class ClientPicker(ttk.Combobox):
+    def __init__(self, parent, client_type=None, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.client_type = client_type
+        self.selected = None  # last name <<ComboboxSelected>> was generated for
+        self.refresh()
+        # Bound on a tag of our own so that callers binding events on the
+        # widget itself (typically <<ComboboxSelected>>) do not replace these.
+        tag = f'{self}.picker'
+        self.bindtags((tag,) + self.bindtags())
+        self.bind_class(tag, '<KeyRelease>', self.on_key)
+        self.bind_class(tag, '<Return>', lambda e: self.settle(fuzzy=True))
+        self.bind_class(tag, '<KP_Enter>', lambda e: self.settle(fuzzy=True))
+        self.bind_class(tag, '<FocusOut>', lambda e: self.settle())
+        self.bind_class(tag, '<<ComboboxSelected>>', self.on_selected)
+
+    def set_client_type(self, client_type):
+        """Only offer clients of ``client_type`` (None for all) and clear the field."""
+        self.client_type = client_type
+        self.set('')
+        self.selected = None
+        self.refresh()
+
+    def refresh(self):
+        """Recompute the matches, e.g. after clients were added or renamed."""
+        self['values'] = get_repository().search(self.get(), MAX_MATCHES, self.client_type, fuzzy=False)
+
+    def on_key(self, event):
+        if event.keysym not in NAVIGATION_KEYS:
+            self.refresh()
+
+    def settle(self, fuzzy=False):
+        """Replace the typed text with the client it designates, if any."""
+        text = self.get().strip()
+        if not text or text == self.selected:
+            return
+        repository = get_repository()
+        client = repository.get(text)
+        if client is None or (self.client_type and client.client_type != self.client_type):
+            matches = repository.search(text, 2, self.client_type, fuzzy=fuzzy)
+            if len(matches) != 1 and not (fuzzy and matches):
+                self.refresh()
+                return
+            text = matches[0]
+        self.set(text)
+        self.event_generate('<<ComboboxSelected>>')
+
+    def on_selected(self, event):
+        self.selected = self.get()
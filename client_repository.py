@@ -0,0 +1,202 @@
+"""In-memory view of the ``clients`` table.
+
+The whole table is read once and kept indexed by name and by client type, so
+dropdown events, the details window and PDF rendering never go back to the
+database for client data.  Writes go through the repository, which updates
+the database and its indexes together.
+
+:meth:`ClientRepository.search` serves the type-ahead client pickers from
+sorted, accent- and case-folded keys: a bisect finds the first key starting
+with the typed text and the matches follow it.
+"""
+import bisect
+import difflib
+import json
+import threading
+import unicodedata
+from collections import namedtuple
+
+import database
+
+Client = namedtuple('Client', 'id name nif rc address client_type preferences')
+
+
+def fold(text):
+    """Lower-case ``text`` without accents or repeated spaces ("Béton" -> "beton")."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+def _search_keys(client):
+    """Secondary keys of a client: each later word of its name, NIF and RC."""
+    words = fold(client.name).split(' ')
+    keys = [' '.join(words[i:]) for i in range(1, len(words))]
+    keys.extend(fold(value) for value in (client.nif, client.rc) if value)
+    return keys
+
+
+def parse_preferences(raw):
+    """Decode the JSON stored in ``clients.preferences`` (always a dict)."""
+    if not raw:
+        return {}
+    try:
+        prefs = json.loads(raw)
+    except Exception:
+        return {}
+    return prefs if isinstance(prefs, dict) else {}
+
+
+class ClientRepository:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_name = None
+        self._names = []
+        self._names_by_type = {}
+        self._folded = []  # sorted (folded name, name)
+        self._keys = []    # sorted (folded secondary key, name)
+
+    def _ensure_loaded(self):
+        if self._by_name is not None:
+            return
+        rows = database.fetch_all(
+            'SELECT id, name, nif, rc, address, client_type, preferences FROM clients ORDER BY name')
+        by_name = {}
+        names_by_type = {}
+        for row in rows:
+            client = Client(*row[:6], parse_preferences(row[6]))
+            by_name[client.name] = client
+            names_by_type.setdefault(client.client_type, []).append(client.name)
+        self._by_name = by_name
+        self._names = [row[1] for row in rows]
+        self._names_by_type = names_by_type
+        self._folded = sorted((fold(name), name) for name in by_name)
+        self._keys = sorted((key, client.name) for client in by_name.values() for key in _search_keys(client))
+
+    def invalidate(self):
+        """Drop the cached table; it is reloaded on next access."""
+        with self._lock:
+            self._by_name = None
+            self._names = []
+            self._names_by_type = {}
+            self._folded = []
+            self._keys = []
+
+    def get(self, name):
+        with self._lock:
+            self._ensure_loaded()
+            return self._by_name.get(name)
+
+    def names(self, client_type=None):
+        """Sorted client names, optionally restricted to one client type."""
+        with self._lock:
+            self._ensure_loaded()
+            if client_type:
+                return list(self._names_by_type.get(client_type, ()))
+            return list(self._names)
+
+    def search(self, text, limit=20, client_type=None, fuzzy=True):
+        """Up to ``limit`` client names matching ``text``, ignoring case and
+        accents.
+
+        Names starting with the text come first, then names with a later
+        word starting with it, then clients whose NIF or RC does.  With
+        ``fuzzy``, a text matching nothing falls back to the closest names,
+        NIFs and RCs, to forgive typos (a slower scan of every client).
+        """
+        prefix = fold(text)
+        with self._lock:
+            self._ensure_loaded()
+            if not prefix:
+                return self.names(client_type)[:limit]
+            matches = []
+            for keys in (self._folded, self._keys):
+                index = bisect.bisect_left(keys, (prefix,))
+                while index < len(keys) and len(matches) < limit:
+                    key, name = keys[index]
+                    if not key.startswith(prefix):
+                        break
+                    if name not in matches and (not client_type or self._by_name[name].client_type == client_type):
+                        matches.append(name)
+                    index += 1
+            if not matches and fuzzy:
+                candidates = {}
+                for client in self._by_name.values():
+                    if not client_type or client.client_type == client_type:
+                        for value in (client.name, client.nif, client.rc):
+                            if value:
+                                candidates.setdefault(fold(value), client.name)
+                for key in difflib.get_close_matches(prefix, list(candidates), limit * 3, 0.6):
+                    if candidates[key] not in matches:
+                        matches.append(candidates[key])
+                matches = matches[:limit]
+            return matches
+
+    def _index(self, client):
+        self._by_name[client.name] = client
+        bisect.insort(self._names, client.name)
+        bisect.insort(self._names_by_type.setdefault(client.client_type, []), client.name)
+        bisect.insort(self._folded, (fold(client.name), client.name))
+        for key in _search_keys(client):
+            bisect.insort(self._keys, (key, client.name))
+
+    def _unindex(self, client):
+        del self._by_name[client.name]
+        self._names.remove(client.name)
+        self._names_by_type.get(client.client_type, []).remove(client.name)
+        self._folded.remove((fold(client.name), client.name))
+        for key in _search_keys(client):
+            self._keys.remove((key, client.name))
+
+    def add(self, name, nif, rc, address, client_type, preferences):
+        """Insert a client; raises sqlite3.IntegrityError if the name exists."""
+        with self._lock:
+            self._ensure_loaded()
+            cur = database.execute(
+                'INSERT INTO clients (name, nif, rc, address, client_type, preferences) VALUES (?,?,?,?,?,?)',
+                (name, nif, rc, address, client_type, json.dumps(preferences)))
+            client = Client(cur.lastrowid, name, nif, rc, address, client_type, dict(preferences))
+            self._index(client)
+            return client
+
+    def update(self, old_name, name, nif, rc, address, client_type, preferences):
+        """Update the client currently called ``old_name``."""
+        with self._lock:
+            self._ensure_loaded()
+            database.execute(
+                'UPDATE clients SET name=?, nif=?, rc=?, address=?, client_type=?, preferences=? WHERE name=?',
+                (name, nif, rc, address, client_type, json.dumps(preferences), old_name))
+            old = self._by_name.get(old_name)
+            if old is None:
+                # Not in our snapshot (edited elsewhere); resync from disk.
+                self.invalidate()
+                return self.get(name)
+            self._unindex(old)
+            client = Client(old.id, name, nif, rc, address, client_type, dict(preferences))
+            self._index(client)
+            return client
+
+    def upsert_many(self, rows):
+        """Insert or update (name, nif, rc, address, client_type) rows, matched
+        by name, with a single executemany; existing preferences are kept.
+
+        Runs in the caller's transaction, if any; call :meth:`invalidate`
+        once it has committed.
+        """
+        with self._lock:
+            database.get_connection().executemany(
+                '''INSERT INTO clients (name, nif, rc, address, client_type) VALUES (?,?,?,?,?)
+                   ON CONFLICT(name) DO UPDATE SET nif=excluded.nif, rc=excluded.rc,
+                       address=excluded.address, client_type=excluded.client_type''',
+                rows)
+
+
+_repository = None
+
+
+def get_repository():
+    """Return the process-wide client repository."""
+    global _repository
+    if _repository is None:
+        _repository = ClientRepository()
+    return _repository
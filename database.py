@@ -0,0 +1,548 @@
+"""Shared SQLite access for the quotation app.
+
+Every window goes through :func:`get_connection` instead of opening its own
+``sqlite3.connect(DB_PATH)`` for a single query.  Each thread gets one
+long-lived, tuned connection: the Tk thread uses the main one and background
+workers get their own from a thread-local pool (sqlite3 connections must not
+be shared across threads).
+"""
+import atexit
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Path to the SQLite database
+DB_PATH = 'clients.db'
+
+# Statements are cached per connection by the sqlite3 module, so keeping the
+# connection alive and reusing the same SQL strings gives prepared-statement
+# reuse for free.  Size the cache well above the number of distinct queries.
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    ('cache_size', -16000),         # ~16 MB page cache
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+)
+# WAL and mmap need every process using the database to be on the same host,
+# which a clients.db on a network drive opened by several desks is not.
+# They are only turned on for databases marked local with mark_local (the
+# replica of replica mode); anything else keeps a rollback journal.
+LOCAL_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),      # safe with WAL, avoids an fsync per commit
+    ('mmap_size', 64 * 1024 * 1024),
+)
+SHARED_PRAGMAS = (
+    ('journal_mode', 'DELETE'),
+    ('mmap_size', 0),
+)
+
+# Writers that still find the database locked once busy_timeout has expired
+# (e.g. on a slow network share) start over this many times, waiting
+# BUSY_RETRY_DELAY seconds, doubled after each attempt, with some jitter.
+BUSY_RETRIES = 6
+BUSY_RETRY_DELAY = 0.05
+
+_local = threading.local()
+_lock = threading.Lock()
+_connections = []
+_local_paths = set()  # databases known to be on a local disk
+
+
+def mark_local(path):
+    """Declare that the database at ``path`` is only used from this host, so
+    its connections may use WAL and mmap."""
+    _local_paths.add(os.path.abspath(path))
+
+
+def is_local(path):
+    return os.path.abspath(path) in _local_paths
+
+
+def connect(path=None):
+    """Open a new tuned connection (callers own it and must close it)."""
+    path = path or DB_PATH
+    conn = sqlite3.connect(path,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           isolation_level=None)
+    for name, value in PRAGMAS + (LOCAL_PRAGMAS if is_local(path) else SHARED_PRAGMAS):
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+def get_connection():
+    """Return the long-lived connection for the calling thread."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != DB_PATH:
+        if conn is not None:
+            _discard(conn)
+        conn = connect()
+        _local.conn = conn
+        _local.path = DB_PATH
+        with _lock:
+            _connections.append(conn)
+    return conn
+
+
+def _discard(conn):
+    with _lock:
+        if conn in _connections:
+            _connections.remove(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def close_thread_connection():
+    """Close the calling thread's connection (for worker thread teardown)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _discard(conn)
+        _local.conn = None
+
+
+def close_all():
+    """Close every pooled connection, e.g. when the application exits."""
+    with _lock:
+        conns = list(_connections)
+        _connections.clear()
+    for conn in conns:
+        try:
+            conn.execute('PRAGMA optimize')
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.conn = None
+
+
+atexit.register(close_all)
+
+
+@contextmanager
+def transaction(immediate=False):
+    """Run a block inside one transaction on the thread's connection.
+
+    Connections are in autocommit mode, so anything that writes more than one
+    statement should group them here.  ``immediate=True`` takes the write lock
+    up front (``BEGIN IMMEDIATE``).
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        # Nested use joins the outer transaction.
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def is_busy_error(exc):
+    """True for SQLITE_BUSY / SQLITE_LOCKED errors."""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    code = getattr(exc, 'sqlite_errorcode', None)  # Python 3.11+
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(exc)
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(func, *args, **kwargs):
+    """Call ``func``, running it again with exponential backoff while the
+    database is busy.  ``func`` must do its writes in its own transaction;
+    inside an outer transaction it is only called once, since a busy error
+    there has already rolled back more than ``func`` could redo."""
+    if get_connection().in_transaction:
+        return func(*args, **kwargs)
+    delay = BUSY_RETRY_DELAY
+    for attempt in range(BUSY_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == BUSY_RETRIES - 1:
+                raise
+        time.sleep(delay * random.uniform(0.5, 1.5))
+        delay *= 2
+
+
+def _add_column(conn, table, column, decl):
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def _migration_1_base_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS clients (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE,
+        nif TEXT,
+        rc TEXT,
+        address TEXT,
+        client_type TEXT,
+        preferences TEXT
+    )''')
+    # Databases created by older versions may lack these columns
+    _add_column(conn, 'clients', 'client_type', 'TEXT')
+    _add_column(conn, 'clients', 'preferences', 'TEXT')
+    conn.execute('''CREATE TABLE IF NOT EXISTS quotations (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER,
+        type TEXT,
+        number TEXT,
+        product TEXT,
+        quantity REAL,
+        unit_price REAL,
+        date TEXT,
+        purchase_order TEXT,
+        FOREIGN KEY(client_id) REFERENCES clients(id)
+    )''')
+    _add_column(conn, 'quotations', 'purchase_order', 'TEXT')
+
+
+def _migration_2_indexes(conn):
+    # History filters (client, type, date) and the client dropdowns
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_quotations_client_date ON quotations(client_id, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_quotations_type_date ON quotations(type, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_quotations_date ON quotations(date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_quotations_number ON quotations(number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clients_type_name ON clients(client_type, name)')
+    conn.execute('ANALYZE')
+
+
+def _migration_3_document_lines(conn):
+    # One header row per document plus any number of product lines.  The old
+    # single-line quotations table becomes a view with the same columns (one
+    # row per line) so existing readers keep working.
+    conn.execute('''CREATE TABLE documents (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER,
+        type TEXT,
+        number TEXT,
+        date TEXT,
+        purchase_order TEXT,
+        FOREIGN KEY(client_id) REFERENCES clients(id)
+    )''')
+    conn.execute('''CREATE TABLE document_lines (
+        id INTEGER PRIMARY KEY,
+        document_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        product TEXT,
+        quantity REAL,
+        unit_price REAL,
+        FOREIGN KEY(document_id) REFERENCES documents(id) ON DELETE CASCADE
+    )''')
+    conn.execute('''INSERT INTO documents (id, client_id, type, number, date, purchase_order)
+                    SELECT id, client_id, type, number, date, purchase_order FROM quotations''')
+    conn.execute('''INSERT INTO document_lines (document_id, position, product, quantity, unit_price)
+                    SELECT id, 1, product, quantity, unit_price FROM quotations''')
+    conn.execute('DROP TABLE quotations')
+    conn.execute('''CREATE VIEW quotations AS
+        SELECT documents.id, documents.client_id, documents.type, documents.number,
+               document_lines.product, document_lines.quantity, document_lines.unit_price,
+               documents.date, documents.purchase_order
+        FROM documents JOIN document_lines ON document_lines.document_id = documents.id''')
+    conn.execute('CREATE INDEX idx_documents_client_date ON documents(client_id, date)')
+    conn.execute('CREATE INDEX idx_documents_type_date ON documents(type, date)')
+    conn.execute('CREATE INDEX idx_documents_date ON documents(date)')
+    conn.execute('CREATE INDEX idx_documents_number ON documents(number)')
+    conn.execute('CREATE INDEX idx_document_lines_document ON document_lines(document_id, position)')
+    conn.execute('ANALYZE')
+
+
+# Row of the history search index for each document line (rowid =
+# document_lines.id): the product plus its document's number and purchase
+# order and the client's name, NIF and RC.  Indexing lines rather than whole
+# documents keeps inserts append-only, which FTS5 handles far faster than
+# rewriting a document's row as each of its lines arrives.
+_SEARCH_SOURCE = '''SELECT document_lines.id, documents.number, documents.purchase_order,
+           document_lines.product, clients.name, clients.nif, clients.rc
+    FROM document_lines
+    JOIN documents ON documents.id = document_lines.document_id
+    LEFT JOIN clients ON clients.id = documents.client_id'''
+_SEARCH_COLUMNS = 'rowid, number, purchase_order, product, client, nif, rc'
+
+
+def _reindex_lines(where):
+    """SQL that rebuilds the search rows of the lines selected by ``where``."""
+    return (f'''DELETE FROM history_search WHERE rowid IN (
+                SELECT document_lines.id FROM document_lines
+                JOIN documents ON documents.id = document_lines.document_id WHERE {where});
+            INSERT INTO history_search ({_SEARCH_COLUMNS}) {_SEARCH_SOURCE} WHERE {where};''')
+
+
+def _migration_4_search(conn):
+    # Amount filters: the HT total of each document, kept up to date by
+    # triggers on its lines.
+    _add_column(conn, 'documents', 'total_ht', 'REAL NOT NULL DEFAULT 0')
+    conn.execute('''UPDATE documents SET total_ht = coalesce(
+        (SELECT sum(quantity * unit_price) FROM document_lines
+         WHERE document_lines.document_id = documents.id), 0)''')
+    conn.execute('CREATE INDEX idx_documents_total_ht ON documents(total_ht)')
+    conn.execute('''CREATE TRIGGER document_lines_total_insert AFTER INSERT ON document_lines BEGIN
+        UPDATE documents SET total_ht = total_ht + NEW.quantity * NEW.unit_price WHERE id = NEW.document_id;
+    END''')
+    conn.execute('''CREATE TRIGGER document_lines_total_delete AFTER DELETE ON document_lines BEGIN
+        UPDATE documents SET total_ht = total_ht - OLD.quantity * OLD.unit_price WHERE id = OLD.document_id;
+    END''')
+    conn.execute('''CREATE TRIGGER document_lines_total_update
+        AFTER UPDATE OF document_id, quantity, unit_price ON document_lines BEGIN
+        UPDATE documents SET total_ht = total_ht - OLD.quantity * OLD.unit_price WHERE id = OLD.document_id;
+        UPDATE documents SET total_ht = total_ht + NEW.quantity * NEW.unit_price WHERE id = NEW.document_id;
+    END''')
+
+    # Full-text search over the history.  Accents are ignored and 2-3
+    # character prefixes are indexed so "45*" style searches stay fast.
+    conn.execute('''CREATE VIRTUAL TABLE history_search USING fts5(
+        number, purchase_order, product, client, nif, rc,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')''')
+    conn.execute(f'INSERT INTO history_search ({_SEARCH_COLUMNS}) {_SEARCH_SOURCE}')
+    conn.execute(f'''CREATE TRIGGER document_lines_search_insert AFTER INSERT ON document_lines BEGIN
+        INSERT INTO history_search ({_SEARCH_COLUMNS}) {_SEARCH_SOURCE} WHERE document_lines.id = NEW.id;
+    END''')
+    conn.execute('''CREATE TRIGGER document_lines_search_delete AFTER DELETE ON document_lines BEGIN
+        DELETE FROM history_search WHERE rowid = OLD.id;
+    END''')
+    conn.execute(f'''CREATE TRIGGER document_lines_search_update
+        AFTER UPDATE OF document_id, product ON document_lines BEGIN
+        DELETE FROM history_search WHERE rowid = OLD.id;
+        INSERT INTO history_search ({_SEARCH_COLUMNS}) {_SEARCH_SOURCE} WHERE document_lines.id = NEW.id;
+    END''')
+    conn.execute(f'''CREATE TRIGGER documents_search_update
+        AFTER UPDATE OF client_id, number, purchase_order ON documents BEGIN
+        {_reindex_lines('documents.id = NEW.id')}
+    END''')
+    conn.execute('''CREATE TRIGGER documents_search_delete AFTER DELETE ON documents BEGIN
+        DELETE FROM history_search WHERE rowid IN (
+            SELECT id FROM document_lines WHERE document_id = OLD.id);
+    END''')
+    conn.execute(f'''CREATE TRIGGER clients_search_update AFTER UPDATE OF name, nif, rc ON clients BEGIN
+        {_reindex_lines('documents.client_id = NEW.id')}
+    END''')
+    conn.execute('ANALYZE')
+
+
+def _migration_5_numbering(conn):
+    # Per type and year counters behind automatic numbering (D-2026-0001,
+    # F-2026-0001...), continuing from numbers already issued in that format.
+    conn.execute('''CREATE TABLE document_sequences (
+        doc_type TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        last_number INTEGER NOT NULL,
+        PRIMARY KEY (doc_type, year)
+    )''')
+    conn.execute('''INSERT INTO document_sequences (doc_type, year, last_number)
+        SELECT type, CAST(substr(number, 3, 4) AS INTEGER), max(CAST(substr(number, 8) AS INTEGER))
+        FROM documents
+        WHERE (type = 'devis' AND number GLOB 'D-[0-9][0-9][0-9][0-9]-[0-9]*')
+           OR (type = 'facture' AND number GLOB 'F-[0-9][0-9][0-9][0-9]-[0-9]*')
+        GROUP BY type, substr(number, 3, 4)''')
+    # Numbers must be unique per type from now on.  Duplicates typed by hand
+    # before this point keep their number and are told apart by
+    # ``duplicate`` (0 for the first, 1, 2... for the later ones) rather than
+    # renumbering documents that were already sent.
+    _add_column(conn, 'documents', 'duplicate', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''UPDATE documents SET duplicate = (
+            SELECT count(*) FROM documents AS earlier
+            WHERE earlier.number = documents.number AND earlier.type = documents.type
+              AND earlier.id < documents.id)
+        WHERE id IN (SELECT later.id FROM documents AS later JOIN documents AS earlier
+                     ON earlier.number = later.number AND earlier.type = later.type
+                     AND earlier.id < later.id)''')
+    conn.execute('CREATE UNIQUE INDEX idx_documents_type_number ON documents(type, number, duplicate)')
+
+
+# Monthly summary rows, added to (or, with sign -1, subtracted from) by the
+# triggers below.  Missing clients, types and products are stored as 0 / ''
+# so that they group together under the primary key.
+_SUMMARY_UPSERT = '''INSERT INTO monthly_summary (month, doc_type, client_id, product, quantity, total_ht, line_count)
+    {source}
+    ON CONFLICT (month, doc_type, client_id, product) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        total_ht = total_ht + excluded.total_ht,
+        line_count = line_count + excluded.line_count;'''
+
+
+def _summarize_line(line, sign):
+    """SQL adding one document line (``NEW`` or ``OLD``) to the summary."""
+    return _SUMMARY_UPSERT.format(source=f'''SELECT substr(date, 1, 7), coalesce(type, ''),
+           coalesce(client_id, 0), coalesce({line}.product, ''), {sign} * coalesce({line}.quantity, 0),
+           {sign} * coalesce({line}.quantity * {line}.unit_price, 0), {sign}
+        FROM documents WHERE id = {line}.document_id''')
+
+
+def _summarize_document(document, sign):
+    """SQL adding every line of a document (``NEW`` or ``OLD``) to the summary."""
+    return _SUMMARY_UPSERT.format(source=f'''SELECT substr({document}.date, 1, 7),
+           coalesce({document}.type, ''), coalesce({document}.client_id, 0), coalesce(product, ''),
+           {sign} * coalesce(sum(quantity), 0), {sign} * coalesce(sum(quantity * unit_price), 0),
+           {sign} * count(*)
+        FROM document_lines WHERE document_id = {document}.id GROUP BY coalesce(product, '')''')
+
+
+def _drop_empty_summary(document_id):
+    return f'''DELETE FROM monthly_summary WHERE line_count <= 0
+        AND (month, doc_type, client_id) IN (
+            SELECT substr(date, 1, 7), coalesce(type, ''), coalesce(client_id, 0)
+            FROM documents WHERE id = {document_id});'''
+
+
+def _migration_6_monthly_summary(conn):
+    # Quantities and HT totals per month, document type, client and product,
+    # kept current by triggers so reports read a few thousand rows instead
+    # of aggregating every document line.  Client names and types are joined
+    # at query time so renaming a client needs no refresh.
+    conn.execute('''CREATE TABLE monthly_summary (
+        month TEXT NOT NULL,
+        doc_type TEXT NOT NULL,
+        client_id INTEGER NOT NULL,
+        product TEXT NOT NULL,
+        quantity REAL NOT NULL,
+        total_ht REAL NOT NULL,
+        line_count INTEGER NOT NULL,
+        PRIMARY KEY (month, doc_type, client_id, product)
+    ) WITHOUT ROWID''')
+    conn.execute('''INSERT INTO monthly_summary
+        SELECT substr(documents.date, 1, 7), coalesce(documents.type, ''), coalesce(documents.client_id, 0),
+               coalesce(document_lines.product, ''), coalesce(sum(document_lines.quantity), 0),
+               coalesce(sum(document_lines.quantity * document_lines.unit_price), 0), count(*)
+        FROM document_lines JOIN documents ON documents.id = document_lines.document_id
+        GROUP BY 1, 2, 3, 4''')
+    conn.execute(f'''CREATE TRIGGER document_lines_summary_insert AFTER INSERT ON document_lines BEGIN
+        {_summarize_line('NEW', 1)}
+    END''')
+    conn.execute(f'''CREATE TRIGGER document_lines_summary_delete AFTER DELETE ON document_lines BEGIN
+        {_summarize_line('OLD', -1)}
+        {_drop_empty_summary('OLD.document_id')}
+    END''')
+    conn.execute(f'''CREATE TRIGGER document_lines_summary_update
+        AFTER UPDATE OF document_id, product, quantity, unit_price ON document_lines BEGIN
+        {_summarize_line('OLD', -1)}
+        {_drop_empty_summary('OLD.document_id')}
+        {_summarize_line('NEW', 1)}
+    END''')
+    # A document's lines move with it when its date, type or client change.
+    # Lines deleted after their document are no longer found by the line
+    # triggers, so they are not subtracted twice.
+    conn.execute(f'''CREATE TRIGGER documents_summary_update
+        AFTER UPDATE OF client_id, type, date ON documents BEGIN
+        {_summarize_document('OLD', -1)}
+        DELETE FROM monthly_summary WHERE line_count <= 0 AND month = substr(OLD.date, 1, 7)
+            AND doc_type = coalesce(OLD.type, '') AND client_id = coalesce(OLD.client_id, 0);
+        {_summarize_document('NEW', 1)}
+    END''')
+    conn.execute(f'''CREATE TRIGGER documents_summary_delete AFTER DELETE ON documents BEGIN
+        {_summarize_document('OLD', -1)}
+        DELETE FROM monthly_summary WHERE line_count <= 0 AND month = substr(OLD.date, 1, 7)
+            AND doc_type = coalesce(OLD.type, '') AND client_id = coalesce(OLD.client_id, 0);
+    END''')
+
+
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+_NEW_UID = 'lower(hex(randomblob(16)))'
+
+
+def _migration_7_replication(conn):
+    # Replica mode (see replica.py): rows are matched across databases by a
+    # random uid, clients carry a version for last-writer-wins merges, and
+    # sync_log lists what changed, in order, for the next sync to ship.
+    _add_column(conn, 'clients', 'uid', 'TEXT')
+    _add_column(conn, 'clients', 'version', 'INTEGER NOT NULL DEFAULT 1')
+    _add_column(conn, 'clients', 'updated_at', 'TEXT')
+    _add_column(conn, 'documents', 'uid', 'TEXT')
+    conn.execute(f'UPDATE clients SET uid = {_NEW_UID}, updated_at = {_NOW}')
+    conn.execute(f'UPDATE documents SET uid = {_NEW_UID}')
+    conn.execute('CREATE UNIQUE INDEX idx_clients_uid ON clients(uid)')
+    conn.execute('CREATE UNIQUE INDEX idx_documents_uid ON documents(uid)')
+    conn.execute('''CREATE TABLE sync_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        uid TEXT NOT NULL
+    )''')
+    conn.execute('CREATE TABLE sync_state (key TEXT PRIMARY KEY, value TEXT)')
+    conn.execute(f'''CREATE TRIGGER clients_sync_insert AFTER INSERT ON clients BEGIN
+        UPDATE clients SET uid = coalesce(NEW.uid, {_NEW_UID}), updated_at = coalesce(NEW.updated_at, {_NOW})
+            WHERE id = NEW.id;
+        INSERT INTO sync_log (entity, uid) SELECT 'client', uid FROM clients WHERE id = NEW.id;
+    END''')
+    # Local edits bump the version; merged rows arrive with their own
+    # version and timestamp and are taken as they are.
+    conn.execute(f'''CREATE TRIGGER clients_sync_version
+        AFTER UPDATE OF name, nif, rc, address, client_type, preferences ON clients
+        WHEN NEW.version = OLD.version AND NEW.updated_at IS OLD.updated_at BEGIN
+        UPDATE clients SET version = OLD.version + 1, updated_at = {_NOW} WHERE id = NEW.id;
+    END''')
+    conn.execute('''CREATE TRIGGER clients_sync_update AFTER UPDATE OF version ON clients BEGIN
+        INSERT INTO sync_log (entity, uid) VALUES ('client', NEW.uid);
+    END''')
+    # Documents are never edited once issued, only inserted
+    conn.execute(f'''CREATE TRIGGER documents_sync_insert AFTER INSERT ON documents BEGIN
+        UPDATE documents SET uid = {_NEW_UID} WHERE id = NEW.id AND uid IS NULL;
+        INSERT INTO sync_log (entity, uid) SELECT 'document', uid FROM documents WHERE id = NEW.id;
+    END''')
+
+
+def _migration_8_pdf_archive(conn):
+    # SHA-256 of the issued PDF, stored in the archive (see pdf_archive.py)
+    _add_column(conn, 'documents', 'pdf_hash', 'TEXT')
+
+
+# Schema migrations, applied in order.  The database's PRAGMA user_version
+# records how many have run; append new steps, never edit old ones.
+MIGRATIONS = [
+    _migration_1_base_schema,
+    _migration_2_indexes,
+    _migration_3_document_lines,
+    _migration_4_search,
+    _migration_5_numbering,
+    _migration_6_monthly_summary,
+    _migration_7_replication,
+    _migration_8_pdf_archive,
+]
+
+
+def schema_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn=None):
+    """Bring the database schema up to date.
+
+    Each pending migration runs in its own transaction together with the
+    ``user_version`` bump, so an interrupted upgrade resumes where it stopped.
+    """
+    conn = conn or get_connection()
+    version = schema_version(conn)
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            step(conn)
+            conn.execute(f'PRAGMA user_version={number}')
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return schema_version(conn)
+
+
+def fetch_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+
+def fetch_all(sql, params=()):
+    return get_connection().execute(sql, params).fetchall()
+
+
+def execute(sql, params=()):
+    """Execute a single write statement and return its cursor."""
+    return get_connection().execute(sql, params)
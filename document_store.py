@@ -0,0 +1,90 @@
+"""Reading and writing issued documents (header + product lines)."""
+import database
+
+TVA_RATE = 0.16
+
+# Automatic numbers: <prefix>-<year>-<sequence>, e.g. F-2026-0042
+NUMBER_PREFIXES = {'devis': 'D', 'facture': 'F'}
+
+
+def document_totals(lines):
+    """Return (HT, TVA, TTC) for (product, quantity, unit_price) lines."""
+    ht = sum(quantity * unit_price for _, quantity, unit_price in lines)
+    tva = ht * TVA_RATE
+    return ht, tva, ht + tva
+
+
+def format_number(doc_type, year, sequence):
+    return f"{NUMBER_PREFIXES[doc_type]}-{year}-{sequence:04d}"
+
+
+def year_of(date_str):
+    return int(date_str[:4])
+
+
+def allocate_number(conn, doc_type, year):
+    """Take the next number of ``doc_type`` for ``year``.
+
+    Must run inside the write transaction that inserts the document, so the
+    number is only consumed if the insert commits.  Numbers already taken by
+    hand are skipped.
+    """
+    while True:
+        conn.execute(
+            '''INSERT INTO document_sequences (doc_type, year, last_number) VALUES (?, ?, 1)
+               ON CONFLICT (doc_type, year) DO UPDATE SET last_number = last_number + 1''',
+            (doc_type, year))
+        sequence = conn.execute(
+            'SELECT last_number FROM document_sequences WHERE doc_type=? AND year=?',
+            (doc_type, year)).fetchone()[0]
+        doc_number = format_number(doc_type, year, sequence)
+        if not conn.execute('SELECT 1 FROM documents WHERE number=? AND type=?',
+                            (doc_number, doc_type)).fetchone():
+            return doc_number
+
+
+def insert_rows(conn, client_id, doc_type, doc_number, date_str, purchase_order, lines, pdf_hash=None):
+    """Insert a document and its lines inside the caller's transaction;
+    return its id.
+
+    ``pdf_hash`` names the document's PDF in pdf_archive.
+    """
+    cur = conn.execute(
+        '''INSERT INTO documents (client_id, type, number, date, purchase_order, pdf_hash)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (client_id, doc_type, doc_number, date_str, purchase_order, pdf_hash))
+    document_id = cur.lastrowid
+    conn.executemany(
+        '''INSERT INTO document_lines (document_id, position, product, quantity, unit_price)
+           VALUES (?, ?, ?, ?, ?)''',
+        [(document_id, position, product, quantity, unit_price)
+         for position, (product, quantity, unit_price) in enumerate(lines, start=1)])
+    return document_id
+
+
+def peek_numbers(doc_type, date_str, count):
+    """The ``count`` numbers the next documents of this type and year would
+    most likely get.  Nothing is reserved: another desk may issue them first.
+    """
+    year = year_of(date_str)
+    row = database.fetch_one(
+        'SELECT last_number FROM document_sequences WHERE doc_type=? AND year=?', (doc_type, year))
+    sequence = row[0] if row else 0
+    numbers = []
+    while len(numbers) < count:
+        sequence += 1
+        doc_number = format_number(doc_type, year, sequence)
+        if not document_exists(doc_type, doc_number):
+            numbers.append(doc_number)
+    return numbers
+
+
+def peek_number(doc_type, date_str):
+    """The number the next automatic document (issue_pipeline.issue) would
+    most likely get."""
+    return peek_numbers(doc_type, date_str, 1)[0]
+
+
+def document_exists(doc_type, doc_number):
+    return database.fetch_one(
+        'SELECT 1 FROM documents WHERE number=? AND type=?', (doc_number, doc_type)) is not None
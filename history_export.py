@@ -0,0 +1,108 @@
+"""Export the history to .xlsx or .csv.
+
+Rows are streamed from a database cursor a chunk at a time and written out as
+they are read (openpyxl's write-only mode for Excel), so memory use does not
+grow with the size of the history.  Quantities, prices and amounts are
+written as numbers and dates as dates, not as the strings shown in the tree.
+"""
+import csv
+from datetime import date
+
+import history_query
+from document_store import TVA_RATE
+
+CHUNK_SIZE = 1000
+COLUMNS = history_query.COLUMNS + ("Total HT", "TVA", "Total TTC")
+MONEY_FORMAT = '#,##0.00'
+# Unit price, Total HT, TVA and Total TTC
+MONEY_COLUMNS = {5, 8, 9, 10}
+COLUMN_WIDTHS = (28, 10, 14, 24, 10, 14, 12, 18, 14, 14, 14)
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def iter_export_rows(flt, chunk_size=CHUNK_SIZE):
+    """Yield the export rows matching ``flt``: the history columns with the
+    date parsed, followed by the line's HT, TVA and TTC."""
+    cursor = history_query.open_cursor(flt)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            for row in rows:
+                client, doc_type, number, product, quantity, unit_price, date_str, purchase_order = row[:8]
+                ht = (quantity or 0) * (unit_price or 0)
+                tva = ht * TVA_RATE
+                yield (client, doc_type, number, product, quantity, unit_price,
+                       _parse_date(date_str), purchase_order, ht, tva, ht + tva)
+    finally:
+        cursor.close()
+
+
+def _csv_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float):
+        # Decimal comma, or French-locale Excel reads the amounts as text
+        return repr(value).replace('.', ',')
+    return value
+
+
+def write_csv(rows, path):
+    # utf-8-sig, ';' and decimal commas so Excel opens the file correctly in
+    # a French locale
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(_csv_value(value) for value in row)
+            count += 1
+    return count
+
+
+def write_xlsx(rows, path):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Historique")
+    for index, width in enumerate(COLUMN_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+    ws.freeze_panes = 'A2'
+    bold = Font(bold=True)
+    header = []
+    for title in COLUMNS:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = bold
+        header.append(cell)
+    ws.append(header)
+
+    count = 0
+    for row in rows:
+        row = list(row)
+        for index in MONEY_COLUMNS:
+            cell = WriteOnlyCell(ws, value=row[index])
+            cell.number_format = MONEY_FORMAT
+            row[index] = cell
+        ws.append(row)
+        count += 1
+    wb.save(path)
+    return count
+
+
+def export_history(flt, path):
+    """Write every history row matching ``flt`` to ``path`` (.csv or .xlsx);
+    return the number of rows written."""
+    rows = iter_export_rows(flt)
+    if path.lower().endswith('.csv'):
+        return write_csv(rows, path)
+    return write_xlsx(rows, path)
@@ -0,0 +1,207 @@
+"""Queries behind the history window.
+
+Rows are read a page at a time with keyset pagination: each page starts
+strictly after the (date, document id, line position) key of the previous
+page's last row, newest first, so reading page N costs the same as page 1.
+
+Results are cached per filter (see :func:`get_results`), so switching back
+to a filter that was shown recently does not query the database again.
+Anything that writes documents must call :func:`invalidate`.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+import database
+
+PAGE_SIZE = 200
+MAX_CACHED_PAGES = 8     # pages kept per filter
+MAX_CACHED_RESULTS = 16  # filters kept
+
+COLUMNS = ("Client", "Type", "Numéro", "Produit", "Quantité", "Prix Unitaire", "Date", "Bon de commande")
+
+_FROM = '''FROM documents
+    JOIN document_lines ON document_lines.document_id = documents.id
+    JOIN clients ON documents.client_id = clients.id'''
+_SELECT = '''SELECT clients.name, documents.type, documents.number, document_lines.product,
+           document_lines.quantity, document_lines.unit_price, documents.date, documents.purchase_order,
+           documents.id, document_lines.position
+    ''' + _FROM
+_ORDER = ' ORDER BY documents.date DESC, documents.id DESC, document_lines.position'
+# The redundant ``date <= ?`` gives the planner a range on the date indexes,
+# so it walks them in order instead of sorting every match.
+_AFTER = ''' AND documents.date <= ? AND (documents.date < ? OR (documents.date = ?
+              AND (documents.id < ? OR (documents.id = ? AND document_lines.position > ?))))'''
+
+
+class HistoryFilter(namedtuple('HistoryFilter', 'client doc_type date_from date_to amount_min amount_max search')):
+    """Filter values from the history window; empty strings and None mean "any".
+
+    Dates are compared as text, so a partial "to" date (``2024-03``) includes
+    the whole month.  Amounts bound the document's HT total.
+    """
+
+    def where(self):
+        sql = ' WHERE 1=1'
+        params = []
+        if self.client:
+            sql += ' AND clients.name = ?'
+            params.append(self.client)
+        if self.doc_type:
+            sql += ' AND documents.type = ?'
+            params.append(self.doc_type)
+        if self.date_from:
+            sql += ' AND documents.date >= ?'
+            params.append(self.date_from)
+        if self.date_to:
+            sql += ' AND documents.date <= ?'
+            params.append(self.date_to + '\uffff')
+        if self.amount_min is not None:
+            sql += ' AND documents.total_ht >= ?'
+            params.append(self.amount_min)
+        if self.amount_max is not None:
+            sql += ' AND documents.total_ht <= ?'
+            params.append(self.amount_max)
+        match = match_expression(self.search)
+        if match:
+            sql += ' AND document_lines.id IN (SELECT rowid FROM history_search WHERE history_search MATCH ?)'
+            params.append(match)
+        return sql, params
+
+
+def match_expression(text):
+    """FTS5 query matching lines whose document, product or client contain
+    every word of ``text`` as a prefix; quotes keep user input from being read
+    as query syntax."""
+    terms = [term.replace('"', '') for term in (text or '').split()]
+    return ' '.join(f'"{term}"*' for term in terms if term)
+
+
+def row_key(row):
+    """Keyset position of a row returned by :func:`fetch_page`."""
+    return row[6], row[8], row[9]
+
+
+def _after(key):
+    if key is None:
+        return '', []
+    date, doc_id, position = key
+    return _AFTER, [date, date, date, doc_id, doc_id, position]
+
+
+def count_rows(flt):
+    where, params = flt.where()
+    return database.fetch_one('SELECT COUNT(*) ' + _FROM + where, params)[0]
+
+
+def fetch_page(flt, after=None, limit=PAGE_SIZE):
+    """Return up to ``limit`` rows following the key ``after``.
+
+    Each row holds the eight display columns followed by the document id and
+    line position.
+    """
+    where, params = flt.where()
+    seek, seek_params = _after(after)
+    return database.fetch_all(_SELECT + where + seek + _ORDER + ' LIMIT ?',
+                              params + seek_params + [limit])
+
+
+def skip_key(flt, after=None, count=PAGE_SIZE):
+    """Key of the ``count``-th row after ``after`` without reading the rows
+    in between, or None if there are fewer rows left."""
+    where, params = flt.where()
+    seek, seek_params = _after(after)
+    row = database.fetch_one(
+        'SELECT documents.date, documents.id, document_lines.position ' + _FROM
+        + where + seek + _ORDER + ' LIMIT 1 OFFSET ?',
+        params + seek_params + [count - 1])
+    return tuple(row) if row else None
+
+
+def open_cursor(flt):
+    """Cursor over every matching row, in display order, for streaming reads
+    with ``fetchmany``."""
+    where, params = flt.where()
+    return database.get_connection().execute(_SELECT + where + _ORDER, params)
+
+
+def document_ids(flt):
+    """Ids of the documents with at least one matching line, newest first."""
+    where, params = flt.where()
+    return [row[0] for row in database.fetch_all(
+        'SELECT DISTINCT documents.id ' + _FROM + where + ' ORDER BY documents.date DESC, documents.id DESC',
+        params)]
+
+
+class HistoryResults:
+    """Rows matching one filter, read lazily a page at a time."""
+
+    def __init__(self, flt):
+        self.filter = flt
+        self.total = count_rows(flt)
+        self.stale = False
+        self._pages = OrderedDict()  # page number -> rows, least recently used first
+        self._page_starts = [None]   # keyset key each page starts after
+
+    def _page_start(self, page):
+        # Walk forward from the last known page start; a full cached page
+        # gives the next key for free, otherwise skip_key jumps over it.
+        while len(self._page_starts) <= page:
+            previous = len(self._page_starts) - 1
+            rows = self._pages.get(previous)
+            if rows is not None and len(rows) == PAGE_SIZE:
+                key = row_key(rows[-1])
+            else:
+                key = skip_key(self.filter, self._page_starts[-1])
+            if key is None:
+                break
+            self._page_starts.append(key)
+        return self._page_starts[min(page, len(self._page_starts) - 1)]
+
+    def page(self, page):
+        rows = self._pages.get(page)
+        if rows is None:
+            rows = fetch_page(self.filter, self._page_start(page))
+            self._pages[page] = rows
+            while len(self._pages) > MAX_CACHED_PAGES:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page)
+        return rows
+
+    def rows(self, start, count):
+        """Return ``count`` rows starting at index ``start``."""
+        rows = []
+        index = start
+        end = min(start + count, self.total)
+        while index < end:
+            page, pos = divmod(index, PAGE_SIZE)
+            chunk = self.page(page)[pos:pos + end - index]
+            if not chunk:
+                break
+            rows.extend(chunk)
+            index += len(chunk)
+        return rows
+
+
+_lock = threading.Lock()
+_results = OrderedDict()  # HistoryFilter -> HistoryResults, least recently used first
+
+
+def get_results(flt):
+    """Cached :class:`HistoryResults` for ``flt``."""
+    with _lock:
+        results = _results.pop(flt, None)
+        if results is None:
+            results = HistoryResults(flt)
+        _results[flt] = results
+        while len(_results) > MAX_CACHED_RESULTS:
+            _results.popitem(last=False)
+        return results
+
+
+def invalidate():
+    """Forget every cached result; call after documents are written."""
+    with _lock:
+        for results in _results.values():
+            results.stale = True
+        _results.clear()
@@ -0,0 +1,190 @@
+"""Issuing documents: the history row and the PDF file succeed or fail together.
+
+Each document is rendered to memory first (the slow part, done without
+holding the database lock), under the number it is expected to get.  One
+write transaction then allocates the real numbers, inserts the rows and
+writes the files; anything failing in there rolls the rows back, removes
+the files already written and puts back any file they replaced, so neither a
+history row without its PDF nor a PDF without its row is left behind.  A
+document whose number was taken by another desk in the meantime is rendered
+again under its new number, and a default file name follows it (see
+:func:`final_path`).
+
+Every issued PDF is also kept in pdf_archive for reprinting.  An archived
+PDF whose transaction rolls back is simply left unreferenced.
+
+Scripts issuing many documents pass them all to :func:`issue_many`, which
+commits them in a single transaction.
+"""
+import os
+from collections import defaultdict, namedtuple
+
+import database
+import history_query
+import pdf_archive
+import replica
+from document_store import insert_rows, peek_numbers, year_of
+from pdf_generator import document_filename, render_pdf
+
+
+class IssueRequest(namedtuple('IssueRequest', 'client doc_type doc_number date_str purchase_order lines path')):
+    """A document to issue.
+
+    ``client`` is a client_repository.Client, ``doc_number`` None for the
+    next automatic number and ``path`` where to write the PDF (None to only
+    record the document).
+    """
+
+
+IssuedDocument = namedtuple('IssuedDocument', 'document_id doc_number path')
+
+
+def render(request, doc_number):
+    """The PDF of ``request`` under ``doc_number``, as bytes."""
+    client = request.client
+    return render_pdf(client.name, client.nif, client.rc, client.address, client.preferences,
+                      request.doc_type, doc_number, request.purchase_order, request.lines,
+                      request.date_str)
+
+
+def expected_numbers(requests):
+    """The number each request should get if no other desk issues first."""
+    pending = defaultdict(list)
+    for index, request in enumerate(requests):
+        if request.doc_number is None:
+            pending[(request.doc_type, year_of(request.date_str))].append(index)
+    numbers = [request.doc_number for request in requests]
+    for (doc_type, _), indexes in pending.items():
+        date_str = requests[indexes[0]].date_str
+        for index, doc_number in zip(indexes, peek_numbers(doc_type, date_str, len(indexes))):
+            numbers[index] = doc_number
+    return numbers
+
+
+def stage(requests):
+    """Render every request in memory; return (request, number, pdf data)
+    triples for :func:`commit`."""
+    return [(request, doc_number, render(request, doc_number))
+            for request, doc_number in zip(requests, expected_numbers(requests))]
+
+
+def _write_file(path, data):
+    # Written next to the target and renamed, so a failure never leaves a
+    # truncated PDF under the final name.
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _move_aside(path):
+    """Rename an existing file at ``path`` out of the way; return where it
+    went, or None if there was nothing there."""
+    if not os.path.exists(path):
+        return None
+    backup_path = path + '.old'
+    os.replace(path, backup_path)
+    return backup_path
+
+
+def final_path(request, doc_number):
+    """Where to write the PDF of ``request`` issued as ``doc_number``.
+
+    The file name is usually picked before the number is allocated, from
+    the number peek_numbers guessed.  A name that still follows the default
+    pattern (pdf_generator.document_filename) is changed to the number
+    actually allocated; a name typed by hand is kept.
+    """
+    if not request.path or request.doc_number is not None:
+        return request.path
+    directory, name = os.path.split(request.path)
+    head, _, tail = document_filename(request.doc_type, request.client.name, '\0',
+                                      request.date_str).partition('\0')
+    if not (name.startswith(head) and name.endswith(tail) and len(name) > len(head) + len(tail)):
+        return request.path
+    return os.path.join(directory, head + doc_number + tail)
+
+
+def _commit(staged):
+    issued = []
+    written = []  # (path, staging path or None, moved-aside file or None)
+    superseded = []  # staging files of documents rendered again
+    try:
+        with database.transaction(immediate=True) as conn, replica.Numbering(conn) as numbering:
+            for request, doc_number, data in staged:
+                number = request.doc_number
+                if number is None:
+                    number = numbering.allocate(request.doc_type, year_of(request.date_str))
+                    if number != doc_number:
+                        if isinstance(data, str):
+                            superseded.append(data)
+                        data = render(request, number)
+                if isinstance(data, str):
+                    with open(data, 'rb') as f:
+                        pdf_hash = pdf_archive.store(f.read())
+                else:
+                    pdf_hash = pdf_archive.store(data)
+                document_id = insert_rows(conn, request.client.id, request.doc_type, number,
+                                          request.date_str, request.purchase_order, request.lines,
+                                          pdf_hash)
+                path = final_path(request, number)
+                if path:
+                    # A file being overwritten is kept until the commit
+                    written.append((path, data if isinstance(data, str) else None, _move_aside(path)))
+                    if isinstance(data, str):
+                        os.replace(data, path)
+                    else:
+                        _write_file(path, data)
+                issued.append(IssuedDocument(document_id, number, path))
+    except BaseException:
+        # Staging files go back where they were, so a retry can use them,
+        # and overwritten files are restored
+        for path, staging_path, backup_path in reversed(written):
+            try:
+                if staging_path:
+                    os.replace(path, staging_path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+            if backup_path:
+                try:
+                    os.replace(backup_path, path)
+                except OSError:
+                    pass
+        raise
+    for path in [backup_path for _, _, backup_path in written if backup_path] + superseded:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return issued
+
+
+def commit(staged):
+    """Record and write staged documents in one transaction; return an
+    :class:`IssuedDocument` per document.
+
+    ``staged`` holds (request, expected number, data) triples where data is
+    the PDF as bytes or the path of a staging file holding it, which is
+    renamed to ``request.path``.  Large batches stage to files so they do not
+    have to be held in memory.
+
+    Raises sqlite3.IntegrityError if a number given by hand is already used,
+    OSError if a file cannot be written, or replica.ShareUnavailable if an
+    automatic number is needed in replica mode while the share cannot be
+    reached; nothing is kept in any case.
+    """
+    issued = database.retry_on_busy(_commit, staged)
+    history_query.invalidate()
+    return issued
+
+
+def issue(request):
+    """Issue a single document; return its :class:`IssuedDocument`."""
+    return commit(stage([request]))[0]
+
+
+def issue_many(requests):
+    """Issue every request in a single transaction: all of them or none."""
+    return commit(stage(requests))
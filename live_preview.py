@@ -0,0 +1,164 @@
+"""Docked preview of the document being edited, updated as it is typed.
+
+Rasterizing a PDF through Poppler is the slow part of a preview, so it only
+happens for the *frame*: the document's last page with the last line's
+numbers and the totals left blank (``render_pdf(blank_values=True)``).
+Frames are rendered in the background and cached per layout (client,
+document fields, lines).  A keystroke in the quantity or price then only
+repaints the regions listed by ``pdf_generator.live_values`` over the cached
+frame, which takes a few milliseconds.
+"""
+import json
+import os
+import tkinter as tk
+from collections import OrderedDict
+from functools import lru_cache
+from tkinter import ttk
+
+from PIL import ImageDraw, ImageFont, ImageTk
+
+from pdf_generator import HEIGHT, live_values, paginate, render_pdf
+from render_worker import RenderExecutor, RenderQueueFull
+
+LIVE_DPI = 54
+SCALE = LIVE_DPI / 72
+UPDATE_DELAY = 30  # ms after the last change before repainting
+MAX_FRAMES = 4     # rasterized frames kept
+FONT_SIZE = 10     # points, as in the PDF
+# Helvetica stand-ins: Arial on Windows, else the Vera fonts ReportLab ships
+FONT_FILES = {
+    False: ('arial.ttf', 'Vera.ttf'),
+    True: ('arialbd.ttf', 'VeraBd.ttf'),
+}
+
+
+@lru_cache(maxsize=2)
+def load_font(bold):
+    import reportlab
+    fonts_dir = os.path.join(os.path.dirname(reportlab.__file__), 'fonts')
+    size = round(FONT_SIZE * SCALE)
+    for name in FONT_FILES[bold]:
+        for path in (name, os.path.join(fonts_dir, name)):
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                continue
+    return ImageFont.load_default()
+
+
+def frame_key(document):
+    """Everything a frame depends on: all render_pdf arguments except the
+    last line's numbers."""
+    client_name, nif, rc, address, preferences, doc_type, doc_number, purchase_order, lines, date_str = document
+    last_product = lines[-1][0] if lines else None
+    return (client_name, nif, rc, address, json.dumps(preferences, sort_keys=True, default=str),
+            doc_type, doc_number, purchase_order, tuple(lines[:-1]), last_product, date_str)
+
+
+def render_frame(document):
+    """Rasterize the last page of ``document`` with its live values blank."""
+    from pdf_viewer import rasterize_page
+    data = render_pdf(*document, blank_values=True)
+    return rasterize_page(data, len(paginate(document[8])) - 1, LIVE_DPI).convert('RGB')
+
+
+def to_pixels(box):
+    left, bottom, right, top = box
+    return (int(left * SCALE), int((HEIGHT - top) * SCALE),
+            int(right * SCALE) + 1, int((HEIGHT - bottom) * SCALE) + 1)
+
+
+class LivePreviewPane(ttk.LabelFrame):
+    def __init__(self, parent):
+        super().__init__(parent, text="Aperçu en direct")
+        # Frames are rendered on a worker thread; results come back through
+        # the main window's event loop.
+        self.renderer = RenderExecutor(parent.winfo_toplevel(), max_pending=2)
+        self.frames = OrderedDict()  # frame key -> PIL image, least recently used first
+        self.requested_key = None
+        self.document = None
+        self.shown_key = None        # key of the frame self.image was copied from
+        self.image = None
+        self.photo = None
+        self.update_job = None
+        self.image_label = ttk.Label(self)
+        self.image_label.pack(padx=5, pady=5)
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(self, textvariable=self.status_var, wraplength=int(595 * SCALE)).pack(anchor='w', padx=5, pady=(0, 5))
+        self.bind('<Destroy>', self.on_destroy)
+
+    def on_destroy(self, event):
+        if event.widget is self:
+            if self.update_job is not None:
+                self.after_cancel(self.update_job)
+                self.update_job = None
+            self.renderer.shutdown()
+            self.frames.clear()
+
+    def set_document(self, document):
+        """Show ``document`` (render_pdf arguments, or None when there is
+        nothing to show yet) once typing pauses for UPDATE_DELAY ms."""
+        self.document = document
+        if self.update_job is not None:
+            self.after_cancel(self.update_job)
+        self.update_job = self.after(UPDATE_DELAY, self.refresh)
+
+    def refresh(self):
+        self.update_job = None
+        document = self.document
+        if document is None:
+            self.status_var.set("Sélectionnez un client pour afficher l'aperçu.")
+            return
+        key = frame_key(document)
+        frame = self.frames.get(key)
+        if frame is None:
+            self.request_frame(key, document)
+            return
+        self.frames.move_to_end(key)
+        if key != self.shown_key:
+            self.image = frame.copy()
+            self.shown_key = key
+        self.paint_values(frame, document[8])
+
+    def request_frame(self, key, document):
+        if key == self.requested_key:
+            return
+        self.status_var.set("Mise à jour de l'aperçu...")
+        try:
+            # A newer layout supersedes one still waiting to be rendered
+            self.renderer.submit(
+                render_frame, document, key='frame',
+                on_done=lambda frame: self.frame_rendered(key, frame),
+                on_error=lambda e: self.frame_failed(key, e))
+        except RenderQueueFull:
+            return  # Requested again on the next change
+        self.requested_key = key
+
+    def frame_rendered(self, key, frame):
+        if key == self.requested_key:
+            self.requested_key = None
+        self.frames[key] = frame
+        while len(self.frames) > MAX_FRAMES:
+            self.frames.popitem(last=False)
+        self.status_var.set("")
+        self.refresh()
+
+    def frame_failed(self, key, e):
+        if key == self.requested_key:
+            self.requested_key = None
+        self.status_var.set(f"Aperçu indisponible : {e}")
+
+    def paint_values(self, frame, lines):
+        """Repaint only the cells and totals that change while typing."""
+        draw = ImageDraw.Draw(self.image)
+        for box, texts in live_values(lines):
+            pixels = to_pixels(box)
+            self.image.paste(frame.crop(pixels), pixels[:2])
+            for x, y, text, bold in texts:
+                draw.text((x * SCALE, (HEIGHT - y) * SCALE), text, font=load_font(bold),
+                          fill='black', anchor='rs')
+        if self.photo is None or (self.photo.width(), self.photo.height()) != self.image.size:
+            self.photo = ImageTk.PhotoImage(self.image)
+            self.image_label.configure(image=self.photo)
+        else:
+            self.photo.paste(self.image)
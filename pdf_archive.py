@@ -0,0 +1,84 @@
+"""Content-addressed archive of issued PDFs.
+
+Each PDF is stored once, zlib-compressed, under the SHA-256 of its bytes:
+``archive/ab/cd/abcd....pdf.z`` next to the database.  Documents record that
+hash in ``documents.pdf_hash``, so an old document can be reprinted exactly
+as it was issued, whatever the current layout, without rendering it again.
+Issuing identical bytes twice (create_pdf output is deterministic) stores
+nothing new.
+"""
+import hashlib
+import os
+import zlib
+
+import database
+
+ARCHIVE_DIR = 'archive'  # relative to the database's directory
+COMPRESSION_LEVEL = 6
+CHUNK_SIZE = 64 * 1024
+
+
+class ArchiveError(Exception):
+    """Raised when an archived PDF is missing or damaged."""
+
+
+def archive_root():
+    return os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), ARCHIVE_DIR)
+
+
+def blob_path(digest):
+    return os.path.join(archive_root(), digest[:2], digest[2:4], digest + '.pdf.z')
+
+
+def store(data):
+    """Archive the PDF ``data`` (bytes) if it is not there yet; return its hash."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Renamed into place, so a blob is either complete or absent
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(zlib.compress(data, COMPRESSION_LEVEL))
+        os.replace(temp_path, path)
+    return digest
+
+
+def iter_chunks(digest):
+    """Yield the archived PDF's bytes in chunks, decompressing as it reads.
+
+    The hash is checked once the last chunk has been read; ArchiveError is
+    raised if the blob is missing or does not match.
+    """
+    try:
+        f = open(blob_path(digest), 'rb')
+    except FileNotFoundError:
+        raise ArchiveError(f"PDF {digest[:12]} absent de l'archive") from None
+    hasher = hashlib.sha256()
+    decompressor = zlib.decompressobj()
+    with f:
+        try:
+            while True:
+                compressed = f.read(CHUNK_SIZE)
+                chunk = decompressor.decompress(compressed) if compressed else decompressor.flush()
+                if chunk:
+                    hasher.update(chunk)
+                    yield chunk
+                if not compressed:
+                    break
+        except zlib.error as e:
+            raise ArchiveError(f"PDF {digest[:12]} endommagé : {e}") from None
+    if hasher.hexdigest() != digest:
+        raise ArchiveError(f"PDF {digest[:12]} endommagé")
+
+
+def load(digest):
+    """The archived PDF as bytes."""
+    return b''.join(iter_chunks(digest))
+
+
+def document_pdf(document_id):
+    """Hash of the archived PDF of a document, or None if it was issued
+    before the archive existed."""
+    row = database.fetch_one('SELECT pdf_hash FROM documents WHERE id=?', (document_id,))
+    return row[0] if row else None
@@ -0,0 +1,108 @@
+"""Process-wide cache of the images drawn on every document.
+
+Embedding an image with ``canvas.drawImage`` decodes it, deflates and
+ASCII85-encodes the pixels for each new document, which dominates the cost
+of ``create_pdf``.  The logo and the payment QR code never change, so they
+are encoded once here and the ready-made image XObject is registered into
+each new document.
+"""
+import copy
+import os
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen.canvas import _digester
+
+# Distinct QR payloads kept encoded (one per IBAN today, per client later)
+QR_CACHE_SIZE = 32
+
+
+class PreparedImage:
+    """An image encoded once and embeddable into any number of documents."""
+
+    def __init__(self, reader, mask='auto'):
+        self.reader = reader
+        self.mask = mask
+        # Same signature canvas.drawImage computes, so it finds our object
+        rawdata = reader.getRGBData()
+        alpha = reader._dataA
+        if mask == 'auto' and alpha:
+            mdata = alpha.getRGBData()
+        else:
+            mdata = str(mask).encode('utf8')
+        self.name = _digester(rawdata + mdata)
+        self._xobject = pdfdoc.PDFImageXObject(self.name, reader, mask=mask)
+        self._xobject.name = self.name
+        self._smask = self._xobject.__dict__.pop('_smask', None)
+
+    @staticmethod
+    def _fresh(obj):
+        # Shallow copy: the encoded stream is shared, but each document
+        # registers its own object.
+        clone = copy.copy(obj)
+        clone.__dict__.pop(pdfdoc.__InternalName__, None)
+        clone.__dict__.pop('smask', None)
+        return clone
+
+    def register(self, canv):
+        doc = canv._doc
+        reg_name = doc.getXObjectName(self.name)
+        if reg_name in doc.idToObject:
+            return
+        img = self._fresh(self._xobject)
+        canv._setXObjects(img)
+        doc.Reference(img, reg_name)
+        doc.addForm(self.name, img)
+        if self._smask is not None:
+            mask_name = doc.getXObjectName(self._smask.name)
+            if mask_name in doc.idToObject:
+                img.smask = pdfdoc.PDFObjectReference(mask_name)
+            else:
+                smask = self._fresh(self._smask)
+                canv._setXObjects(smask)
+                img.smask = doc.Reference(smask, mask_name)
+
+    def draw(self, canv, x, y, width, height):
+        self.register(canv)
+        canv.drawImage(self.reader, x, y, width=width, height=height,
+                       mask=self.mask)
+
+
+@lru_cache(maxsize=8)
+def _load_image(path, mtime):
+    return PreparedImage(ImageReader(path))
+
+
+def get_image(path):
+    """Return the prepared image for ``path``, or None if it does not exist.
+
+    The file's modification time is part of the key, so replacing the logo
+    on disk is picked up without restarting.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    return _load_image(path, mtime)
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def get_qr_code(payload):
+    """Return the prepared QR code image encoding ``payload``."""
+    import qrcode
+    qr = qrcode.QRCode(box_size=2, border=1)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = BytesIO()
+    img.save(buf, format='PNG')
+    buf.seek(0)
+    return PreparedImage(ImageReader(buf))
+
+
+def clear():
+    """Forget every cached image."""
+    _load_image.cache_clear()
+    get_qr_code.cache_clear()
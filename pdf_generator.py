@@ -0,0 +1,360 @@
+"""PDF rendering for quotations and invoices.
+
+Most of the page is identical on every document: letterhead, title bar,
+table header, totals labels and the payment block.  That static layout is
+drawn once into cached :class:`Stamp` objects, and each document only draws
+its own fields on top of them.  Product lines flow over as many A4 pages as
+needed, each page repeating the letterhead and table header.
+"""
+import os
+import threading
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfgen import canvas
+
+import pdf_assets
+from branding import BANK_INFO, COMPANY_INFO, IBAN, LOGO_PATH
+from document_store import document_totals
+
+# Page geometry shared by the letterhead and the per-document fields
+WIDTH, HEIGHT = A4
+MARGIN = 36
+SECTION_GAP = 18
+
+LOGO_X = MARGIN
+LOGO_Y = HEIGHT - MARGIN - 60
+LOGO_WIDTH = 120
+LOGO_HEIGHT = 60
+
+BAR_HEIGHT = 36
+BAR_Y = HEIGHT - MARGIN - 10
+
+BOX_TOP = LOGO_Y - LOGO_HEIGHT - 35
+BOX_HEIGHT = 72
+BOX_WIDTH = WIDTH - 2 * MARGIN
+BOX_LEFT = MARGIN
+
+TABLE_Y = BOX_TOP - BOX_HEIGHT - SECTION_GAP
+COL_WIDTHS = [170, 90, 110, 110]
+COL_X = [BOX_LEFT + sum(COL_WIDTHS[:i]) for i in range(len(COL_WIDTHS))]
+TABLE_HEADERS = ["DÉSIGNATION", "Quantité (T)", "P.U. HT (MRU)", "MONTANT (MRU)"]
+HEADER_BG = colors.HexColor("#eaf1fb")
+ROW_HEIGHT = 22
+# Right edge of the text in the numeric columns
+QTY_X = COL_X[1] + COL_WIDTHS[1] - 10
+PRICE_X = COL_X[2] + COL_WIDTHS[2] - 10
+AMOUNT_X = COL_X[3] + COL_WIDTHS[3] - 10
+
+SUMMARY_WIDTH = 260
+SUMMARY_HEIGHT = 54
+SUMMARY_X = WIDTH - MARGIN - SUMMARY_WIDTH
+SUMMARY_VALUE_X = SUMMARY_X + SUMMARY_WIDTH - 16
+# Gap between the last table row and the bottom of the totals box, kept
+# generous so the totals don't crowd the lines
+SUMMARY_OFFSET = ROW_HEIGHT + SECTION_GAP + 40
+
+PAY_Y = MARGIN + 70
+# Lowest point the product table may reach (just above the payment block)
+TABLE_BOTTOM = PAY_Y + 60
+ROWS_PER_PAGE = int((TABLE_Y - ROW_HEIGHT - TABLE_BOTTOM) // ROW_HEIGHT)
+
+
+def draw_letterhead(c):
+    """Draw the parts of the page that do not depend on the document.
+
+    Returns the prepared images that were drawn.
+    """
+    images = []
+    logo = pdf_assets.get_image(LOGO_PATH)
+    if logo is not None:
+        logo.draw(c, LOGO_X, LOGO_Y, LOGO_WIDTH, LOGO_HEIGHT)
+        images.append(logo)
+    c.setFont("Helvetica", 10)
+    info_y = LOGO_Y - 18
+    for line in COMPANY_INFO:
+        c.drawString(LOGO_X, info_y, line)
+        info_y -= 13
+
+    c.setFillColorRGB(0.19, 0.44, 0.72)
+    c.roundRect(WIDTH - 260 - MARGIN, BAR_Y - BAR_HEIGHT, 250, BAR_HEIGHT, 8,
+                fill=1, stroke=0)
+    c.setFillColorRGB(0, 0, 0)
+
+    c.roundRect(BOX_LEFT, BOX_TOP - BOX_HEIGHT, BOX_WIDTH, BOX_HEIGHT, 7,
+                stroke=1, fill=0)
+
+    table_width = sum(COL_WIDTHS)
+    c.setFillColor(HEADER_BG)
+    c.rect(BOX_LEFT, TABLE_Y - ROW_HEIGHT, table_width, ROW_HEIGHT,
+           fill=1, stroke=0)
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica-Bold", 10)
+    for x, header in zip(COL_X, TABLE_HEADERS):
+        c.drawString(x + 8, TABLE_Y - ROW_HEIGHT + 7, header)
+    c.setLineWidth(0.5)
+    c.rect(BOX_LEFT, TABLE_Y - ROW_HEIGHT, table_width, ROW_HEIGHT,
+           stroke=1, fill=0)
+
+    try:
+        qr = pdf_assets.get_qr_code(IBAN)
+        qr.draw(c, WIDTH - MARGIN - 60, PAY_Y - 5, 52, 52)
+        images.append(qr)
+    except Exception:
+        pass
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(MARGIN, PAY_Y + 40, "Paiement par virement bancaire uniquement :")
+    c.setFont("Helvetica", 9)
+    line_y = PAY_Y + 28
+    for line in BANK_INFO:
+        c.drawString(MARGIN, line_y, line)
+        line_y -= 12
+    return images
+
+
+def draw_totals_box(c):
+    """Draw the totals frame and labels with its lower-left corner at 0,0."""
+    c.roundRect(0, 0, SUMMARY_WIDTH, SUMMARY_HEIGHT, 7, stroke=1, fill=0)
+    c.setFont("Helvetica", 10)
+    c.drawString(14, SUMMARY_HEIGHT - 16, "Montant HT :")
+    c.drawString(14, SUMMARY_HEIGHT - 32, "TVA (16%) :")
+    c.drawString(14, SUMMARY_HEIGHT - 48, "TTC :")
+    return []
+
+
+class Stamp:
+    """Static page content captured once and replayed into each document.
+
+    ``draw`` is run on a scratch canvas and its content-stream operators are
+    kept.  Stamping a page registers the same fonts and images and appends
+    those operators, wrapped in q/Q so the graphics state is back to the
+    canvas defaults afterwards.
+    """
+
+    def __init__(self, draw):
+        self._draw = draw
+        scratch = canvas.Canvas(BytesIO(), pagesize=A4)
+        self._images = draw(scratch)
+        try:
+            self._code = list(scratch._code)
+            self._fonts = list(scratch._doc.fontMapping.items())
+            self._forms = list(scratch._formsinuse)
+        except AttributeError:
+            # Canvas internals of an untested ReportLab version: draw the
+            # content again on every page instead.
+            self._code = None
+
+    def redraw(self, c, x=0, y=0):
+        c.saveState()
+        c.translate(x, y)
+        self._draw(c)
+        c.restoreState()
+
+    def stamp(self, c, x=0, y=0):
+        """Draw the content on the current page of ``c``, offset by x, y."""
+        if self._code is None:
+            self.redraw(c, x, y)
+            return
+        doc = c._doc
+        for psname, internal in self._fonts:
+            if doc.getInternalFontName(psname) != internal:
+                # Fonts already registered in a different order; the
+                # recorded operators would name the wrong fonts.
+                self.redraw(c, x, y)
+                return
+        for image in self._images:
+            image.register(c)
+        if self._forms:
+            c._formsinuse.extend(self._forms)
+            c._currentPageHasImages = 1
+        c._code.append('q')
+        if x or y:
+            c._code.append(f'1 0 0 1 {fp_str(x)} {fp_str(y)} cm')
+        c._code.extend(self._code)
+        c._code.append('Q')
+
+
+_letterhead = None
+_letterhead_key = None
+_letterhead_lock = threading.Lock()
+_totals_box = None
+
+
+def get_letterhead():
+    """Return the cached letterhead, rebuilding it if the branding changed."""
+    global _letterhead, _letterhead_key
+    try:
+        logo_mtime = os.path.getmtime(LOGO_PATH)
+    except OSError:
+        logo_mtime = None
+    key = (LOGO_PATH, logo_mtime, IBAN, tuple(COMPANY_INFO), tuple(BANK_INFO))
+    with _letterhead_lock:
+        if _letterhead is None or _letterhead_key != key:
+            _letterhead = Stamp(draw_letterhead)
+            _letterhead_key = key
+        return _letterhead
+
+
+def get_totals_box():
+    global _totals_box
+    with _letterhead_lock:
+        if _totals_box is None:
+            _totals_box = Stamp(draw_totals_box)
+        return _totals_box
+
+
+def document_filename(doc_type, client_name, doc_number, date_str):
+    """Default file name for a generated document."""
+    name = f"{doc_type}_{client_name}_{doc_number}_{date_str}.pdf"
+    for sep in ('/', '\\'):
+        name = name.replace(sep, '-')
+    return name
+
+
+def paginate(lines):
+    """Split lines into per-page chunks, leaving room for the totals box.
+
+    If the totals box does not fit under the last page's rows, an extra page
+    holding only the totals is added.
+    """
+    pages = [lines[i:i + ROWS_PER_PAGE] for i in range(0, len(lines), ROWS_PER_PAGE)] or [[]]
+    last_bottom = TABLE_Y - ROW_HEIGHT * (len(pages[-1]) + 1)
+    if last_bottom - SUMMARY_OFFSET < TABLE_BOTTOM:
+        pages.append([])
+    return pages
+
+
+def _draw_page_fields(c, page_number, page_count, client_name, nif, rc, address,
+                      doc_type, doc_number, purchase_order, date_str):
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(WIDTH - 250 - MARGIN, BAR_Y - BAR_HEIGHT + 22, doc_type.upper())
+    c.setFont("Helvetica-Bold", 11)
+    c.drawRightString(WIDTH - MARGIN - 18, BAR_Y - BAR_HEIGHT + 22,
+                      f"N° {doc_number}")
+    c.setFillColorRGB(0, 0, 0)
+    if page_count > 1:
+        c.setFont("Helvetica", 8)
+        c.drawRightString(WIDTH - MARGIN - 18, BAR_Y - BAR_HEIGHT - 12,
+                          f"Page {page_number} / {page_count}")
+
+    c.setFont("Helvetica", 10)
+    c.drawString(BOX_LEFT + 16, BOX_TOP - 18, f"Date : {date_str}")
+    c.drawString(BOX_LEFT + 16, BOX_TOP - 34, f"Client : {client_name}")
+    c.drawString(BOX_LEFT + 16, BOX_TOP - 50, f"Adresse : {address}")
+    c.drawString(BOX_LEFT + BOX_WIDTH / 2 + 16, BOX_TOP - 18, f"RC : {rc}")
+    c.drawString(BOX_LEFT + BOX_WIDTH / 2 + 16, BOX_TOP - 34, f"NIF : {nif}")
+    if purchase_order:
+        c.drawString(BOX_LEFT + BOX_WIDTH / 2 + 16, BOX_TOP - 50,
+                     f"Bon de commande : {purchase_order}")
+
+
+def _draw_rows(c, rows, blank_last=False):
+    """Draw product rows under the table header; return the table bottom.
+
+    With ``blank_last`` the numbers of the last row are left out.
+    """
+    table_right = BOX_LEFT + sum(COL_WIDTHS)
+    c.setFont("Helvetica", 10)
+    c.setLineWidth(0.5)
+    row_top = TABLE_Y - ROW_HEIGHT
+    for index, (product, quantity, unit_price) in enumerate(rows, start=1):
+        row_bottom = row_top - ROW_HEIGHT
+        text_y = row_bottom + 6
+        c.drawString(COL_X[0] + 8, text_y, product)
+        if not (blank_last and index == len(rows)):
+            c.drawRightString(QTY_X, text_y, f"{quantity:,.2f}")
+            c.drawRightString(PRICE_X, text_y, f"{unit_price:,.2f}")
+            c.drawRightString(AMOUNT_X, text_y, f"{quantity * unit_price:,.2f}")
+        c.line(BOX_LEFT, row_bottom, table_right, row_bottom)
+        row_top = row_bottom
+    if rows:
+        for x in COL_X + [table_right]:
+            c.line(x, TABLE_Y - ROW_HEIGHT, x, row_top)
+    return row_top
+
+
+def create_pdf(pdf_filename, client_name, nif, rc, address, client_preferences,
+               doc_type, doc_number, purchase_order, lines, date_str, blank_values=False):
+    """Generate a PDF with consistent layout.
+
+    ``lines`` is a sequence of (product, quantity, unit_price) tuples.  With
+    ``blank_values`` the regions listed by :func:`live_values` are left
+    empty (used by the live preview).
+    """
+    lines = list(lines)
+    ht, tva, ttc = document_totals(lines)
+    pages = paginate(lines)
+    letterhead = get_letterhead()
+
+    footer = ''
+    if client_preferences.get('afficher_pied', True):
+        footer = client_preferences.get('pied_page', '')
+
+    # invariant: no timestamps or random ids, so re-issuing a document gives
+    # the same bytes and the archive stores it once
+    c = canvas.Canvas(pdf_filename, pagesize=A4, invariant=True)
+    for page_number, rows in enumerate(pages, start=1):
+        if page_number > 1:
+            c.showPage()
+        letterhead.stamp(c)
+        _draw_page_fields(c, page_number, len(pages), client_name, nif, rc,
+                          address, doc_type, doc_number, purchase_order, date_str)
+        last_page = page_number == len(pages)
+        table_bottom = _draw_rows(c, rows, blank_last=blank_values and last_page)
+        if footer:
+            c.setStrokeColorRGB(0.7, 0.7, 0.7)
+            c.setLineWidth(0.5)
+            c.line(MARGIN, 35, WIDTH - MARGIN, 35)
+            c.setFont("Helvetica-Oblique", 9)
+            c.drawCentredString(WIDTH / 2, 25, footer)
+            c.setStrokeColorRGB(0, 0, 0)
+
+    summary_y = table_bottom - SUMMARY_OFFSET
+    get_totals_box().stamp(c, SUMMARY_X, summary_y)
+    if not blank_values:
+        c.setFont("Helvetica-Bold", 10)
+        for value, dy in zip((ht, tva, ttc), (16, 32, 48)):
+            c.drawRightString(SUMMARY_VALUE_X, summary_y + SUMMARY_HEIGHT - dy, f"{value:,.2f}")
+
+    c.save()
+
+
+def render_pdf(client_name, nif, rc, address, client_preferences,
+               doc_type, doc_number, purchase_order, lines, date_str, blank_values=False):
+    """Like :func:`create_pdf`, but return the PDF as bytes instead of
+    writing a file (used for previews)."""
+    buffer = BytesIO()
+    create_pdf(buffer, client_name, nif, rc, address, client_preferences,
+               doc_type, doc_number, purchase_order, lines, date_str, blank_values)
+    return buffer.getvalue()
+
+
+def live_values(lines):
+    """Regions of the last page that change while the last line is typed.
+
+    Returns ``[(box, texts)]`` in PDF points, where box is (left, bottom,
+    right, top) and texts are (right x, baseline y, text, bold): the last
+    line's quantity, unit price and amount cells, when that line is on the
+    last page, and the three totals values.
+    """
+    lines = list(lines)
+    pages = paginate(lines)
+    rows = pages[-1]
+    regions = []
+    row_top = TABLE_Y - ROW_HEIGHT - ROW_HEIGHT * max(len(rows) - 1, 0)
+    table_bottom = row_top - ROW_HEIGHT if rows else row_top
+    if rows:
+        _, quantity, unit_price = rows[-1]
+        for index, right_x, value in ((1, QTY_X, quantity), (2, PRICE_X, unit_price),
+                                      (3, AMOUNT_X, quantity * unit_price)):
+            box = (COL_X[index] + 1, table_bottom + 1, COL_X[index] + COL_WIDTHS[index] - 1, row_top - 1)
+            regions.append((box, [(right_x, table_bottom + 6, f"{value:,.2f}", False)]))
+    summary_y = table_bottom - SUMMARY_OFFSET
+    box = (SUMMARY_X + 90, summary_y + 2, SUMMARY_X + SUMMARY_WIDTH - 4, summary_y + SUMMARY_HEIGHT - 2)
+    texts = [(SUMMARY_VALUE_X, summary_y + SUMMARY_HEIGHT - dy, f"{value:,.2f}", True)
+             for value, dy in zip(document_totals(lines), (16, 32, 48))]
+    regions.append((box, texts))
+    return regions
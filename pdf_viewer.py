@@ -1,53 +1,91 @@
 import tkinter as tk
 from tkinter import Toplevel, Button, messagebox
+from collections import OrderedDict
+from functools import lru_cache
 from PIL import Image, ImageTk
-from pdf2image import convert_from_path
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 import os
 import sys
+from render_worker import RenderExecutor, RenderQueueFull
+
+# Pages are rasterized one at a time, on demand: a quick low-resolution
+# placeholder first, then the page at full resolution.
+PLACEHOLDER_DPI = 30
+PAGE_DPI = 120
+MAX_CACHED_PAGES = 6  # rendered images kept, placeholders included
+PREFETCH = 1          # neighbouring pages rendered ahead on each side
+# While the window is resized or zoomed, pages are scaled with a fast filter;
+# the LANCZOS version is drawn once nothing has changed for RESIZE_SETTLE_MS.
+RESIZE_SETTLE_MS = 150
+MAX_SCALED_IMAGES = 8  # LANCZOS-scaled bitmaps kept, keyed by page and size
+
+# Try to find poppler in common locations
+POPPLER_PATHS = [
+    r"C:\Program Files\poppler-23.11.0\Library\bin",  # Common Windows path
+    r"C:\Program Files\poppler\Library\bin",
+    r"C:\poppler\Library\bin",
+    r"C:\Program Files (x86)\poppler\Library\bin",
+    r"C:\Program Files\poppler-0.68.0\bin",  # Version might vary
+    r"C:\poppler-0.68.0\bin",
+    r"C:\poppler-23.11.0\Library\bin"  # Latest version as of now
+]
+
+
+@lru_cache(maxsize=1)
+def find_poppler_path():
+    """Directory holding the Poppler binaries, or None to use the PATH.
+
+    Looked up once per process rather than on every preview.
+    """
+    for path in POPPLER_PATHS:
+        if os.path.isdir(path):
+            return path
+    # If no known location exists, rely on Poppler being in PATH
+    return None
+
+
+def read_page_count(pdf_data):
+    return pdfinfo_from_bytes(pdf_data, poppler_path=find_poppler_path())["Pages"]
+
+
+def rasterize_page(pdf_data, page_num, dpi):
+    """Render a single page (0-based) of the PDF bytes to a PIL image."""
+    return convert_from_bytes(pdf_data, dpi=dpi, first_page=page_num + 1,
+                              last_page=page_num + 1, poppler_path=find_poppler_path())[0]
+
 
 class PDFPreviewWindow(Toplevel):
-    def __init__(self, parent, pdf_path, on_generate_callback=None):
+    def __init__(self, parent, pdf_data, on_generate_callback=None, filename=None):
         super().__init__(parent)
         self.title("Aperçu du PDF")
         self.geometry("500x650")
-        self.pdf_path = pdf_path
+        # The PDF stays in memory: pages are rasterized from these bytes.
+        # With on_generate_callback the button issues the previewed document
+        # through the application; without it (reprints of issued
+        # documents) it saves these bytes as they are.
+        self.pdf_data = pdf_data
+        self.filename = filename
         self.on_generate_callback = on_generate_callback
         self.images = []
         self.img_labels = []
         self.current_page = 0
-        self.pages = []
+        self.page_count = 0
+        self.rendered = OrderedDict()  # (page, dpi) -> PIL image, least recently used first
+        self.in_flight = set()         # (page, dpi) being rasterized
+        self.scaled = OrderedDict()    # (page, dpi, width, height) -> PhotoImage
+        self.refine_job = None
+        self.canvas_size = None
+        self.render_error = None
         try:
-            # Try to find poppler in common locations
-            poppler_paths = [
-                r"C:\Program Files\poppler-23.11.0\Library\bin",  # Common Windows path
-                r"C:\Program Files\poppler\Library\bin",
-                r"C:\poppler\Library\bin",
-                r"C:\Program Files (x86)\poppler\Library\bin",
-                r"C:\Program Files\poppler-0.68.0\bin",  # Version might vary
-                r"C:\poppler-0.68.0\bin",
-                r"C:\poppler-23.11.0\Library\bin"  # Latest version as of now
-            ]
-            
-            # Try each path until one works
-            for path in poppler_paths:
-                if os.path.exists(path):
-                    try:
-                        self.pages = convert_from_path(pdf_path, dpi=120, poppler_path=path)
-                        break
-                    except Exception:
-                        continue
-            else:
-                # If no path worked, try without specifying poppler_path (in case it's in PATH)
-                try:
-                    self.pages = convert_from_path(pdf_path, dpi=120)
-                except Exception as e:
-                    messagebox.showerror("Erreur", f"Impossible de lire le PDF. Assurez-vous que Poppler est installé.\n\nDétails: {e}")
-                    self.destroy()
-                    return
+            self.page_count = read_page_count(pdf_data)
         except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de lire le PDF : {e}")
+            messagebox.showerror("Erreur", f"Impossible de lire le PDF. Assurez-vous que Poppler est installé.\n\nDétails: {e}")
             self.destroy()
             return
+        # Rasterization runs on a worker thread; results come back through
+        # the parent's event loop, which outlives this window.
+        self.renderer = RenderExecutor(parent, max_pending=2 * PREFETCH + 2)
+        self.bind('<Destroy>', self.on_destroy)
         self.zoom = 1.0
         self.canvas = tk.Canvas(self, bg='gray')
         self.canvas.pack(fill='both', expand=True)
@@ -61,23 +99,104 @@ class PDFPreviewWindow(Toplevel):
         self.zoom_in_btn.pack(side='left', padx=5)
         self.zoom_out_btn = Button(self.btn_frame, text="Zoom -", command=self.zoom_out)
         self.zoom_out_btn.pack(side='left', padx=5)
-        self.gen_btn = Button(self.btn_frame, text="Générer ce PDF", command=self.generate_pdf)
+        self.gen_btn = Button(self.btn_frame, command=self.generate_pdf,
+                              text="Générer ce PDF" if on_generate_callback else "Enregistrer ce PDF")
         self.gen_btn.pack(side='right', padx=5)
-        self.bind('<Configure>', self.on_resize)
+        self.canvas.bind('<Configure>', self.on_resize)
         self.show_page(0)
 
+    def on_destroy(self, event):
+        if event.widget is self:
+            self.renderer.shutdown()
+            if self.refine_job is not None:
+                self.after_cancel(self.refine_job)
+                self.refine_job = None
+            self.rendered.clear()
+            self.scaled.clear()
+
+    def cached_image(self, page_num, dpi):
+        img = self.rendered.get((page_num, dpi))
+        if img is not None:
+            self.rendered.move_to_end((page_num, dpi))
+        return img
+
+    def request_page(self, page_num, dpi):
+        """Rasterize a page in the background unless it is cached or queued."""
+        key = (page_num, dpi)
+        if key in self.rendered or key in self.in_flight or not 0 <= page_num < self.page_count:
+            return
+        try:
+            self.renderer.submit(
+                rasterize_page, self.pdf_data, page_num, dpi,
+                on_done=lambda img: self.page_rendered(key, img),
+                on_error=lambda e: self.page_failed(key, e))
+        except RenderQueueFull:
+            return  # Requested again once a running page finishes
+        self.in_flight.add(key)
+
+    def page_rendered(self, key, img):
+        self.in_flight.discard(key)
+        if key[1] == PAGE_DPI:
+            self.rendered.pop((key[0], PLACEHOLDER_DPI), None)
+        self.rendered[key] = img
+        while len(self.rendered) > MAX_CACHED_PAGES:
+            self.rendered.popitem(last=False)
+        if key[0] == self.current_page:
+            self.refresh_image()
+        self.update_requests()
+
+    def page_failed(self, key, e):
+        self.in_flight.discard(key)
+        if self.render_error is None:
+            self.render_error = e
+            messagebox.showerror("Erreur", f"Impossible de lire le PDF : {e}", parent=self)
+
+    def update_requests(self):
+        # Current page first (placeholder, then full resolution), then its
+        # neighbours once it is sharp
+        if self.render_error is not None:
+            return
+        page = self.current_page
+        if self.cached_image(page, PAGE_DPI) is None:
+            if self.cached_image(page, PLACEHOLDER_DPI) is None and (page, PAGE_DPI) not in self.in_flight:
+                self.request_page(page, PLACEHOLDER_DPI)
+            self.request_page(page, PAGE_DPI)
+            return
+        for offset in range(1, PREFETCH + 1):
+            self.request_page(page + offset, PAGE_DPI)
+            self.request_page(page - offset, PAGE_DPI)
+
     def show_page(self, page_num):
-        if not self.pages:
+        if not self.page_count:
             return
         self.current_page = page_num
+        self.title(f"Aperçu du PDF - Page {page_num+1} / {self.page_count}")
+        self.refresh_image()
+        self.update_requests()
+
+    def refresh_image(self):
+        """Show the current page now, with a quick draft if its final
+        rendering is not cached, and refine it once things settle."""
+        if self.display_image(draft=True):
+            if self.refine_job is not None:
+                self.after_cancel(self.refine_job)
+            self.refine_job = self.after(RESIZE_SETTLE_MS, self.refine_image)
+
+    def refine_image(self):
+        self.refine_job = None
         self.display_image()
-        self.title(f"Aperçu du PDF - Page {page_num+1} / {len(self.pages)}")
 
-    def display_image(self):
-        if not hasattr(self, 'pages') or not self.pages or self.current_page >= len(self.pages):
-            return
-            
-        img = self.pages[self.current_page]
+    def display_image(self, draft=False):
+        """Draw the current page; return True if only a draft was drawn."""
+        # Best available rendering of the current page: full resolution, else
+        # the placeholder (scaled up), else nothing yet
+        dpi = PAGE_DPI
+        img = self.cached_image(self.current_page, PAGE_DPI)
+        if img is None:
+            dpi = PLACEHOLDER_DPI
+            img = self.cached_image(self.current_page, PLACEHOLDER_DPI)
+        if img is None:
+            return False
         w, h = img.size
         
         # Get canvas dimensions with minimum size
@@ -86,51 +205,71 @@ class PDFPreviewWindow(Toplevel):
         
         # Calculate scale with safety checks
         if w <= 0 or h <= 0 or canvas_w <= 0 or canvas_h <= 0:
-            return
+            return False
             
         scale = min(canvas_w/w, canvas_h/h) * self.zoom
         new_w = max(1, int(w * scale))  # Ensure at least 1 pixel
         new_h = max(1, int(h * scale))  # Ensure at least 1 pixel
         
+        key = (self.current_page, dpi, new_w, new_h)
+        is_draft = False
         try:
-            img_resized = img.resize((new_w, new_h), Image.LANCZOS)
-            self.tk_img = ImageTk.PhotoImage(img_resized)
+            tk_img = self.scaled.get(key)
+            if tk_img is not None:
+                self.scaled.move_to_end(key)
+            elif draft:
+                tk_img = ImageTk.PhotoImage(img.resize((new_w, new_h), Image.NEAREST))
+                is_draft = True
+            else:
+                tk_img = ImageTk.PhotoImage(img.resize((new_w, new_h), Image.LANCZOS))
+                self.scaled[key] = tk_img
+                while len(self.scaled) > MAX_SCALED_IMAGES:
+                    self.scaled.popitem(last=False)
+            self.tk_img = tk_img
             self.canvas.delete('all')
             self.canvas.create_image((canvas_w-new_w)//2, (canvas_h-new_h)//2, anchor='nw', image=self.tk_img)
             self.canvas.config(scrollregion=self.canvas.bbox('all'))
         except Exception as e:
             print(f"Error displaying image: {e}")
+        return is_draft
 
     def on_resize(self, event):
-        self.display_image()
+        # <Configure> also fires when the window only moves
+        size = (event.width, event.height)
+        if size != self.canvas_size:
+            self.canvas_size = size
+            self.refresh_image()
 
+    # Zoom is rounded so zooming in then out lands on the same size, and the
+    # cached bitmap, as before
     def zoom_in(self):
-        self.zoom *= 1.2
-        self.display_image()
+        self.zoom = round(self.zoom * 1.2, 4)
+        self.refresh_image()
 
     def zoom_out(self):
-        self.zoom /= 1.2
-        self.display_image()
+        self.zoom = round(self.zoom / 1.2, 4)
+        self.refresh_image()
 
     def show_prev_page(self):
         if self.current_page > 0:
-            self.current_page -= 1
-            self.display_image()
-            self.title(f"Aperçu du PDF - Page {self.current_page+1} / {len(self.pages)}")
+            self.show_page(self.current_page - 1)
 
     def show_next_page(self):
-        if self.current_page < len(self.pages) - 1:
-            self.current_page += 1
-            self.display_image()
-            self.title(f"Aperçu du PDF - Page {self.current_page+1} / {len(self.pages)}")
+        if self.current_page < self.page_count - 1:
+            self.show_page(self.current_page + 1)
 
     def generate_pdf(self):
         from tkinter import filedialog, messagebox
-        import shutil
-        dest = filedialog.asksaveasfilename(defaultextension='.pdf', filetypes=[('PDF files', '*.pdf')], title='Enregistrer le PDF')
+        if self.on_generate_callback is not None:
+            self.destroy()
+            self.on_generate_callback()
+            return
+        dest = filedialog.asksaveasfilename(defaultextension='.pdf', filetypes=[('PDF files', '*.pdf')],
+                                            initialfile=self.filename, title='Enregistrer le PDF')
         if dest:
             try:
-                shutil.copy(self.pdf_path, dest)
+                with open(dest, 'wb') as f:
+                    f.write(self.pdf_data)
                 messagebox.showinfo('Succès', 'PDF enregistré avec succès.')
             except Exception as e:
                 messagebox.showerror('Erreur', f'Impossible d\'enregistrer le PDF : {e}')
@@ -1,223 +1,66 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 import os
-import json
 import sys
+import multiprocessing
+import threading
 from datetime import datetime
 from PIL import Image, ImageTk  # Added for logo support
 from tkinter import filedialog
-import pandas as pd  # For Excel export
-from pdf_viewer import PDFPreviewWindow
+# ReportLab (pdf_generator), pdf2image (pdf_viewer), pandas and openpyxl are
+# slow to import and only needed once a document is generated, previewed or
+# exported: they are imported where used and warmed up in the background
+# once the main window is shown (see warm_up_imports).
+import analytics
+import database
+import history_export
+import history_query
+import replica
+from branding import LOGO_PATH
+from client_picker import ClientPicker
+from client_repository import get_repository
+from document_store import document_exists, document_totals, peek_number
+from render_worker import RenderExecutor, RenderQueueFull
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 
-# Path to the SQLite database and logo image
-DB_PATH = 'clients.db'
-LOGO_PATH = 'MAFCI.png'  # Place your company logo here
+
+# Modules imported in the background after the first frame is painted
+WARM_UP_MODULES = ('pdf_generator', 'pdf_viewer')
 
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Ensure client_type exists for backward compat
-    c.execute('''CREATE TABLE IF NOT EXISTS clients (
-        id INTEGER PRIMARY KEY,
-        name TEXT UNIQUE,
-        nif TEXT,
-        rc TEXT,
-        address TEXT,
-        client_type TEXT
-    )''')
-    try:
-        c.execute('ALTER TABLE clients ADD COLUMN client_type TEXT')
-    except sqlite3.OperationalError:
-        pass
-    # Create quotations table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS quotations (
-            id INTEGER PRIMARY KEY,
-            client_id INTEGER,
-            type TEXT,
-            number TEXT,
-            product TEXT,
-            quantity REAL,
-            unit_price REAL,
-            date TEXT,
-            purchase_order TEXT,
-            FOREIGN KEY(client_id) REFERENCES clients(id)
-        )
-    ''')
+    """Open and migrate the database; show the error and return False if
+    that fails."""
+    # In replica mode the application works on a local copy of the shared
+    # database, kept in sync by a ReplicaSync thread.
     try:
-        c.execute('ALTER TABLE quotations ADD COLUMN purchase_order TEXT')
-    except sqlite3.OperationalError:
-        pass
-    conn.commit()
-    conn.close()
-
-
-def create_pdf(pdf_filename, client_name, nif, rc, address, client_preferences,
-               doc_type, doc_number, purchase_order, product, quantity,
-               unit_price, date_str):
-    """Generate a PDF with consistent layout."""
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.utils import ImageReader
-    from reportlab.lib import colors
-
-    c = canvas.Canvas(pdf_filename, pagesize=A4)
-    width, height = A4
-    margin = 36
-    section_gap = 18
-
-    logo_x = margin
-    logo_y = height - margin - 60
-    logo_width = 120
-    logo_height = 60
-    company_info = [
-        "Société Mauritano-Française des ciments",
-        "Tel:+222 45 29 85 56 / mob:+222 45 29 48 17",
-        "Email : info@mafci.mr",
-        "Route de Rosso, Zone Port, Nouakchott-Mauritanie",
-        "Capital: 431.000.000 MRU",
-        "RC: 200721 / NIF: 30400224",
-    ]
-    if os.path.exists(LOGO_PATH):
-        c.drawImage(ImageReader(LOGO_PATH), logo_x, logo_y, width=logo_width,
-                    height=logo_height, mask='auto')
-    c.setFont("Helvetica", 10)
-    info_y = logo_y - 18
-    for line in company_info:
-        c.drawString(logo_x, info_y, line)
-        info_y -= 13
-
-    bar_height = 36
-    bar_y = height - margin - 10
-    c.setFillColorRGB(0.19, 0.44, 0.72)
-    c.roundRect(width - 260 - margin, bar_y - bar_height, 250, bar_height, 8,
-                fill=1, stroke=0)
-    c.setFillColorRGB(1, 1, 1)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(width - 250 - margin, bar_y - bar_height + 22, doc_type.upper())
-    c.setFont("Helvetica-Bold", 11)
-    c.drawRightString(width - margin - 18, bar_y - bar_height + 22,
-                      f"N° {doc_number}")
-    c.setFillColorRGB(0, 0, 0)
-
-    box_top = logo_y - logo_height - 35
-    box_height = 72
-    box_width = width - 2 * margin
-    box_left = margin
-    c.roundRect(box_left, box_top - box_height, box_width, box_height, 7,
-                stroke=1, fill=0)
-    c.setFont("Helvetica", 10)
-    c.drawString(box_left + 16, box_top - 18, f"Date : {date_str}")
-    c.drawString(box_left + 16, box_top - 34, f"Client : {client_name}")
-    c.drawString(box_left + 16, box_top - 50, f"Adresse : {address}")
-    c.drawString(box_left + box_width / 2 + 16, box_top - 18, f"RC : {rc}")
-    c.drawString(box_left + box_width / 2 + 16, box_top - 34, f"NIF : {nif}")
-    if purchase_order:
-        c.drawString(box_left + box_width / 2 + 16, box_top - 50,
-                     f"Bon de commande : {purchase_order}")
-
-    table_y = box_top - box_height - section_gap
-    col_widths = [170, 90, 110, 110]
-    x_positions = [
-        box_left,
-        box_left + col_widths[0],
-        box_left + col_widths[0] + col_widths[1],
-        box_left + col_widths[0] + col_widths[1] + col_widths[2],
-    ]
-    headers = ["DÉSIGNATION", "Quantité (T)", "P.U. HT (MRU)", "MONTANT (MRU)"]
-    header_bg = colors.HexColor("#eaf1fb")
-    row_height = 22
-    c.setFillColor(header_bg)
-    c.rect(box_left, table_y - row_height, sum(col_widths), row_height,
-           fill=1, stroke=0)
-    c.setFillColorRGB(0, 0, 0)
-    c.setFont("Helvetica-Bold", 10)
-    for i, header in enumerate(headers):
-        c.drawString(x_positions[i] + 8, table_y - row_height + 7, header)
-    c.setLineWidth(0.5)
-    c.rect(box_left, table_y - row_height, sum(col_widths), row_height,
-           stroke=1, fill=0)
-
-    c.setFont("Helvetica", 10)
-    c.drawString(x_positions[0] + 8, table_y - row_height * 2 + 6, product)
-    c.drawRightString(x_positions[1] + col_widths[1] - 10,
-                      table_y - row_height * 2 + 6, f"{quantity:,.2f}")
-    c.drawRightString(x_positions[2] + col_widths[2] - 10,
-                      table_y - row_height * 2 + 6, f"{unit_price:,.2f}")
-    montant = quantity * unit_price
-    c.drawRightString(x_positions[3] + col_widths[3] - 10,
-                      table_y - row_height * 2 + 6, f"{montant:,.2f}")
-    for i in range(5):
-        xpos = box_left + sum(col_widths[:i])
-        c.line(xpos, table_y - row_height, xpos, table_y - row_height * 3)
-    c.line(box_left, table_y - row_height * 2,
-           box_left + sum(col_widths), table_y - row_height * 2)
-    c.rect(box_left, table_y - row_height * 2, sum(col_widths), row_height,
-           stroke=1, fill=0)
-
-    # Move the totals box slightly lower so it doesn't crowd the client details
-    summary_y = table_y - row_height * 3 - section_gap - 40
-    summary_box_width = 260
-    summary_box_height = 54
-    summary_x = width - margin - summary_box_width
-    c.roundRect(summary_x, summary_y, summary_box_width, summary_box_height, 7,
-                stroke=1, fill=0)
-    c.setFont("Helvetica", 10)
-    c.drawString(summary_x + 14, summary_y + summary_box_height - 16,
-                 "Montant HT :")
-    c.drawString(summary_x + 14, summary_y + summary_box_height - 32,
-                 "TVA (16%) :")
-    c.drawString(summary_x + 14, summary_y + summary_box_height - 48, "TTC :")
-    c.setFont("Helvetica-Bold", 10)
-    c.drawRightString(summary_x + summary_box_width - 16,
-                      summary_y + summary_box_height - 16, f"{montant:,.2f}")
-    tva = montant * 0.16
-    c.drawRightString(summary_x + summary_box_width - 16,
-                      summary_y + summary_box_height - 32, f"{tva:,.2f}")
-    c.drawRightString(summary_x + summary_box_width - 16,
-                      summary_y + summary_box_height - 48, f"{montant + tva:,.2f}")
-
-    pay_y = margin + 70
-    try:
-        import qrcode
-        from io import BytesIO
-        qr = qrcode.QRCode(box_size=2, border=1)
-        qr.add_data('MR130030000101006313901-73')
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        buf = BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        c.drawImage(ImageReader(buf), width - margin - 60, pay_y - 5,
-                    width=52, height=52)
-    except Exception:
-        pass
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(margin, pay_y + 40,
-                 "Paiement par virement bancaire uniquement :")
-    c.setFont("Helvetica", 9)
-    c.drawString(margin, pay_y + 28, "Banque : BAMIS")
-    c.drawString(margin, pay_y + 16, "Compte :  00001 01006313901-73")
-    c.drawString(margin, pay_y + 4, "IBAN : MR130030000101006313901-73")
-    c.drawString(margin, pay_y - 8, "Devise : MRU")
-
-    if client_preferences.get('afficher_pied', True):
-        pied = client_preferences.get('pied_page', '')
-        if pied:
-            c.setStrokeColorRGB(0.7, 0.7, 0.7)
-            c.setLineWidth(0.5)
-            c.line(margin, 35, width - margin, 35)
-            c.setFont("Helvetica-Oblique", 9)
-            c.drawCentredString(width / 2, 25, pied)
-
-    c.save()
+        if replica.SHARED_DB_PATH:
+            replica.open_replica()
+        database.migrate()
+    except (sqlite3.Error, OSError) as e:
+        if replica.SHARED_DB_PATH:
+            message = ("Impossible de préparer la copie locale de la base partagée. Vérifiez que le "
+                       f"serveur partagé est joignable puis relancez l'application.\n\n{e}")
+        else:
+            message = f"Impossible d'ouvrir la base de données : {e}"
+        messagebox.showerror("Erreur", message)
+        return False
+    return True
+
+
+def warm_up_imports():
+    """Import the modules needed by generation and preview on a daemon
+    thread, so the first click does not wait for them."""
+    def run():
+        import importlib
+        for name in WARM_UP_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass  # Reported properly when the feature is used
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
 
 
 class AddClientWindow(tb.Toplevel):
@@ -297,25 +140,18 @@ class AddClientWindow(tb.Toplevel):
         PreferencesWindow(self)
 
     def save_client(self):
-        import json
         name = self.name_entry.get().strip()
         nif = self.nif_entry.get().strip()
         rc = self.rc_entry.get().strip()
         addr = self.addr_entry.get().strip()
         client_type = self.client_type_var.get()
-        preferences = json.dumps(self.preferences)  # Save as JSON
         if not name:
             messagebox.showerror("Erreur", "Le nom du client est obligatoire")
             return
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         try:
-            c.execute('INSERT INTO clients (name, nif, rc, address, client_type, preferences) VALUES (?,?,?,?,?,?)',
-                      (name, nif, rc, addr, client_type, preferences))
-            conn.commit()
+            get_repository().add(name, nif, rc, addr, client_type, self.preferences)
         except sqlite3.IntegrityError:
             messagebox.showerror("Erreur", "Le client existe déjà")
-        conn.close()
         self.parent.refresh_clients()
         self.destroy()
 
@@ -328,9 +164,9 @@ class EditClientWindow(tb.Toplevel):
         # Select client
         tb.Label(self, text="Choisir le client à modifier :").grid(row=0, column=0, sticky='e')
         self.client_var = tk.StringVar()
-        self.client_dropdown = tb.Combobox(self, textvariable=self.client_var, state='readonly')
-        self.client_dropdown['values'] = self.parent.load_clients()
+        self.client_dropdown = ClientPicker(self, textvariable=self.client_var)
         self.client_dropdown.grid(row=0, column=1)
+        self.client_dropdown.bind('<<ComboboxSelected>>', lambda e: self.load_client())
         tb.Button(self, text="Charger", command=self.load_client, bootstyle="primary").grid(row=0, column=2)
         # Info fields
         tb.Label(self, text="Nom :").grid(row=1, column=0, sticky='e')
@@ -358,51 +194,38 @@ class EditClientWindow(tb.Toplevel):
         tb.Button(self, text="Enregistrer les modifications", command=self.save_client, bootstyle="success").grid(row=7, column=1, pady=10)
 
     def load_client(self):
-        import json
         name = self.client_var.get().strip()
         if not name:
             messagebox.showerror("Erreur", "Veuillez sélectionner un client")
             return
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('SELECT nif, rc, address, client_type, preferences FROM clients WHERE name=?', (name,))
-        row = c.fetchone()
-        conn.close()
-        if not row:
+        client = get_repository().get(name)
+        if not client:
             messagebox.showerror("Erreur", "Client non trouvé")
             return
-        nif, rc, addr, client_type, preferences = row
+        nif, rc, addr, client_type = client.nif, client.rc, client.address, client.client_type
         self.name_entry.delete(0, 'end'); self.name_entry.insert(0, name)
         self.nif_entry.delete(0, 'end'); self.nif_entry.insert(0, nif)
         self.rc_entry.delete(0, 'end'); self.rc_entry.insert(0, rc)
         self.addr_entry.delete(0, 'end'); self.addr_entry.insert(0, addr)
         self.client_type_var.set(client_type)
-        try:
-            self.preferences = json.loads(preferences) if preferences else {}
-        except Exception:
-            self.preferences = {}
+        self.preferences = dict(client.preferences)
 
     def open_preferences(self):
         PreferencesWindow(self)
 
     def save_client(self):
-        import json
         name = self.name_entry.get().strip()
         nif = self.nif_entry.get().strip()
         rc = self.rc_entry.get().strip()
         addr = self.addr_entry.get().strip()
         client_type = self.client_type_var.get()
-        preferences = json.dumps(self.preferences)  # Save as JSON
         if not name:
             messagebox.showerror("Erreur", "Le nom du client est obligatoire")
             return
         old_name = self.client_var.get().strip()
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('UPDATE clients SET name=?, nif=?, rc=?, address=?, client_type=?, preferences=? WHERE name=?',
-                  (name, nif, rc, addr, client_type, preferences, old_name))
-        conn.commit()
-        conn.close()
+        get_repository().update(old_name, name, nif, rc, addr, client_type, self.preferences)
+        # Cached history pages show the old name
+        history_query.invalidate()
         self.parent.refresh_clients()
         self.destroy()
 
@@ -500,25 +323,18 @@ class PreferencesWindow(tb.Toplevel):
         tk.Button(self, text="Enregistrer", command=self.save_client).grid(row=6, column=1, pady=10)
 
     def save_client(self):
-        import json
         name = self.name_entry.get().strip()
         nif = self.nif_entry.get().strip()
         rc = self.rc_entry.get().strip()
         addr = self.addr_entry.get().strip()
         client_type = self.client_type_var.get()
-        preferences = json.dumps(self.preferences)  # Save as JSON
         if not name:
             messagebox.showerror("Erreur", "Le nom du client est obligatoire")
             return
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         try:
-            c.execute('INSERT INTO clients (name, nif, rc, address, client_type, preferences) VALUES (?,?,?,?,?,?)',
-                      (name, nif, rc, addr, client_type, preferences))
-            conn.commit()
+            get_repository().add(name, nif, rc, addr, client_type, self.preferences)
         except sqlite3.IntegrityError:
             messagebox.showerror("Erreur", "Le client existe déjà")
-        conn.close()
         self.parent.refresh_clients()
         self.destroy()
 
@@ -527,105 +343,467 @@ class PreferencesWindow(tb.Toplevel):
 
 
 class HistoryWindow(tb.Toplevel):
+    # The Treeview only ever holds the rows currently on screen; the rows
+    # themselves come from history_query's per-filter result cache.
+    FILTER_DELAY = 250  # ms of inactivity before a filter change is applied
+    DEFAULT_ROW_HEIGHT = 20
+    HEADING_HEIGHT = 25
+
     def __init__(self, parent):
         super().__init__(parent)
         self.title("Historique des devis et factures")
-        self.geometry("900x400")
+        self.geometry("950x450")
         self.parent = parent
-        self.conn = sqlite3.connect(DB_PATH)
+        self.results = None
+        self._rendered_results = None
+        self._filter_job = None
 
         # Filters
         filter_frame = tb.Frame(self)
         filter_frame.pack(fill='x', padx=10, pady=5)
 
-        tb.Label(filter_frame, text="Client :").pack(side='left')
+        tb.Label(filter_frame, text="Recherche :").pack(side='left')
+        self.search_entry = tb.Entry(filter_frame, width=30)
+        self.search_entry.pack(side='left', padx=5)
+        self.bind_filter_entry(self.search_entry)
+
+        tb.Label(filter_frame, text="Client :").pack(side='left', padx=(10,0))
         self.client_var = tk.StringVar()
         self.client_dropdown = tb.Combobox(filter_frame, textvariable=self.client_var, state='readonly')
         self.client_dropdown.pack(side='left', padx=5)
         self.client_dropdown['values'] = self.get_clients()
-        self.client_dropdown.bind('<<ComboboxSelected>>', lambda e: self.refresh_tree())
+        self.client_dropdown.bind('<<ComboboxSelected>>', lambda e: self.schedule_refresh())
 
         tb.Label(filter_frame, text="Type :").pack(side='left', padx=(10,0))
         self.type_var = tk.StringVar()
-        self.type_dropdown = tb.Combobox(filter_frame, textvariable=self.type_var, state='readonly')
+        self.type_dropdown = tb.Combobox(filter_frame, textvariable=self.type_var, state='readonly', width=10)
         self.type_dropdown['values'] = ("", "devis", "facture")
         self.type_dropdown.pack(side='left', padx=5)
-        self.type_dropdown.bind('<<ComboboxSelected>>', lambda e: self.refresh_tree())
-
-        tb.Label(filter_frame, text="Date (AAAA-MM-JJ) :").pack(side='left', padx=(10,0))
-        self.date_entry = tb.Entry(filter_frame)
-        self.date_entry.pack(side='left', padx=5)
-        self.date_entry.bind('<Return>', lambda e: self.refresh_tree())
+        self.type_dropdown.bind('<<ComboboxSelected>>', lambda e: self.schedule_refresh())
 
         tb.Button(filter_frame, text="Réinitialiser", command=self.reset_filters, bootstyle="secondary").pack(side='left', padx=10)
 
-        # Treeview
-        columns = ("Client", "Type", "Numéro", "Produit", "Quantité", "Prix Unitaire", "Date", "Bon de commande")
-        self.tree = tb.Treeview(self, columns=columns, show='headings')
-        for col in columns:
+        range_frame = tb.Frame(self)
+        range_frame.pack(fill='x', padx=10, pady=(0,5))
+
+        tb.Label(range_frame, text="Du (AAAA-MM-JJ) :").pack(side='left')
+        self.date_from_entry = tb.Entry(range_frame, width=12)
+        self.date_from_entry.pack(side='left', padx=5)
+        tb.Label(range_frame, text="Au :").pack(side='left', padx=(10,0))
+        self.date_to_entry = tb.Entry(range_frame, width=12)
+        self.date_to_entry.pack(side='left', padx=5)
+
+        tb.Label(range_frame, text="Montant HT min :").pack(side='left', padx=(10,0))
+        self.amount_min_entry = tb.Entry(range_frame, width=12)
+        self.amount_min_entry.pack(side='left', padx=5)
+        tb.Label(range_frame, text="max :").pack(side='left', padx=(10,0))
+        self.amount_max_entry = tb.Entry(range_frame, width=12)
+        self.amount_max_entry.pack(side='left', padx=5)
+
+        for entry in (self.date_from_entry, self.date_to_entry, self.amount_min_entry, self.amount_max_entry):
+            self.bind_filter_entry(entry)
+
+        # Treeview with a scrollbar mapped onto the whole result set
+        table_frame = tb.Frame(self)
+        table_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        self.tree = tb.Treeview(table_frame, columns=history_query.COLUMNS, show='headings')
+        for col in history_query.COLUMNS:
             self.tree.heading(col, text=col)
             self.tree.column(col, width=100)
-        self.tree.pack(fill='both', expand=True, padx=10, pady=5)
-
-        # Export button
-        tb.Button(self, text="Exporter vers Excel", command=self.export_to_excel, bootstyle="success").pack(pady=5)
+        self.vbar = tb.Scrollbar(table_frame, orient='vertical', command=self.on_scroll)
+        self.vbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_by(3))
+        self.tree.bind('<Up>', self.on_key_up)
+        self.tree.bind('<Down>', self.on_key_down)
+        self.tree.bind('<Configure>', lambda e: self.render_window())
+
+        self.count_var = tk.StringVar(value="")
+        tb.Label(self, textvariable=self.count_var).pack(anchor='w', padx=10)
+
+        # Export and reprint buttons
+        button_frame = tb.Frame(self)
+        button_frame.pack(pady=5)
+        self.export_button = tb.Button(button_frame, text="Exporter vers Excel", command=self.export_to_excel, bootstyle="success")
+        self.export_button.pack(side='left', padx=5)
+        tb.Button(button_frame, text="Réimprimer", command=self.reprint, bootstyle="primary").pack(side='left', padx=5)
+        tb.Button(button_frame, text="Régénérer...", command=self.regenerate, bootstyle="secondary").pack(side='left', padx=5)
+        self.tree.bind('<Double-1>', lambda e: self.reprint())
+
+        # Documents generated while the window is open make its results stale
+        self.bind('<FocusIn>', self.on_focus_in)
 
         self.refresh_tree()
 
     def get_clients(self):
-        c = self.conn.cursor()
-        c.execute('SELECT name FROM clients')
-        return [r[0] for r in c.fetchall()]
-
-    def refresh_tree(self):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        c = self.conn.cursor()
-        query = '''SELECT clients.name, quotations.type, quotations.number, quotations.product, quotations.quantity, quotations.unit_price, quotations.date, quotations.purchase_order
-                   FROM quotations JOIN clients ON quotations.client_id = clients.id WHERE 1=1'''
-        params = []
-        if self.client_var.get():
-            query += ' AND clients.name = ?'
-            params.append(self.client_var.get())
-        if self.type_var.get():
-            query += ' AND quotations.type = ?'
-            params.append(self.type_var.get())
-        if self.date_entry.get():
-            query += ' AND quotations.date = ?'
-            params.append(self.date_entry.get())
-        c.execute(query, params)
-        for row in c.fetchall():
-            self.tree.insert('', 'end', values=row)
+        return get_repository().names()
+
+    def bind_filter_entry(self, entry):
+        entry.bind('<KeyRelease>', self.on_filter_key)
+        entry.bind('<Return>', lambda e: self.refresh_tree())
+
+    def read_amount(self, entry):
+        """Amount typed in ``entry``, or None; invalid input is flagged in red."""
+        text = entry.get().strip().replace('\u00a0', '').replace(' ', '').replace(',', '.')
+        try:
+            amount = float(text) if text else None
+        except ValueError:
+            entry.configure(bootstyle="danger")
+            return None
+        entry.configure(style="TEntry")
+        return amount
+
+    def current_filter(self):
+        return history_query.HistoryFilter(
+            self.client_var.get(), self.type_var.get(),
+            self.date_from_entry.get().strip(), self.date_to_entry.get().strip(),
+            self.read_amount(self.amount_min_entry), self.read_amount(self.amount_max_entry),
+            self.search_entry.get().strip())
+
+    def schedule_refresh(self):
+        """Apply the filters once the user has stopped changing them."""
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(self.FILTER_DELAY, self.refresh_tree)
+
+    def on_filter_key(self, event):
+        if event.keysym != 'Return':
+            self.schedule_refresh()
+
+    def on_focus_in(self, event):
+        if event.widget is self and self.results is not None and self.results.stale:
+            self.refresh_tree(keep_position=True)
+
+    def refresh_tree(self, keep_position=False):
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+            self._filter_job = None
+        flt = self.current_filter()
+        if self.results is not None and not self.results.stale and flt == self.results.filter:
+            return
+        self.results = history_query.get_results(flt)
+        self.count_var.set(f"{self.results.total} ligne(s)")
+        if not keep_position:
+            self.offset = 0
+        self.render_window()
+
+    def visible_rows(self):
+        try:
+            row_height = int(ttk.Style(self).lookup('Treeview', 'rowheight') or self.DEFAULT_ROW_HEIGHT)
+        except (ValueError, tk.TclError):
+            row_height = self.DEFAULT_ROW_HEIGHT
+        height = self.tree.winfo_height() - self.HEADING_HEIGHT
+        return max(1, height // row_height)
+
+    def render_window(self):
+        """Show the rows from self.offset that fit in the Treeview.
+
+        Only the rows that scrolled in or out are inserted or deleted; rows
+        still on screen keep their item (and selection).
+        """
+        if self.results is None:
+            return
+        total = self.results.total
+        visible = self.visible_rows()
+        self.offset = max(0, min(self.offset, total - visible))
+        rows = self.results.rows(self.offset, visible)
+        width = len(history_query.COLUMNS)
+        wanted = {f"{row[8]}:{row[9]}": row[:width] for row in rows}
+        stale = [iid for iid in self.tree.get_children() if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+        # Rows kept from another result set may have changed (e.g. a renamed client)
+        new_results = self.results is not self._rendered_results
+        self._rendered_results = self.results
+        for index, (iid, values) in enumerate(wanted.items()):
+            if not self.tree.exists(iid):
+                self.tree.insert('', index, iid=iid, values=values)
+                continue
+            if self.tree.index(iid) != index:
+                self.tree.move(iid, '', index)
+            if new_results:
+                self.tree.item(iid, values=values)
+        if total:
+            self.vbar.set(self.offset / total, (self.offset + len(rows)) / total)
+        else:
+            self.vbar.set(0, 1)
+        self.after_idle(self.prefetch)
+
+    def prefetch(self):
+        """Load the page after the visible window while the UI is idle."""
+        if self.results is None:
+            return
+        next_page = (self.offset + self.visible_rows()) // history_query.PAGE_SIZE + 1
+        if next_page * history_query.PAGE_SIZE < self.results.total:
+            self.results.page(next_page)
+
+    def scroll_by(self, rows):
+        self.offset += rows
+        self.render_window()
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.offset = int(float(amount) * self.results.total)
+            self.render_window()
+        elif unit == 'pages':
+            self.scroll_by(int(amount) * self.visible_rows())
+        else:
+            self.scroll_by(int(amount))
+
+    def on_mousewheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+        return 'break'
+
+    def on_key_up(self, event):
+        items = self.tree.get_children()
+        if items and self.tree.focus() == items[0] and self.offset > 0:
+            self.scroll_by(-1)
+            first = self.tree.get_children()[0]
+            self.tree.focus(first)
+            self.tree.selection_set(first)
+            return 'break'
+
+    def on_key_down(self, event):
+        items = self.tree.get_children()
+        if items and self.tree.focus() == items[-1]:
+            self.scroll_by(1)
+            last = self.tree.get_children()[-1]
+            self.tree.focus(last)
+            self.tree.selection_set(last)
+            return 'break'
 
     def reset_filters(self):
         self.client_var.set('')
         self.type_var.set('')
-        self.date_entry.delete(0, 'end')
+        for entry in (self.search_entry, self.date_from_entry, self.date_to_entry,
+                      self.amount_min_entry, self.amount_max_entry):
+            entry.delete(0, 'end')
         self.refresh_tree()
 
+    def reprint(self):
+        """Show the selected document's PDF exactly as it was issued, from
+        the archive."""
+        import pdf_archive
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showinfo("Info", "Sélectionnez un document à réimprimer.", parent=self)
+            return
+        document_id = int(selection[0].split(':')[0])
+        client_name, doc_type, doc_number = self.tree.item(selection[0], 'values')[:3]
+        digest = pdf_archive.document_pdf(document_id)
+        if digest is None:
+            messagebox.showinfo("Info", f"Le {doc_type} n° {doc_number} a été émis avant l'archivage des PDF.", parent=self)
+            return
+        try:
+            pdf_data = pdf_archive.load(digest)
+        except pdf_archive.ArchiveError as e:
+            messagebox.showerror("Erreur", f"Impossible de réimprimer le {doc_type} n° {doc_number} : {e}", parent=self)
+            return
+        from pdf_generator import document_filename
+        date_str = self.tree.item(selection[0], 'values')[6]
+        self.parent.show_preview(pdf_data, document_filename(doc_type, client_name, doc_number, date_str))
+
+    def regenerate(self):
+        """Render every document matching the filters again, with the
+        current layout, into a dated folder (see regenerate.py)."""
+        import regenerate
+        flt = self.current_filter()
+        count = len(history_query.document_ids(flt))
+        if not count:
+            messagebox.showinfo("Info", "Aucun document à régénérer.", parent=self)
+            return
+        output_root = filedialog.askdirectory(parent=self, title="Dossier de destination des documents régénérés")
+        if not output_root:
+            return
+        if not messagebox.askyesno("Confirmation", f"Régénérer {count} document(s) avec la mise en page actuelle ?\n"
+                                   "Les documents archivés ne sont pas modifiés.", parent=self):
+            return
+        job = regenerate.RegenerationJob(flt, output_root)
+        job.start()
+        RegenerationDialog(self, job)
+
     def export_to_excel(self):
-        # Export only the visible rows in the treeview
-        import pandas as pd
+        # Exports every row matching the filters, streamed from the database
+        # on the background worker.
         from tkinter import filedialog
         import os
-        rows = [self.tree.item(item)['values'] for item in self.tree.get_children()]
-        if not rows:
+        if not self.results.total:
             messagebox.showinfo("Info", "Aucune donnée à exporter.")
             return
-        cols = [self.tree.heading(col)['text'] for col in self.tree['columns']]
-        df = pd.DataFrame(rows, columns=cols)
         filename = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Fichiers Excel", "*.xlsx")],
+            filetypes=[("Fichiers Excel", "*.xlsx"), ("Fichiers CSV", "*.csv")],
             initialfile="historique_devis_factures.xlsx",
             title="Choisissez l'emplacement pour enregistrer le fichier Excel"
         )
         if not filename:
             return
-        df.to_excel(filename, index=False)
-        messagebox.showinfo("Succès", f"Historique exporté dans {os.path.basename(filename)}")
+
+        def on_done(count):
+            self.export_button.configure(state='normal')
+            messagebox.showinfo("Succès", f"{count} ligne(s) exportée(s) dans {os.path.basename(filename)}")
+
+        def on_error(e):
+            self.export_button.configure(state='normal')
+            messagebox.showerror("Erreur", f"Échec de l'export : {e}")
+
+        try:
+            self.parent.export_executor.submit(
+                history_export.export_history, self.results.filter, filename,
+                on_done=on_done, on_error=on_error)
+        except RenderQueueFull:
+            messagebox.showinfo("Info", "Un export ou un import est déjà en cours, veuillez patienter.")
+            return
+        self.export_button.configure(state='disabled')
+
+class RegenerationDialog(tb.Toplevel):
+    POLL_INTERVAL = 200  # ms
+
+    def __init__(self, parent, job):
+        super().__init__(parent)
+        self.job = job
+        self.title("Régénération des documents")
+        self.resizable(False, False)
+        self.transient(parent)
+
+        self.status_var = tk.StringVar(value="Préparation...")
+        tb.Label(self, textvariable=self.status_var).pack(anchor='w', padx=10, pady=(10, 5))
+        self.progressbar = tb.Progressbar(self, length=350, mode='determinate')
+        self.progressbar.pack(padx=10, pady=5)
+        self.cancel_button = tb.Button(self, text="Annuler", command=self.cancel, bootstyle="danger")
+        self.cancel_button.pack(pady=(5, 10))
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.poll()
+
+    @staticmethod
+    def format_eta(seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        return f"{minutes:02d}:{seconds:02d}"
+
+    def cancel(self):
+        if self.job.finished:
+            self.destroy()
+            return
+        self.job.cancel()
+        self.cancel_button.configure(state='disabled')
+        self.status_var.set("Annulation...")
+
+    def poll(self):
+        done, total, eta = self.job.progress()
+        if total:
+            self.progressbar.configure(maximum=total, value=done)
+        if self.job.finished:
+            self.finish()
+            return
+        if total is not None and not self.job.cancelled:
+            status = f"{done} / {total}"
+            if eta is not None:
+                status += f" — reste {self.format_eta(eta)}"
+            self.status_var.set(status)
+        self.after(self.POLL_INTERVAL, self.poll)
+
+    def finish(self):
+        job = self.job
+        self.cancel_button.configure(text="Fermer", state='normal', bootstyle="secondary")
+        if job.failure is not None:
+            self.status_var.set("Échec de la régénération")
+            messagebox.showerror("Erreur", f"Échec de la régénération : {job.failure}", parent=self)
+            return
+        written = job.done - len(job.errors)
+        status = f"{written} document(s) régénéré(s)"
+        if job.cancelled:
+            status += f" sur {job.total} (annulé)"
+        self.status_var.set(status)
+        message = f"{status} dans {job.output_dir}"
+        if job.errors:
+            failed = ", ".join(str(document_id) for document_id, _ in job.errors[:10])
+            message += f"\n{len(job.errors)} erreur(s), documents : {failed}"
+            messagebox.showwarning("Régénération", message, parent=self)
+        else:
+            messagebox.showinfo("Régénération", message, parent=self)
+
+class AnalyticsWindow(tb.Toplevel):
+    COLUMNS = ("Quantité", "Lignes", "Total HT", "TVA", "Total TTC")
+    DOC_TYPES = {"Factures": "facture", "Devis": "devis", "Tous": ""}
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Analyses des ventes")
+        self.geometry("850x450")
+
+        filter_frame = tb.Frame(self)
+        filter_frame.pack(fill='x', padx=10, pady=5)
+
+        tb.Label(filter_frame, text="Regrouper par :").pack(side='left')
+        self.grouping_var = tk.StringVar(value=analytics.GROUPINGS['client'][0])
+        self.grouping_keys = {title: key for key, (title, _) in analytics.GROUPINGS.items()}
+        grouping_dropdown = tb.Combobox(filter_frame, textvariable=self.grouping_var, state='readonly',
+                                        values=list(self.grouping_keys), width=15)
+        grouping_dropdown.pack(side='left', padx=5)
+        grouping_dropdown.bind('<<ComboboxSelected>>', lambda e: self.refresh())
+
+        tb.Label(filter_frame, text="Documents :").pack(side='left', padx=(10,0))
+        self.type_var = tk.StringVar(value="Factures")
+        type_dropdown = tb.Combobox(filter_frame, textvariable=self.type_var, state='readonly',
+                                    values=list(self.DOC_TYPES), width=10)
+        type_dropdown.pack(side='left', padx=5)
+        type_dropdown.bind('<<ComboboxSelected>>', lambda e: self.refresh())
+
+        tb.Label(filter_frame, text="Du (AAAA-MM) :").pack(side='left', padx=(10,0))
+        self.month_from_entry = tb.Entry(filter_frame, width=9)
+        self.month_from_entry.pack(side='left', padx=5)
+        tb.Label(filter_frame, text="Au :").pack(side='left', padx=(10,0))
+        self.month_to_entry = tb.Entry(filter_frame, width=9)
+        self.month_to_entry.pack(side='left', padx=5)
+        for entry in (self.month_from_entry, self.month_to_entry):
+            entry.bind('<Return>', lambda e: self.refresh())
+            entry.bind('<FocusOut>', lambda e: self.refresh())
+
+        table_frame = tb.Frame(self)
+        table_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        self.tree = tb.Treeview(table_frame, columns=("key",) + self.COLUMNS, show='headings')
+        for col in self.COLUMNS:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=110, anchor='e')
+        self.tree.column("key", width=200)
+        vbar = tb.Scrollbar(table_frame, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vbar.set)
+        vbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.tree.tag_configure('total', font=('Segoe UI', 10, 'bold'))
+
+        # Documents generated while the window is open are picked up when it
+        # is focused again
+        self.shown = None
+        self.bind('<FocusIn>', lambda e: self.refresh() if e.widget is self else None)
+
+        self.refresh()
+
+    def refresh(self):
+        grouping = self.grouping_keys[self.grouping_var.get()]
+        args = (grouping, self.DOC_TYPES[self.type_var.get()],
+                self.month_from_entry.get().strip(), self.month_to_entry.get().strip())
+        # The newest document id tells whether anything was issued since
+        shown = args + (analytics.last_document_id(),)
+        if shown == self.shown:
+            return
+        self.shown = shown
+        rows = analytics.summarize(*args)
+        self.tree.heading("key", text=analytics.GROUPINGS[grouping][0])
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            self.tree.insert('', 'end', values=self.format_row(row))
+        self.tree.insert('', 'end', values=self.format_row(analytics.grand_total(rows)), tags=('total',))
+
+    @staticmethod
+    def format_row(row):
+        return (row.key, f"{row.quantity:,.2f}", row.lines, f"{row.ht:,.2f}", f"{row.tva:,.2f}", f"{row.ttc:,.2f}")
 
 class QuotationApp(tb.Window):
+    SYNC_POLL_INTERVAL = 2000  # ms
+
     def __init__(self):
         super().__init__(themename="flatly")
         self.title("Générateur de Devis et Factures")
@@ -633,9 +811,23 @@ class QuotationApp(tb.Window):
             self.iconbitmap("MAFCI.ico")
         except Exception as e:
             print("Avertissement : Impossible de charger l'icône MAFCI.ico pour la fenêtre :", e)
-        self.geometry("800x600")
-        init_db()
+        self.geometry("800x760")
+        if not init_db():
+            self.destroy()
+            sys.exit(1)
+        self.replica_sync = None
+        if replica.SHARED_DB_PATH:
+            self.replica_sync = replica.ReplicaSync()
+            self.replica_sync.start()
+        self.render_executor = RenderExecutor(self)
+        # Exports and imports get their own worker so a long one never holds
+        # up document generation.
+        self.export_executor = RenderExecutor(self, max_pending=1)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.create_widgets()
+        self.after_idle(warm_up_imports)
+        if self.replica_sync is not None:
+            self.poll_replica_sync()
         self.ask_doc_type_and_number()
 
     def ask_doc_type_and_number(self):
@@ -646,7 +838,7 @@ class QuotationApp(tb.Window):
         # Create the dialog window
         dialog = tb.Toplevel(self)
         dialog.title("Choix du document")
-        dialog.geometry("400x250")  # Made it smaller since we don't need that much space
+        dialog.geometry("400x280")  # Made it smaller since we don't need that much space
         dialog.resizable(False, False)
         dialog.transient(self)
         
@@ -686,7 +878,9 @@ class QuotationApp(tb.Window):
         tb.Label(frm, text="Numéro du document :").pack(anchor='w', pady=(5, 2))
         self._doc_number_var = tk.StringVar()
         entry = tb.Entry(frm, textvariable=self._doc_number_var)
-        entry.pack(fill='x', pady=(0, 20))
+        entry.pack(fill='x', pady=(0, 2))
+        tb.Label(frm, text="Laisser vide pour une numérotation automatique.",
+                 bootstyle="secondary").pack(anchor='w', pady=(0, 10))
         
         # Set focus to the entry field
         entry.focus()
@@ -700,16 +894,20 @@ class QuotationApp(tb.Window):
                 messagebox.showerror("Erreur", "Veuillez sélectionner le type de document.", parent=dialog)
                 return
                 
-            if not doc_number:
-                messagebox.showerror("Erreur", "Veuillez saisir le numéro du document.", parent=dialog)
+            if doc_number and document_exists(doc_type, doc_number):
+                messagebox.showerror("Erreur", f"Le {doc_type} n° {doc_number} existe déjà.", parent=dialog)
                 return
                 
-            # If we get here, validation passed
+            # If we get here, validation passed.  No number means the next
+            # one is allocated when the document is generated.
             self.document_type = doc_type
-            self.document_number = doc_number
+            self.document_number = doc_number or None
             
             # Update header label with doc info
-            self.doc_info_var.set(f"{doc_type.capitalize()} n° {doc_number}")
+            if doc_number:
+                self.doc_info_var.set(f"{doc_type.capitalize()} n° {doc_number}")
+            else:
+                self.doc_info_var.set(f"{doc_type.capitalize()} (numérotation automatique)")
 
             # Clean up and close
             close_dialog()
@@ -744,7 +942,7 @@ class QuotationApp(tb.Window):
         self.attributes('-disabled', False)
         # Combo boxes should remain read-only but not disabled
         self.main_client_type_dropdown.config(state='readonly')
-        self.client_dropdown.config(state='readonly')
+        self.client_dropdown.config(state='normal')
         self.product_type_dropdown.config(state='readonly')
         # Text entry fields
         self.purchase_order_entry.config(state='normal')
@@ -752,12 +950,16 @@ class QuotationApp(tb.Window):
         self.unit_price_entry.config(state='normal')
         # Action buttons
         for btn in (
+            self.add_line_btn,
+            self.remove_line_btn,
             self.add_client_btn,
             self.edit_client_btn,
             self.details_client_btn,
+            self.import_clients_btn,
             self.generate_pdf_btn,
             self.preview_pdf_btn,
             self.history_btn,
+            self.analytics_btn,
         ):
             btn.config(state='normal')
 
@@ -789,56 +991,34 @@ class QuotationApp(tb.Window):
         self.option_add("*Font", ("Segoe UI", 10))
         
     def generate_pdf(self):
-        from tkinter import filedialog
-        import json
-
         client_name = self.client_var.get()
         if not client_name:
             messagebox.showerror("Erreur", "Veuillez sélectionner un client")
             return
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('SELECT id, nif, rc, address, preferences FROM clients WHERE name=?', (client_name,))
-        client = c.fetchone()
-        conn.close()
+        client = get_repository().get(client_name)
         if not client:
             messagebox.showerror("Erreur", "Client non trouvé")
             return
-        client_id, nif, rc, address, client_preferences = client
-        if client_preferences:
-            try:
-                client_preferences = json.loads(client_preferences)
-            except Exception:
-                client_preferences = {}
-        else:
-            client_preferences = {}
 
         doc_type = self.document_type
-        doc_number = self.document_number
         purchase_order = self.purchase_order_var.get().strip()
-        product = self.product_type_var.get()
-        try:
-            quantity = float(self.quantity_entry.get())
-            unit_price = float(self.unit_price_entry.get())
-        except ValueError:
-            messagebox.showerror("Erreur", "La quantité et le prix unitaire doivent être des nombres")
+        lines = self.get_document_lines()
+        if not lines:
             return
 
         date_str = datetime.now().strftime("%Y-%m-%d")
+        self.issue_document(client, doc_type, self.document_number, date_str, purchase_order, lines)
 
-        # Save to DB
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute(
-            '''INSERT INTO quotations (client_id, type, number, product, quantity, unit_price, date, purchase_order)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (client_id, doc_type, doc_number, product, quantity, unit_price, date_str, purchase_order),
-        )
-        conn.commit()
-        conn.close()
+    def issue_document(self, client, doc_type, doc_number, date_str, purchase_order, lines):
+        """Ask where to save the document, then issue it in the background.
 
-        default_name = f"{doc_type}_{client_name}_{doc_number}_{date_str}.pdf"
+        Nothing is recorded until the PDF has rendered; the history row, the
+        number and the file are then committed together (see issue_pipeline).
+        """
+        from tkinter import filedialog
+        from pdf_generator import document_filename
+        default_name = document_filename(doc_type, client.name, doc_number or peek_number(doc_type, date_str), date_str)
         pdf_filename = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("Fichiers PDF", "*.pdf")],
@@ -848,51 +1028,194 @@ class QuotationApp(tb.Window):
         if not pdf_filename:
             return
 
+        from issue_pipeline import IssueRequest, issue
+        request = IssueRequest(client, doc_type, doc_number, date_str, purchase_order, lines, pdf_filename)
         try:
-            create_pdf(
-                pdf_filename,
-                client_name,
-                nif,
-                rc,
-                address,
-                client_preferences,
-                doc_type,
-                doc_number,
-                purchase_order,
-                product,
-                quantity,
-                unit_price,
-                date_str,
-            )
-            messagebox.showinfo("Succès", f"PDF généré avec succès : {os.path.basename(pdf_filename)}")
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Erreur lors de la génération du PDF : {e}")
+            self.render_executor.submit(
+                issue, request, on_done=lambda issued: self.document_issued(request, issued),
+                on_error=lambda e: self.issue_failed(request, e), on_progress=self.show_render_status)
+        except RenderQueueFull:
+            messagebox.showinfo("Info", "Des documents sont déjà en cours de génération, veuillez patienter.")
+
+    def document_issued(self, request, issued):
+        messagebox.showinfo(
+            "Succès", f"{request.doc_type.capitalize()} n° {issued.doc_number} enregistré(e).\n"
+                      f"PDF généré avec succès : {os.path.basename(issued.path)}")
+        self.update_live_preview()
+
+    def issue_failed(self, request, e):
+        if isinstance(e, sqlite3.IntegrityError):
+            messagebox.showerror("Erreur", f"Le {request.doc_type} n° {request.doc_number} existe déjà.")
+        else:
+            messagebox.showerror("Erreur", f"Erreur lors de la génération du document, rien n'a été enregistré : {e}")
 
-    def update_totals(self, event=None):
+    def submit_render(self, pdf_args, on_done, on_error, key=None):
+        """Run render_pdf(*pdf_args) in the background render worker;
+        on_done receives the PDF bytes."""
+        from pdf_generator import render_pdf
         try:
-            quantity = float(self.quantity_entry.get())
-            unit_price = float(self.unit_price_entry.get())
-            montant_ht = quantity * unit_price
-            tva = montant_ht * 0.16
-            ttc = montant_ht + tva
-            self.ht_var.set(f"{montant_ht:,.2f}")
-            self.tva_var.set(f"{tva:,.2f}")
-            self.ttc_var.set(f"{ttc:,.2f}")
-        except Exception:
-            self.ht_var.set("0.00")
-            self.tva_var.set("0.00")
-            self.ttc_var.set("0.00")
-
-    def load_clients(self, client_type=None):
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        if client_type:
-            c.execute('SELECT name FROM clients WHERE client_type=?', (client_type,))
+            return self.render_executor.submit(
+                render_pdf, *pdf_args, key=key, on_done=on_done,
+                on_error=on_error, on_progress=self.show_render_status)
+        except RenderQueueFull:
+            messagebox.showinfo("Info", "Des documents sont déjà en cours de génération, veuillez patienter.")
+            return None
+
+    def show_render_status(self, status):
+        messages = {
+            'pending': "En attente...",
+            'running': "Génération du PDF en cours...",
+        }
+        self.render_status_var.set(messages.get(status, ""))
+
+    def poll_replica_sync(self):
+        """Show the state of the replica sync, and any conflicts it
+        reported, while in replica mode."""
+        sync = self.replica_sync
+        last_success = (datetime.fromtimestamp(sync.last_success).strftime("%H:%M")
+                        if sync.last_success is not None else None)
+        if sync.share_unreachable:
+            status = "Serveur partagé injoignable, numéros automatiques indisponibles"
+            if last_success:
+                status += f" (dernière synchronisation à {last_success})"
+        elif sync.last_error is not None:
+            status = f"Échec de la synchronisation avec le serveur partagé : {sync.last_error}"
+            if last_success:
+                status += f" (dernière synchronisation à {last_success})"
+        elif last_success:
+            status = f"Synchronisé avec le serveur partagé à {last_success}"
         else:
-            c.execute('SELECT name FROM clients')
-        rows = [r[0] for r in c.fetchall()]
-        conn.close()
-        return rows
+            status = "Synchronisation avec le serveur partagé..."
+        self.sync_status_var.set(status)
+        conflicts = sync.take_conflicts()
+        if conflicts:
+            message = ("La synchronisation avec le serveur partagé a relevé ces conflits ; les documents "
+                       "en double sont conservés dans l'historique :\n\n" + "\n".join(conflicts[:15]))
+            if len(conflicts) > 15:
+                message += f"\n... et {len(conflicts) - 15} autre(s)"
+            messagebox.showwarning("Conflits de synchronisation", message)
+        self.after(self.SYNC_POLL_INTERVAL, self.poll_replica_sync)
+
+    def on_close(self):
+        self.render_executor.shutdown()
+        self.export_executor.shutdown()
+        if self.replica_sync is not None:
+            self.replica_sync.stop()
+        self.destroy()
+
+    def read_line_entry(self):
+        """Return the line typed in the product fields, or None if empty.
+
+        Raises ValueError if quantity or unit price is not a number.
+        """
+        quantity = self.quantity_entry.get().strip()
+        unit_price = self.unit_price_entry.get().strip()
+        if not quantity and not unit_price:
+            return None
+        return (self.product_type_var.get(), float(quantity), float(unit_price))
+
+    def get_document_lines(self):
+        """Lines added to the document plus the one still being typed.
+
+        Shows an error and returns an empty list if there is nothing valid.
+        """
+        try:
+            pending = self.read_line_entry()
+        except ValueError:
+            messagebox.showerror("Erreur", "La quantité et le prix unitaire doivent être des nombres")
+            return []
+        lines = list(self.document_lines)
+        if pending:
+            lines.append(pending)
+        if not lines:
+            messagebox.showerror("Erreur", "Veuillez saisir au moins une ligne (quantité et prix unitaire)")
+        return lines
+
+    def add_line(self):
+        try:
+            line = self.read_line_entry()
+        except ValueError:
+            messagebox.showerror("Erreur", "La quantité et le prix unitaire doivent être des nombres")
+            return
+        if not line:
+            return
+        product, quantity, unit_price = line
+        self.document_lines.append(line)
+        self.lines_tree.insert('', 'end', values=(product, f"{quantity:,.2f}", f"{unit_price:,.2f}",
+                                                  f"{quantity * unit_price:,.2f}"))
+        self.quantity_entry.delete(0, 'end')
+        self.unit_price_entry.delete(0, 'end')
+        self.update_totals()
+
+    def remove_line(self):
+        items = self.lines_tree.get_children()
+        for index in sorted((items.index(item) for item in self.lines_tree.selection()), reverse=True):
+            del self.document_lines[index]
+        self.lines_tree.delete(*self.lines_tree.get_children())
+        for product, quantity, unit_price in self.document_lines:
+            self.lines_tree.insert('', 'end', values=(product, f"{quantity:,.2f}", f"{unit_price:,.2f}",
+                                                      f"{quantity * unit_price:,.2f}"))
+        self.update_totals()
+
+    def update_totals(self, event=None):
+        lines = list(self.document_lines)
+        try:
+            pending = self.read_line_entry()
+        except ValueError:
+            pending = None
+        if pending:
+            lines.append(pending)
+        montant_ht, tva, ttc = document_totals(lines)
+        self.ht_var.set(f"{montant_ht:,.2f}")
+        self.tva_var.set(f"{tva:,.2f}")
+        self.ttc_var.set(f"{ttc:,.2f}")
+        self.update_live_preview()
+
+    def toggle_live_preview(self):
+        width, height = self.winfo_width(), self.winfo_height()
+        if self.live_preview_var.get():
+            from live_preview import LivePreviewPane
+            self.live_preview = LivePreviewPane(self)
+            self.live_preview.pack(side='right', fill='y', padx=(0, 15), pady=10, before=self.content_frame)
+            self.update_idletasks()
+            self.geometry(f"{width + self.live_preview.winfo_reqwidth() + 15}x{height}")
+            self.update_live_preview()
+        elif self.live_preview is not None:
+            pane_width = self.live_preview.winfo_width()
+            self.live_preview.destroy()
+            self.live_preview = None
+            self.geometry(f"{max(800, width - pane_width - 15)}x{height}")
+
+    def live_document(self):
+        """render_pdf arguments for the document as typed so far, or None
+        without a client.  Numbers still being typed count as 0."""
+        client = get_repository().get(self.client_var.get())
+        if client is None or not hasattr(self, 'document_type'):
+            return None
+
+        def number(text):
+            try:
+                return float(text)
+            except ValueError:
+                return 0.0
+
+        date_str = datetime.now().strftime("%Y-%m-%d")
+        lines = list(self.document_lines)
+        quantity = self.quantity_entry.get().strip()
+        unit_price = self.unit_price_entry.get().strip()
+        if quantity or unit_price:
+            lines.append((self.product_type_var.get(), number(quantity), number(unit_price)))
+        return (client.name, client.nif, client.rc, client.address, client.preferences,
+                self.document_type, self.display_number(date_str), self.purchase_order_var.get().strip(),
+                lines, date_str)
+
+    def display_number(self, date_str):
+        """The document number, or the next automatic one for previews."""
+        return self.document_number or peek_number(self.document_type, date_str)
+
+    def update_live_preview(self):
+        if self.live_preview is not None:
+            self.live_preview.set_document(self.live_document())
 
     def create_widgets(self):
         # --- MAFCI Logo at the top using ttkbootstrap ---
@@ -917,6 +1240,8 @@ class QuotationApp(tb.Window):
         # --- Main content frame for the rest of the UI ---
         content_frame = tb.Frame(self)
         content_frame.pack(side='top', fill='both', expand=True)
+        self.content_frame = content_frame
+        self.live_preview = None
 
 
         # Client type selector
@@ -931,9 +1256,8 @@ class QuotationApp(tb.Window):
 
         ttk.Label(client_frame, text="Client :").grid(row=1, column=0, sticky='e', padx=5, pady=4)
         self.client_var = tk.StringVar()
-        self.client_dropdown = ttk.Combobox(client_frame, textvariable=self.client_var, state='disabled')
+        self.client_dropdown = ClientPicker(client_frame, textvariable=self.client_var, state='disabled')
         self.client_dropdown.grid(row=1, column=1, sticky='w', padx=5, pady=4)
-        self.client_dropdown['values'] = self.load_clients()
         self.client_dropdown.bind('<<ComboboxSelected>>', self.update_product_types)
 
         self.add_client_btn = ttk.Button(client_frame, text="Ajouter un client...", command=self.open_add_client, style='Accent.TButton', state='disabled')
@@ -942,6 +1266,8 @@ class QuotationApp(tb.Window):
         self.edit_client_btn.grid(row=3, column=0, columnspan=2, padx=5, pady=7, sticky='ew')
         self.details_client_btn = ttk.Button(client_frame, text="Voir les détails", command=self.show_client_details, state='disabled')
         self.details_client_btn.grid(row=4, column=0, columnspan=2, padx=5, pady=7, sticky='ew')
+        self.import_clients_btn = ttk.Button(client_frame, text="Importer des clients...", command=self.import_clients, state='disabled')
+        self.import_clients_btn.grid(row=5, column=0, columnspan=2, padx=5, pady=7, sticky='ew')
 
         # Product type selector
         product_frame = ttk.LabelFrame(content_frame, text="Produit")
@@ -950,11 +1276,13 @@ class QuotationApp(tb.Window):
         self.product_type_var = tk.StringVar()
         self.product_type_dropdown = ttk.Combobox(product_frame, textvariable=self.product_type_var, state='disabled')
         self.product_type_dropdown.grid(row=0, column=1, sticky='w', padx=5, pady=4)
+        self.product_type_dropdown.bind('<<ComboboxSelected>>', lambda e: self.update_live_preview())
 
         ttk.Label(product_frame, text="Bon de commande :").grid(row=1, column=0, sticky='e', padx=5, pady=4)
         self.purchase_order_var = tk.StringVar()
         self.purchase_order_entry = ttk.Entry(product_frame, textvariable=self.purchase_order_var, width=18, state='disabled')
         self.purchase_order_entry.grid(row=1, column=1, sticky='w', padx=5, pady=4)
+        self.purchase_order_entry.bind('<KeyRelease>', lambda e: self.update_live_preview())
 
         ttk.Label(product_frame, text="Quantité :").grid(row=2, column=0, sticky='e', padx=5, pady=4)
         self.quantity_entry = ttk.Entry(product_frame, width=18, state='disabled')
@@ -964,9 +1292,25 @@ class QuotationApp(tb.Window):
         self.unit_price_entry = ttk.Entry(product_frame, width=18, state='disabled')
         self.unit_price_entry.grid(row=3, column=1, sticky='w', padx=5, pady=4)
 
+        self.add_line_btn = ttk.Button(product_frame, text="Ajouter la ligne", command=self.add_line, state='disabled')
+        self.add_line_btn.grid(row=4, column=0, padx=5, pady=4, sticky='ew')
+        self.remove_line_btn = ttk.Button(product_frame, text="Supprimer la ligne", command=self.remove_line, state='disabled')
+        self.remove_line_btn.grid(row=4, column=1, padx=5, pady=4, sticky='ew')
+
+        # Document lines (the line being typed counts as the last one)
+        lines_frame = ttk.LabelFrame(content_frame, text="Lignes du document")
+        lines_frame.grid(row=2, column=0, columnspan=4, padx=15, pady=5, sticky='nsew')
+        self.document_lines = []
+        line_columns = ("Désignation", "Quantité", "P.U. HT", "Montant")
+        self.lines_tree = ttk.Treeview(lines_frame, columns=line_columns, show='headings', height=4)
+        for col in line_columns:
+            self.lines_tree.heading(col, text=col)
+            self.lines_tree.column(col, width=140)
+        self.lines_tree.pack(fill='both', expand=True, padx=5, pady=5)
+
         # Auto-calculated fields
         totals_frame = ttk.LabelFrame(content_frame, text="Montants")
-        totals_frame.grid(row=2, column=0, columnspan=4, padx=15, pady=10, sticky='nsew')
+        totals_frame.grid(row=3, column=0, columnspan=4, padx=15, pady=10, sticky='nsew')
         self.ht_var = tk.StringVar(value="0.00")
         self.tva_var = tk.StringVar(value="0.00")
         self.ttc_var = tk.StringVar(value="0.00")
@@ -983,32 +1327,32 @@ class QuotationApp(tb.Window):
 
         # Generate button
         actions_frame = ttk.LabelFrame(content_frame, text="Actions")
-        actions_frame.grid(row=3, column=0, columnspan=4, padx=15, pady=10, sticky='nsew')
+        actions_frame.grid(row=4, column=0, columnspan=4, padx=15, pady=10, sticky='nsew')
         self.generate_pdf_btn = ttk.Button(actions_frame, text="Générer le PDF", command=self.generate_pdf, style='Accent.TButton', state='disabled')
         self.generate_pdf_btn.grid(row=0, column=0, padx=10, pady=8, sticky='ew')
         self.preview_pdf_btn = ttk.Button(actions_frame, text="Prévisualiser le PDF", command=self.preview_pdf, state='disabled')
         self.preview_pdf_btn.grid(row=0, column=1, padx=10, pady=8, sticky='ew')
         self.history_btn = ttk.Button(actions_frame, text="Historique", command=self.open_history_window, state='disabled')
         self.history_btn.grid(row=1, column=0, columnspan=2, padx=10, pady=8, sticky='ew')
+        self.analytics_btn = ttk.Button(actions_frame, text="Analyses", command=self.open_analytics_window, state='disabled')
+        self.analytics_btn.grid(row=1, column=2, padx=10, pady=8, sticky='ew')
+        self.render_status_var = tk.StringVar(value="")
+        ttk.Label(actions_frame, textvariable=self.render_status_var).grid(row=2, column=0, columnspan=2, padx=10, sticky='w')
+        self.sync_status_var = tk.StringVar(value="")
+        ttk.Label(actions_frame, textvariable=self.sync_status_var).grid(row=3, column=0, columnspan=3, padx=10, sticky='w')
+        self.live_preview_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(actions_frame, text="Aperçu en direct", variable=self.live_preview_var,
+                        command=self.toggle_live_preview).grid(row=0, column=2, padx=10, pady=8, sticky='w')
 
     def update_clients_for_type(self, event=None):
         ctype = self.main_client_type_var.get()
-        self.client_dropdown.set('')
+        self.client_dropdown.set_client_type(ctype or None)
         self.product_type_dropdown.set('')
         self.product_type_dropdown['values'] = []
-        if ctype:
-            clients = self.load_clients(ctype)
-            self.client_dropdown['values'] = clients
-        else:
-            self.client_dropdown['values'] = []
 
     def get_client_type(self, client_name):
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('SELECT client_type FROM clients WHERE name=?', (client_name,))
-        row = c.fetchone()
-        conn.close()
-        return row[0] if row else None
+        client = get_repository().get(client_name)
+        return client.client_type if client else None
 
     def update_product_types(self, event=None):
         cement_types = ['Ciment 42.5', 'Ciment 32.5', 'Ciment SR']
@@ -1030,6 +1374,7 @@ class QuotationApp(tb.Window):
             self.product_type_var.set(self.product_type_dropdown['values'][0])
         else:
             self.product_type_var.set('')
+        self.update_live_preview()
 
     def open_add_client(self):
         AddClientWindow(self)
@@ -1051,29 +1396,57 @@ class QuotationApp(tb.Window):
         self.add_client_btn.config(state=state)
         self.edit_client_btn.config(state=state)
         self.details_client_btn.config(state=state)
+        self.import_clients_btn.config(state=state)
         self.generate_pdf_btn.config(state=state)
         self.preview_pdf_btn.config(state=state)
         self.history_btn.config(state=state)
+        self.analytics_btn.config(state=state)
+
+    def import_clients(self):
+        from tkinter import filedialog
+        import client_import
+        filename = filedialog.askopenfilename(
+            filetypes=[("Fichiers Excel ou CSV", "*.xlsx *.csv")],
+            title="Choisissez la liste de clients à importer",
+        )
+        if not filename:
+            return
+
+        def on_done(report):
+            self.import_clients_btn.configure(state='normal')
+            self.refresh_clients()
+            message = client_import.format_report(report)
+            rejected = report['rejected']
+            if rejected:
+                message += "\n\n" + "\n".join(f"Ligne {line} : {error}" for line, error in rejected[:15])
+                if len(rejected) > 15:
+                    message += f"\n... et {len(rejected) - 15} autre(s)"
+            messagebox.showinfo("Import des clients", message)
+
+        def on_error(e):
+            self.import_clients_btn.configure(state='normal')
+            messagebox.showerror("Erreur", f"Échec de l'import, aucun client n'a été modifié : {e}")
+
+        try:
+            # No key: a second export or import is refused (max_pending=1)
+            # rather than superseding the one running
+            self.export_executor.submit(client_import.import_clients, filename,
+                                        on_done=on_done, on_error=on_error)
+        except RenderQueueFull:
+            messagebox.showinfo("Info", "Un export ou un import est déjà en cours, veuillez patienter.")
+            return
+        self.import_clients_btn.configure(state='disabled')
 
     def show_client_details(self):
         client_name = self.client_var.get()
         if not client_name:
             messagebox.showerror("Erreur", "Veuillez sélectionner un client")
             return
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('SELECT name, nif, rc, address, client_type, preferences FROM clients WHERE name=?', (client_name,))
-        row = c.fetchone()
-        conn.close()
-        if not row:
+        client = get_repository().get(client_name)
+        if not client:
             messagebox.showerror("Erreur", "Client non trouvé")
             return
-        name, nif, rc, address, client_type, preferences = row
-        import json
-        try:
-            preferences = json.loads(preferences) if preferences else {}
-        except Exception:
-            preferences = {}
+        name, nif, rc, address, client_type, preferences = client[1:]
         details = f"Nom : {name}\nNIF : {nif}\nRC : {rc}\nAdresse : {address}\nType : {client_type}\n"
         if preferences:
             details += "\nPréférences :\n"
@@ -1087,94 +1460,60 @@ class QuotationApp(tb.Window):
     def open_history_window(self):
         HistoryWindow(self)
 
+    def open_analytics_window(self):
+        AnalyticsWindow(self)
+
     def refresh_clients(self):
-        self.client_dropdown['values'] = self.load_clients()
+        self.client_dropdown.refresh()
 
     def preview_pdf(self):
-        import tempfile
-
         client_name = self.client_var.get()
         if not client_name:
             messagebox.showerror("Erreur", "Veuillez sélectionner un client")
             return
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('SELECT id, nif, rc, address, preferences FROM clients WHERE name=?', (client_name,))
-        client = c.fetchone()
-        conn.close()
+        client = get_repository().get(client_name)
         if not client:
             messagebox.showerror("Erreur", "Client non trouvé")
             return
-        client_id, nif, rc, address, client_preferences = client
-        if client_preferences:
-            try:
-                client_preferences = json.loads(client_preferences)
-            except Exception:
-                client_preferences = {}
-        else:
-            client_preferences = {}
+        client_id, nif, rc, address = client.id, client.nif, client.rc, client.address
+        client_preferences = client.preferences
 
         doc_type = self.document_type
-        doc_number = self.document_number
         purchase_order = self.purchase_order_var.get().strip()
-        product = self.product_type_var.get()
-        try:
-            quantity = float(self.quantity_entry.get())
-            unit_price = float(self.unit_price_entry.get())
-        except ValueError:
-            messagebox.showerror("Erreur", "La quantité et le prix unitaire doivent être des nombres")
+        lines = self.get_document_lines()
+        if not lines:
             return
 
         date_str = datetime.now().strftime("%Y-%m-%d")
-
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        pdf_filename = tmp.name
-        tmp.close()
-
-        try:
-            create_pdf(
-                pdf_filename,
-                client_name,
-                nif,
-                rc,
-                address,
-                client_preferences,
-                doc_type,
-                doc_number,
-                purchase_order,
-                product,
-                quantity,
-                unit_price,
-                date_str,
-            )
-            PDFPreviewWindow(self, pdf_filename)
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de générer l'aperçu : {e}")
-
-    def export_history_to_excel(self):
-        import pandas as pd
-        from tkinter import filedialog
-        import os
-        rows = [self.tree.item(item)['values'] for item in self.tree.get_children()]
-        if not rows:
-            messagebox.showinfo("Info", "Aucune donnée à exporter.")
-            return
-        cols = [self.tree.heading(col)['text'] for col in self.tree['columns']]
-        df = pd.DataFrame(rows, columns=cols)
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".xlsx",
-            filetypes=[("Fichiers Excel", "*.xlsx")],
-            initialfile="historique_devis_factures.xlsx",
-            title="Choisissez l'emplacement pour enregistrer le fichier Excel"
+        doc_number = self.display_number(date_str)
+        from pdf_generator import document_filename
+        filename = document_filename(doc_type, client_name, doc_number, date_str)
+        # The preview's number is only a guess when it is automatic, so
+        # "Générer ce PDF" issues the previewed document for real rather
+        # than saving these bytes.
+        manual_number = self.document_number
+
+        def issue_previewed():
+            self.issue_document(client, doc_type, manual_number, date_str, purchase_order, lines)
+
+        # Rendered in memory; a newer preview supersedes one that is still
+        # queued or rendering
+        self.submit_render(
+            (client_name, nif, rc, address, client_preferences,
+             doc_type, doc_number, purchase_order, lines, date_str),
+            on_done=lambda pdf_data: self.show_preview(pdf_data, filename, issue_previewed),
+            on_error=lambda e: messagebox.showerror("Erreur", f"Impossible de générer l'aperçu : {e}"),
+            key='preview',
         )
-        if not filename:
-            return
-        df.to_excel(filename, index=False)
-        messagebox.showinfo("Succès", f"Historique exporté dans {os.path.basename(filename)}")
 
+    def show_preview(self, pdf_data, filename=None, on_generate=None):
+        from pdf_viewer import PDFPreviewWindow
+        PDFPreviewWindow(self, pdf_data, on_generate_callback=on_generate, filename=filename)
 
 if __name__ == '__main__':
+    # Regeneration runs create_pdf in worker processes (see regenerate.py)
+    multiprocessing.freeze_support()
     app = QuotationApp()
     app.mainloop()
 
@@ -0,0 +1,217 @@
+"""Regenerate issued documents with the current layout and branding.
+
+    python regenerate.py sortie/ [--client NOM] [--type facture] [--from 2024-01-01] [--to 2024-12-31]
+
+Documents are selected with the history filters (history_query) and
+rendered by create_pdf in a process pool.  Work is sent in chunks of
+CHUNK_SIZE documents, and each worker builds the letterhead and image caches
+once when it starts rather than on its first document.  Outputs go to
+``<output>/regeneration_<run date>/<year>/<month>/``.  The history and the
+archived originals (pdf_archive) are left untouched.
+
+:class:`RegenerationJob` runs on a background thread and can be polled for
+progress and ETA, and cancelled, from the GUI.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import database
+import history_query
+from client_repository import parse_preferences
+
+CHUNK_SIZE = 16    # documents per work unit
+LOAD_BATCH = 500   # documents read from the database at a time
+
+
+def _warm_up():
+    # Pool initializer: build the per-process letterhead template and
+    # image caches before the first document.
+    import pdf_generator
+    pdf_generator.get_letterhead()
+    pdf_generator.get_totals_box()
+
+
+def _render_chunk(tasks):
+    from pdf_generator import create_pdf
+    results = []
+    for document_id, path, pdf_args in tasks:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            create_pdf(path + '.part', *pdf_args)
+            os.replace(path + '.part', path)
+        except Exception as e:
+            try:
+                os.remove(path + '.part')
+            except OSError:
+                pass
+            results.append((document_id, str(e)))
+        else:
+            results.append((document_id, None))
+    return results
+
+
+def load_documents(document_ids):
+    """Yield (document id, create_pdf arguments without the file name)."""
+    for start in range(0, len(document_ids), LOAD_BATCH):
+        batch = document_ids[start:start + LOAD_BATCH]
+        placeholders = ','.join('?' * len(batch))
+        lines = {}
+        for document_id, product, quantity, unit_price in database.fetch_all(
+                f'''SELECT document_id, product, quantity, unit_price FROM document_lines
+                    WHERE document_id IN ({placeholders}) ORDER BY document_id, position''', batch):
+            lines.setdefault(document_id, []).append((product, quantity, unit_price))
+        headers = {row[0]: row[1:] for row in database.fetch_all(
+            f'''SELECT documents.id, clients.name, clients.nif, clients.rc, clients.address, clients.preferences,
+                       documents.type, documents.number, documents.purchase_order, documents.date
+                FROM documents LEFT JOIN clients ON clients.id = documents.client_id
+                WHERE documents.id IN ({placeholders})''', batch)}
+        for document_id in batch:
+            header = headers.get(document_id)
+            if header is None:
+                continue
+            name, nif, rc, address, preferences, doc_type, number, purchase_order, date_str = header
+            yield document_id, (name or '', nif or '', rc or '', address or '', parse_preferences(preferences),
+                                doc_type, number, purchase_order or '', lines.get(document_id, []), date_str)
+
+
+class RegenerationJob:
+    """Regenerate the documents matching a HistoryFilter into ``output_root``.
+
+    ``progress()`` may be called from any thread while the job runs.
+    """
+
+    def __init__(self, flt, output_root, workers=None):
+        self.filter = flt
+        self.output_dir = os.path.join(output_root, datetime.now().strftime('regeneration_%Y-%m-%d_%H%M%S'))
+        self.workers = workers or os.cpu_count() or 1
+        self.total = None  # known once the documents are selected
+        self.done = 0
+        self.errors = []   # (document id, message)
+        self.failure = None
+        self.finished = False
+        self._started = None
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_thread, name='regeneration', daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stop after the chunks already being rendered."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def progress(self):
+        """(done, total, seconds left or None)."""
+        done, total = self.done, self.total
+        eta = None
+        if total and done and self._started:
+            elapsed = time.perf_counter() - self._started
+            eta = elapsed / done * (total - done)
+        return done, total, eta
+
+    def _run_thread(self):
+        try:
+            self.run()
+        except Exception as e:
+            self.failure = e
+        finally:
+            database.close_thread_connection()
+            self.finished = True
+
+    def _tasks(self, document_ids):
+        from pdf_generator import document_filename
+        # Duplicates of a number, documents without a number or names only
+        # differing in case would share a file name; all but the first get
+        # their document id appended so workers never write the same file.
+        used = set()
+        for document_id, pdf_args in load_documents(document_ids):
+            doc_type, number, date_str = pdf_args[5], pdf_args[6], pdf_args[9]
+            year, month = (date_str or '0000-00')[:7].split('-')[:2]
+            filename = document_filename(doc_type, pdf_args[0], number or '', date_str)
+            if (year, month, filename.casefold()) in used:
+                filename = f'{filename[:-len(".pdf")]}_{document_id}.pdf'
+            used.add((year, month, filename.casefold()))
+            yield document_id, os.path.join(self.output_dir, year, month, filename), pdf_args
+
+    def _chunks(self, tasks):
+        chunk = []
+        for task in tasks:
+            chunk.append(task)
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run(self):
+        """Regenerate in the calling thread; return the number of documents written."""
+        document_ids = history_query.document_ids(self.filter)
+        self.total = len(document_ids)
+        self._started = time.perf_counter()
+        chunks = self._chunks(self._tasks(document_ids))
+        # Only a few chunks are queued ahead of the workers, so cancelling
+        # takes effect quickly and the tasks are not all held in memory.
+        max_in_flight = self.workers * 2
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up) as pool:
+            in_flight = set()
+            while True:
+                while not self.cancelled and len(in_flight) < max_in_flight:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    in_flight.add(pool.submit(_render_chunk, chunk))
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.cancelled():
+                        continue
+                    for document_id, error in future.result():
+                        if error:
+                            self.errors.append((document_id, error))
+                        self.done += 1
+                if self.cancelled:
+                    for future in in_flight:
+                        future.cancel()
+        return self.done - len(self.errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Régénération des documents émis avec la mise en page actuelle.")
+    parser.add_argument('output', help="dossier de sortie")
+    parser.add_argument('--client', default='', help="nom du client")
+    parser.add_argument('--type', default='', choices=('', 'devis', 'facture'), help="type de document")
+    parser.add_argument('--from', dest='date_from', default='', help="date de début (AAAA-MM-JJ)")
+    parser.add_argument('--to', dest='date_to', default='', help="date de fin (AAAA-MM-JJ)")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="nombre de processus de rendu")
+    parser.add_argument('--db', default=None, help="chemin de la base de données")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = args.db
+    database.migrate()
+    flt = history_query.HistoryFilter(args.client, args.type, args.date_from, args.date_to, None, None, '')
+    job = RegenerationJob(flt, args.output, args.workers)
+    started = time.perf_counter()
+    written = job.run()
+    elapsed = time.perf_counter() - started
+    for document_id, message in job.errors:
+        print(f"Document {document_id} : {message}", file=sys.stderr)
+    rate = job.done / elapsed if elapsed else 0.0
+    print(f"{written} document(s) régénéré(s) dans {job.output_dir}, {len(job.errors)} erreur(s)")
+    print(f"Durée : {elapsed:.2f} s ({rate:.1f} docs/s)")
+    return 1 if job.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Background rendering for PDF generation and preview.
+
+``create_pdf`` is run on a worker thread so the Tk main loop keeps painting.
+Results come back to the Tk thread by polling with ``after()``; Tk widgets
+must never be touched from the worker.
+"""
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class RenderQueueFull(Exception):
+    """Raised when too many render jobs are already waiting."""
+
+
+class RenderJob:
+    def __init__(self, key, on_done, on_error, on_progress):
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.future = None
+        self.status = PENDING
+        self.reported_status = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Cancel the job; a job already running finishes but is ignored."""
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+
+class RenderExecutor:
+    """Run render jobs off the Tk thread and report back through ``after()``.
+
+    At most ``max_pending`` jobs may be queued or running; further submits
+    raise :class:`RenderQueueFull`.  Submitting a job with the same ``key`` as
+    an earlier one (e.g. ``'preview'``) cancels the earlier, superseded job.
+    """
+
+    def __init__(self, root, max_workers=1, max_pending=3, poll_interval=50):
+        self.root = root
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='render')
+        self._jobs = []
+        self._polling = False
+
+    def submit(self, fn, *args, key=None, on_done=None, on_error=None,
+               on_progress=None, **kwargs):
+        """Schedule ``fn(*args, **kwargs)`` and return its :class:`RenderJob`.
+
+        ``on_done(result)``, ``on_error(exc)`` and ``on_progress(status)`` are
+        called on the Tk thread.
+        """
+        if key is not None:
+            for job in self._jobs:
+                if job.key == key and not job.cancelled:
+                    job.cancel()
+        active = [job for job in self._jobs if not job.cancelled and not job.done()]
+        if len(active) >= self.max_pending:
+            raise RenderQueueFull()
+
+        job = RenderJob(key, on_done, on_error, on_progress)
+
+        def run():
+            if job.cancelled:
+                raise CancelledError()
+            job.status = RUNNING
+            return fn(*args, **kwargs)
+
+        job.future = self._executor.submit(run)
+        self._jobs.append(job)
+        self._schedule_poll()
+        return job
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        finished = []
+        for job in self._jobs:
+            if job.done():
+                finished.append(job)
+            elif not job.cancelled:
+                self._report(job, job.status)
+        # Update the job list before running callbacks, which may submit more.
+        self._jobs = [job for job in self._jobs if job not in finished]
+        for job in finished:
+            if not job.cancelled:
+                self._deliver(job)
+        if self._jobs:
+            self._schedule_poll()
+
+    def _deliver(self, job):
+        try:
+            result = job.future.result()
+        except CancelledError:
+            job.status = CANCELLED
+            self._report(job, CANCELLED)
+        except Exception as e:
+            job.status = FAILED
+            self._report(job, FAILED)
+            if job.on_error:
+                job.on_error(e)
+        else:
+            job.status = DONE
+            self._report(job, DONE)
+            if job.on_done:
+                job.on_done(result)
+
+    def _report(self, job, status):
+        if job.on_progress and status != job.reported_status:
+            job.reported_status = status
+            job.on_progress(status)
+
+    def shutdown(self):
+        for job in self._jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,496 @@
+"""Offline-first replica mode: work on a local copy, sync with the share.
+
+With SHARED_DB_PATH set, each desk reads and writes a local copy of the
+shared clients.db (LOCAL_DB_PATH), created from the share on first start, so
+queries never cross the network and desks no longer lock each other out.  A
+:class:`ReplicaSync` thread then exchanges changes with the share every
+SYNC_INTERVAL seconds, whenever the share is reachable:
+
+* push: the rows named in the local ``sync_log`` since the last push are
+  copied to the share in one transaction, clients first;
+* pull: the rows named in the share's ``sync_log`` since the last pull are
+  copied back the same way.
+
+Rows are matched by uid (clients created on two desks under the same name
+are matched by name and keep the share's uid).  Conflicting client edits are
+settled by last writer wins on (version, updated_at).  A desk's client whose
+name another client already has on the share (two desks renaming or creating
+clients under the same name) keeps the share's client under that name and is
+renamed "name (2)" on both sides; this is reported as a conflict.  Deletions are not
+replicated: the application never deletes clients or documents.  Archived
+PDFs (pdf_archive) stay on the desk that issued them; only their hash is
+replicated.
+
+Numbering rule: automatic numbers are always taken from the share's
+counters (:class:`Numbering`), in a share transaction committed together
+with the desk's own, so two desks can never hand out the same number.
+Issuing a document with an automatic number therefore needs the share to be
+reachable; offline, only documents numbered by hand can be issued.  When two
+desks typed the same number by hand, the document reaching the share second
+is stored as a duplicate of it (see migration 5) and reported as a conflict,
+which the application shows to the user.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import database
+import history_query
+from client_repository import get_repository
+from document_store import allocate_number
+
+# Path of the shared database, e.g. r'\\serveur\partage\clients.db'; None
+# keeps the application working directly on database.DB_PATH.
+SHARED_DB_PATH = None
+LOCAL_DB_PATH = 'clients_local.db'
+SYNC_INTERVAL = 60  # seconds
+BATCH_SIZE = 500    # sync_log entries per transaction
+
+# Share of the replica opened by open_replica, which numbers documents
+_numbering_share = None
+
+_CLIENT_COLUMNS = ('uid', 'name', 'nif', 'rc', 'address', 'client_type', 'preferences',
+                   'version', 'updated_at')
+
+
+def _get_state(conn, key, default=0):
+    row = conn.execute('SELECT value FROM sync_state WHERE key=?', (key,)).fetchone()
+    return int(row[0]) if row else default
+
+
+def _set_state(conn, key, value):
+    conn.execute('INSERT INTO sync_state (key, value) VALUES (?, ?) '
+                 'ON CONFLICT(key) DO UPDATE SET value=excluded.value', (key, str(value)))
+
+
+def _last_seq(conn):
+    return conn.execute('SELECT coalesce(max(seq), 0) FROM sync_log').fetchone()[0]
+
+
+def _connect_share(path):
+    # sqlite3 would silently create an empty database where the share is
+    # missing, e.g. while the network drive is not mounted.  The share is
+    # never marked local, so it keeps a rollback journal and no mmap (see
+    # database.connect).
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"base partagée introuvable : {path}")
+    return database.connect(path)
+
+
+def open_replica(shared_path=None, local_path=None):
+    """Point database.DB_PATH at the local replica, copying the shared
+    database first if there is no replica yet; return the local path.
+
+    Raises OSError or sqlite3.Error if the replica has to be copied and the
+    share cannot be read; no replica is left behind then.
+    """
+    shared_path = shared_path or SHARED_DB_PATH
+    local_path = local_path or LOCAL_DB_PATH
+    # Only this desk opens its replica, so it may use WAL
+    database.mark_local(local_path)
+    if not os.path.exists(local_path):
+        # Copied under another name first so an interrupted copy is not
+        # taken for a replica on the next start
+        part_path = local_path + '.part'
+        hub = _connect_share(shared_path)
+        try:
+            database.migrate(hub)
+            local = database.connect(part_path)
+            try:
+                hub.backup(local)
+                # Everything up to now is already on both sides
+                with local:
+                    local.execute('BEGIN IMMEDIATE')
+                    _set_state(local, 'last_pulled', _last_seq(hub))
+                    _set_state(local, 'last_pushed', _last_seq(local))
+            finally:
+                local.close()
+            os.replace(part_path, local_path)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            hub.close()
+    database.DB_PATH = local_path
+    global _numbering_share
+    _numbering_share = shared_path
+    return local_path
+
+
+class ShareUnavailable(Exception):
+    """Raised when an automatic number is needed and the share cannot be
+    reached."""
+
+
+class Numbering:
+    """Allocates automatic document numbers inside a write transaction.
+
+    Use as a context manager around the inserts, within the local write
+    transaction on ``conn``.  Outside replica mode numbers come from the
+    local counters.  In replica mode they come from the share's: the share is
+    opened and locked on the first allocation, and its transaction commits on
+    exit, just before the local one, so a number is only consumed if the
+    document is recorded (unless the local commit itself fails afterwards).
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.shared_path = _numbering_share
+        self.hub = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.hub is not None:
+            try:
+                if exc_type is None:
+                    self.hub.commit()
+                else:
+                    self.hub.rollback()
+            finally:
+                self.hub.close()
+                self.hub = None
+        return False
+
+    def _open_share(self):
+        hub = None
+        try:
+            hub = _connect_share(self.shared_path)
+            database.migrate(hub)
+            hub.execute('BEGIN IMMEDIATE')
+        except (sqlite3.Error, OSError) as e:
+            if hub is not None:
+                hub.close()
+            if database.is_busy_error(e):
+                raise  # retried by database.retry_on_busy
+            raise ShareUnavailable(
+                "Le serveur partagé est injoignable : les numéros automatiques ne peuvent pas être "
+                f"attribués hors ligne. Réessayez plus tard ou saisissez le numéro. ({e})") from e
+        self.hub = hub
+
+    def allocate(self, doc_type, year):
+        if self.shared_path is None:
+            return allocate_number(self.conn, doc_type, year)
+        if self.hub is None:
+            self._open_share()
+        while True:
+            doc_number = allocate_number(self.hub, doc_type, year)
+            # Numbers typed by hand here may not have reached the share yet
+            if not self.conn.execute('SELECT 1 FROM documents WHERE type=? AND number=?',
+                                     (doc_type, doc_number)).fetchone():
+                break
+        # Keep the local counter in step so previews guess the next number
+        last_number = self.hub.execute('SELECT last_number FROM document_sequences WHERE doc_type=? AND year=?',
+                                       (doc_type, year)).fetchone()[0]
+        self.conn.execute(
+            '''INSERT INTO document_sequences (doc_type, year, last_number) VALUES (?, ?, ?)
+               ON CONFLICT (doc_type, year) DO UPDATE SET last_number = max(last_number, excluded.last_number)''',
+            (doc_type, year, last_number))
+        return doc_number
+
+
+def _read_client(conn, uid):
+    row = conn.execute(f'SELECT {", ".join(_CLIENT_COLUMNS)} FROM clients WHERE uid=?', (uid,)).fetchone()
+    return dict(zip(_CLIENT_COLUMNS, row)) if row else None
+
+
+def _find_client(conn, client, source):
+    """The row of ``conn`` that ``client``, a row of ``source``, merges
+    into, as (id, uid, version, updated_at), or None for a new client.
+
+    A row of another uid is matched by name, unless ``source`` has that uid
+    too: it is then another client that holds the name.
+    """
+    current = conn.execute('SELECT id, uid, version, updated_at FROM clients WHERE uid=?',
+                           (client['uid'],)).fetchone()
+    if current is None:
+        current = conn.execute('SELECT id, uid, version, updated_at FROM clients WHERE name=?',
+                               (client['name'],)).fetchone()
+        if current is not None and source.execute('SELECT 1 FROM clients WHERE uid=?',
+                                                  (current[1],)).fetchone():
+            return None
+    return current
+
+
+def _wins(client, current):
+    """True if ``client`` is to be written over ``current`` (see _find_client)."""
+    return current is None or (client['version'], client['updated_at'] or '') > (current[2], current[3] or '')
+
+
+def _name_holder(conn, client, current):
+    """uid of the other client of ``conn`` that has ``client``'s name, or None."""
+    row = conn.execute('SELECT id, uid FROM clients WHERE name=?', (client['name'],)).fetchone()
+    if row is None or (current is not None and row[0] == current[0]):
+        return None
+    return row[1]
+
+
+def _free_name(name, *conns):
+    """``name`` followed by the first " (n)" that no client of ``conns`` has."""
+    n = 2
+    while any(conn.execute('SELECT 1 FROM clients WHERE name=?', (f'{name} ({n})',)).fetchone()
+              for conn in conns):
+        n += 1
+    return f'{name} ({n})'
+
+
+def _merge_client(conn, client, current, adopt_uid):
+    """Merge ``client`` (a row of the other database) into ``conn``, where
+    ``current`` is the row found for it by :func:`_find_client`.
+
+    Returns (uid of the row in ``conn``, changed).  A client matched by name
+    under another uid takes ``client``'s uid if ``adopt_uid``.  The caller
+    makes sure no other client of ``conn`` has ``client``'s name.
+    """
+    if current is None:
+        conn.execute(f'INSERT INTO clients ({", ".join(_CLIENT_COLUMNS)}) VALUES ({", ".join("?" * len(_CLIENT_COLUMNS))})',
+                     [client[column] for column in _CLIENT_COLUMNS])
+        return client['uid'], True
+    client_id, uid, version, updated_at = current
+    if adopt_uid and uid != client['uid']:
+        conn.execute('UPDATE clients SET uid=? WHERE id=?', (client['uid'], client_id))
+        uid = client['uid']
+    if not _wins(client, current):
+        return uid, False
+    conn.execute('''UPDATE clients SET name=?, nif=?, rc=?, address=?, client_type=?, preferences=?,
+                    version=?, updated_at=? WHERE id=?''',
+                 [client[column] for column in _CLIENT_COLUMNS[1:]] + [client_id])
+    return uid, True
+
+
+def _read_document(conn, uid):
+    row = conn.execute('''SELECT documents.id, clients.uid, documents.type, documents.number, documents.date,
+                                 documents.purchase_order, documents.duplicate, documents.pdf_hash
+                          FROM documents LEFT JOIN clients ON clients.id = documents.client_id
+                          WHERE documents.uid=?''', (uid,)).fetchone()
+    if row is None:
+        return None
+    lines = conn.execute('''SELECT position, product, quantity, unit_price FROM document_lines
+                            WHERE document_id=? ORDER BY position''', (row[0],)).fetchall()
+    return {'uid': uid, 'client_uid': row[1], 'type': row[2], 'number': row[3], 'date': row[4],
+            'purchase_order': row[5], 'duplicate': row[6], 'pdf_hash': row[7], 'lines': lines}
+
+
+def _free_duplicate(conn, doc_type, number):
+    return conn.execute('SELECT coalesce(max(duplicate) + 1, 0) FROM documents WHERE type=? AND number=?',
+                        (doc_type, number)).fetchone()[0]
+
+
+def _insert_document(conn, document, duplicate):
+    client = conn.execute('SELECT id FROM clients WHERE uid=?', (document['client_uid'],)).fetchone()
+    cur = conn.execute('''INSERT INTO documents (uid, client_id, type, number, date, purchase_order, duplicate, pdf_hash)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                       (document['uid'], client[0] if client else None, document['type'],
+                        document['number'], document['date'], document['purchase_order'], duplicate,
+                        document['pdf_hash']))
+    conn.executemany('''INSERT INTO document_lines (document_id, position, product, quantity, unit_price)
+                        VALUES (?, ?, ?, ?, ?)''', [(cur.lastrowid,) + tuple(line) for line in document['lines']])
+
+
+def _pending(conn, after):
+    """The next batch of sync_log entries: (last seq, client uids, document uids)."""
+    rows = conn.execute('SELECT seq, entity, uid FROM sync_log WHERE seq > ? ORDER BY seq LIMIT ?',
+                        (after, BATCH_SIZE)).fetchall()
+    clients = list(dict.fromkeys(uid for _, entity, uid in rows if entity == 'client'))
+    documents = list(dict.fromkeys(uid for _, entity, uid in rows if entity == 'document'))
+    return (rows[-1][0] if rows else after), clients, documents
+
+
+class ReplicaSync:
+    """Background exchange of changes between the local replica and the share.
+
+    Runs on its own thread with its own connections; :attr:`last_report` and
+    :attr:`last_error` describe the latest attempt, :attr:`share_unreachable`
+    tells whether it failed for want of the share, :attr:`last_success` is
+    when the share was last reached and :meth:`take_conflicts` hands the
+    conflicts reported since the previous call to the GUI.
+    """
+
+    def __init__(self, shared_path=None, local_path=None, interval=SYNC_INTERVAL):
+        self.shared_path = shared_path or SHARED_DB_PATH
+        self.local_path = local_path or LOCAL_DB_PATH
+        self.interval = interval
+        self.last_report = None
+        self.last_error = None
+        self.last_success = None
+        self._conflicts = []
+        self._conflicts_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # one sync at a time
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='replica-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop the thread after one last sync attempt."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self.sync_once()
+            if self._stop.wait(self.interval):
+                self.sync_once()
+                return
+
+    def sync_once(self):
+        """Push local changes, then pull the others'; return a report dict,
+        or None if the share could not be reached (see last_error)."""
+        with self._lock:
+            try:
+                report = self._sync()
+            except (sqlite3.Error, OSError) as e:
+                self.last_error = e
+                return None
+            self.last_error = None
+            self.last_report = report
+            self.last_success = time.time()
+            with self._conflicts_lock:
+                self._conflicts.extend(report['conflicts'])
+            return report
+
+    @property
+    def share_unreachable(self):
+        """True if the latest attempt could not reach the share or found it
+        locked, rather than failing on something else."""
+        error = self.last_error
+        return isinstance(error, OSError) or (error is not None and database.is_busy_error(error))
+
+    def take_conflicts(self):
+        """Conflicts reported since the last call, oldest first."""
+        with self._conflicts_lock:
+            conflicts, self._conflicts = self._conflicts, []
+            return conflicts
+
+    def _sync(self):
+        started = time.perf_counter()
+        report = {'pushed': 0, 'pulled': 0, 'conflicts': []}
+        hub = _connect_share(self.shared_path)
+        local = database.connect(self.local_path)
+        try:
+            database.migrate(hub)
+            while self._push(local, hub, report):
+                pass
+            while self._pull(local, hub, report):
+                pass
+        finally:
+            hub.close()
+            local.close()
+        if report['pulled']:
+            get_repository().invalidate()
+            history_query.invalidate()
+        report['seconds'] = time.perf_counter() - started
+        return report
+
+    def _push(self, local, hub, report):
+        """Copy one batch of local changes to the share; False when done."""
+        last_pushed = _get_state(local, 'last_pushed')
+        seq, client_uids, document_uids = _pending(local, last_pushed)
+        if seq == last_pushed:
+            return False
+        adopted = {}
+        renamed = []
+        duplicates = {}
+        with hub:
+            hub.execute('BEGIN IMMEDIATE')
+            for uid in client_uids:
+                client = _read_client(local, uid)
+                if client is None:
+                    continue
+                current = _find_client(hub, client, local)
+                if _wins(client, current) and _name_holder(hub, client, current) is not None:
+                    # The share's client keeps the name; this one is renamed
+                    # here and there, as a new version of it
+                    name = _free_name(client['name'], hub, local)
+                    report['conflicts'].append(
+                        f"client « {client['name']} » renommé « {name} » : nom déjà utilisé par un autre client")
+                    client['name'] = name
+                    client['version'] += 1
+                    renamed.append(client)
+                hub_uid, _ = _merge_client(hub, client, current, adopt_uid=False)
+                if hub_uid != uid:
+                    adopted[uid] = hub_uid
+            for uid in document_uids:
+                document = _read_document(local, uid)
+                if document is None or hub.execute('SELECT 1 FROM documents WHERE uid=?', (uid,)).fetchone():
+                    continue
+                document['client_uid'] = adopted.get(document['client_uid'], document['client_uid'])
+                duplicate = _free_duplicate(hub, document['type'], document['number'])
+                _insert_document(hub, document, duplicate)
+                if duplicate != document['duplicate']:
+                    duplicates[uid] = duplicate
+                    if duplicate:
+                        report['conflicts'].append(
+                            f"{document['type']} n° {document['number']} a aussi été émis par un autre poste")
+        with local:
+            local.execute('BEGIN IMMEDIATE')
+            for client in renamed:
+                # Unless it was edited again meanwhile: that edit is pushed
+                # and checked next time
+                local.execute('UPDATE clients SET name=?, version=? WHERE uid=? AND version=?',
+                              (client['name'], client['version'], client['uid'], client['version'] - 1))
+            for uid, hub_uid in adopted.items():
+                local.execute('UPDATE clients SET uid=? WHERE uid=?', (hub_uid, uid))
+            for uid, duplicate in duplicates.items():
+                # Move aside anything holding that slot locally first
+                document = _read_document(local, uid)
+                local.execute('UPDATE documents SET duplicate=? WHERE type=? AND number=? AND duplicate=? AND uid<>?',
+                              (_free_duplicate(local, document['type'], document['number']),
+                               document['type'], document['number'], duplicate, uid))
+                local.execute('UPDATE documents SET duplicate=? WHERE uid=?', (duplicate, uid))
+            _set_state(local, 'last_pushed', seq)
+        report['pushed'] += len(client_uids) + len(document_uids)
+        return True
+
+    def _pull(self, local, hub, report):
+        """Copy one batch of the share's changes here; False when done."""
+        last_pulled = _get_state(local, 'last_pulled')
+        seq, client_uids, document_uids = _pending(hub, last_pulled)
+        if seq == last_pulled:
+            return False
+        renamed = []
+        with local:
+            local.execute('BEGIN IMMEDIATE')
+            echo_after = _last_seq(local)
+            for uid in client_uids:
+                client = _read_client(hub, uid)
+                if client is None:
+                    continue
+                current = _find_client(local, client, hub)
+                holder = _name_holder(local, client, current) if _wins(client, current) else None
+                if holder is not None:
+                    # Named here since the push: the share's client keeps
+                    # the name, the one here is renamed as a local edit
+                    name = _free_name(client['name'], hub, local)
+                    report['conflicts'].append(
+                        f"client « {client['name']} » renommé « {name} » : nom déjà utilisé par un autre client")
+                    local.execute('UPDATE clients SET name=? WHERE uid=?', (name, holder))
+                    renamed.append(holder)
+                _, changed = _merge_client(local, client, current, adopt_uid=True)
+                report['pulled'] += changed
+            for uid in document_uids:
+                document = _read_document(hub, uid)
+                if document is None or local.execute('SELECT 1 FROM documents WHERE uid=?', (uid,)).fetchone():
+                    continue
+                # A document issued here since the push may hold the slot;
+                # it is numbered against the share on the next push anyway.
+                local.execute('UPDATE documents SET duplicate=? WHERE type=? AND number=? AND duplicate=?',
+                              (_free_duplicate(local, document['type'], document['number']),
+                               document['type'], document['number'], document['duplicate']))
+                _insert_document(local, document, document['duplicate'])
+                report['pulled'] += 1
+            # Rows written above come from the share: do not push them back,
+            # apart from the clients renamed here
+            local.execute('DELETE FROM sync_log WHERE seq > ?', (echo_after,))
+            local.executemany("INSERT INTO sync_log (entity, uid) VALUES ('client', ?)",
+                              [(uid,) for uid in renamed])
+            _set_state(local, 'last_pulled', seq)
+        return True
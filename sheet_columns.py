@@ -0,0 +1,24 @@
+"""Matching the header row of an imported sheet to field names.
+
+Shared by the order sheets of batch_invoices and the client lists of
+client_import: headers are compared without accents, case, dots or spaces,
+so "Quantité", "quantite" and "QUANTITE" are the same column.
+"""
+import unicodedata
+
+
+def normalize_header(name):
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode()
+    return name.strip().lower().replace(' ', '_').replace('.', '')
+
+
+def map_columns(headers, aliases):
+    """Return {column position: field} for the headers found in ``aliases``
+    (field -> accepted normalized names); the first matching column wins."""
+    columns = {}
+    for index, header in enumerate(headers):
+        normalized = normalize_header(header if header is not None else '')
+        for field, names in aliases.items():
+            if normalized in names and field not in columns.values():
+                columns[index] = field
+    return columns
@@ -0,0 +1,59 @@
+"""Processes issuing documents at once through issue_pipeline.issue must get
+unique, gapless numbers.  A small version of benchmarks/stress_numbering.py."""
+import os
+import sys
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import document_store
+import issue_pipeline
+from client_repository import get_repository
+from issue_pipeline import IssueRequest
+
+PROCESSES = 4
+DOCUMENTS = 10
+DATE = '2026-03-15'
+LINES = [('Ciment 42.5', 1.0, 2450.0)]
+BUSY_TIMEOUT = 1000  # ms, low enough for database.retry_on_busy to be exercised
+
+
+def _issue(task):
+    path, worker, count = task
+    database.DB_PATH = path
+    database.get_connection().execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+    client = get_repository().get('Client Stress')
+    numbers = []
+    for i in range(count):
+        doc_type = 'facture' if (worker + i) % 2 else 'devis'
+        request = IssueRequest(client, doc_type, None, DATE, f'PO-{worker}-{i}', LINES, None)
+        numbers.append((doc_type, issue_pipeline.issue(request).doc_number))
+    database.close_all()
+    return numbers
+
+
+def test_concurrent_numbers_are_unique_and_gapless(tmp_path):
+    saved_path = database.DB_PATH
+    path = str(tmp_path / 'stress.db')
+    database.DB_PATH = path
+    try:
+        database.migrate()
+        database.execute("INSERT INTO clients (id, name) VALUES (1, 'Client Stress')")
+        database.close_all()
+
+        with Pool(PROCESSES) as pool:
+            results = pool.map(_issue, [(path, worker, DOCUMENTS) for worker in range(PROCESSES)])
+        issued = [entry for numbers in results for entry in numbers]
+        assert len(issued) == PROCESSES * DOCUMENTS
+
+        for doc_type in document_store.NUMBER_PREFIXES:
+            stored = [row[0] for row in database.fetch_all(
+                'SELECT number FROM documents WHERE type=?', (doc_type,))]
+            assert len(set(stored)) == len(stored), f"{doc_type}: duplicate numbers"
+            assert sorted(stored) == [document_store.format_number(doc_type, 2026, n)
+                                      for n in range(1, len(stored) + 1)]
+            assert sorted(number for t, number in issued if t == doc_type) == sorted(stored)
+    finally:
+        database.close_all()
+        database.DB_PATH = saved_path
@@ -0,0 +1,101 @@
+"""EXPLAIN QUERY PLAN checks: the history and numbering queries must be
+served from the indexes created by the migrations, not by table scans."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import history_query
+from history_query import HistoryFilter
+
+CLIENTS = 50
+DOCUMENTS = 3000
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    saved_path = database.DB_PATH
+    database.DB_PATH = str(tmp_path_factory.mktemp('plans') / 'clients.db')
+    database.migrate()
+    conn = database.get_connection()
+    with database.transaction():
+        conn.executemany(
+            'INSERT INTO clients (name, nif, rc, address, client_type) VALUES (?, ?, ?, ?, ?)',
+            [(f'Client {i}', '', '', '', ('ciment', 'beton')[i % 2]) for i in range(CLIENTS)])
+        for i in range(DOCUMENTS):
+            doc_type = ('devis', 'facture')[i % 2]
+            cur = conn.execute(
+                'INSERT INTO documents (client_id, type, number, date) VALUES (?, ?, ?, ?)',
+                (i % CLIENTS + 1, doc_type, f"{'DF'[i % 2]}-2024-{i:04d}",
+                 f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}'))
+            conn.execute(
+                '''INSERT INTO document_lines (document_id, position, product, quantity, unit_price)
+                   VALUES (?, 1, 'Ciment 42.5', 10, 2450)''', (cur.lastrowid,))
+    conn.execute('ANALYZE')
+    yield conn
+    database.close_all()
+    database.DB_PATH = saved_path
+
+
+def plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def assert_uses_index(steps, table, index):
+    step = next((step for step in steps if step.split()[1:2] == [table]), None)
+    assert step is not None, steps
+    assert step.startswith(('SEARCH', 'SCAN')) and f'INDEX {index}' in step, steps
+
+
+HISTORY_FILTERS = [
+    (HistoryFilter('Client 3', '', '', '', None, None, ''), 'idx_documents_client_date'),
+    (HistoryFilter('', 'facture', '', '', None, None, ''), 'idx_documents_type_date'),
+    (HistoryFilter('', '', '2024-03-01', '2024-03-31', None, None, ''), 'idx_documents_date'),
+    (HistoryFilter('', '', '', '', None, None, ''), 'idx_documents_date'),
+]
+
+
+@pytest.mark.parametrize('flt, index', HISTORY_FILTERS)
+def test_history_pages_use_index(conn, flt, index):
+    where, params = flt.where()
+    steps = plan(conn, history_query._SELECT + where + history_query._ORDER + ' LIMIT ?', params + [200])
+    assert_uses_index(steps, 'documents', index)
+    assert_uses_index(steps, 'document_lines', 'idx_document_lines_document')
+    assert not any('TEMP B-TREE' in step for step in steps), steps
+
+
+@pytest.mark.parametrize('flt, index', HISTORY_FILTERS)
+def test_history_seek_uses_index(conn, flt, index):
+    where, params = flt.where()
+    seek, seek_params = history_query._after(('2024-03-05', 10, 1))
+    steps = plan(conn, history_query._SELECT + where + seek + history_query._ORDER + ' LIMIT ?',
+                 params + seek_params + [200])
+    assert_uses_index(steps, 'documents', index)
+    assert not any('TEMP B-TREE' in step for step in steps), steps
+
+
+@pytest.mark.parametrize('flt, index', HISTORY_FILTERS[:3])
+def test_history_count_uses_index(conn, flt, index):
+    where, params = flt.where()
+    steps = plan(conn, 'SELECT COUNT(*) ' + history_query._FROM + where, params)
+    assert_uses_index(steps, 'documents', index)
+
+
+def test_document_exists_uses_number_index(conn):
+    steps = plan(conn, 'SELECT 1 FROM documents WHERE number=? AND type=?', ('F-2024-0001', 'facture'))
+    assert_uses_index(steps, 'documents', 'idx_documents_type_number')
+
+
+def test_sequence_lookup_uses_primary_key(conn):
+    steps = plan(conn, 'SELECT last_number FROM document_sequences WHERE doc_type=? AND year=?',
+                 ('facture', 2024))
+    assert_uses_index(steps, 'document_sequences', 'sqlite_autoindex_document_sequences_1')
+
+
+def test_clients_by_type_use_index(conn):
+    steps = plan(conn, 'SELECT name FROM clients WHERE client_type=? ORDER BY name', ('ciment',))
+    assert_uses_index(steps, 'clients', 'idx_clients_type_name')
+    assert not any('TEMP B-TREE' in step for step in steps), steps
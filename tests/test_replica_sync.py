@@ -0,0 +1,214 @@
+"""Two desks working on replicas of one share, then syncing; a small version
+of benchmarks/sim_replica_sync.py plus the client name collisions."""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import issue_pipeline
+import replica
+from client_repository import get_repository
+from issue_pipeline import IssueRequest
+
+DOCUMENTS = 6
+LINES = [('Ciment 42.5', 10.0, 2450.0)]
+
+
+def use(path):
+    """Act as the desk working on ``path``."""
+    database.DB_PATH = path
+    get_repository().invalidate()
+
+
+def snapshot(path):
+    conn = database.connect(path)
+    try:
+        clients = conn.execute('SELECT uid, name, nif, rc, address, client_type, version FROM clients ORDER BY uid').fetchall()
+        documents = conn.execute('''SELECT documents.uid, clients.uid, type, number, duplicate, date, total_ht
+                                    FROM documents LEFT JOIN clients ON clients.id = documents.client_id
+                                    ORDER BY documents.uid''').fetchall()
+    finally:
+        conn.close()
+    return clients, documents
+
+
+def sync_all(desks, order='ABAB'):
+    for name in order:
+        assert desks[name][1].sync_once() is not None, desks[name][1].last_error
+
+
+def assert_converged(share, desks):
+    expected = snapshot(share)
+    for name, (local, _) in desks.items():
+        assert snapshot(local) == expected, f"desk {name} differs from the share"
+    return expected
+
+
+@pytest.fixture
+def share(tmp_path):
+    saved_path = database.DB_PATH
+    path = str(tmp_path / 'share' / 'clients.db')
+    os.makedirs(os.path.dirname(path))
+    use(path)
+    database.migrate()
+    get_repository().add('Client Partagé', '30400224', '200721', 'Nouakchott', 'ciment', {})
+    database.close_all()
+    yield path
+    database.close_all()
+    replica._numbering_share = None
+    use(saved_path)
+
+
+@pytest.fixture
+def desks(share, tmp_path):
+    desks = {}
+    for name in ('A', 'B'):
+        local = replica.open_replica(share, str(tmp_path / f'desk{name}.db'))
+        desks[name] = (local, replica.ReplicaSync(share, local))
+    return desks
+
+
+def test_offline_work_converges(share, desks):
+    # Online work: both desks issue documents and edit the same client
+    for name, (local, _) in desks.items():
+        use(local)
+        repository = get_repository()
+        shared = repository.get('Client Partagé')
+        own = repository.add(f'Client {name}', '', '', '', 'beton', {})
+        repository.add('Client Commun', '', '', f'créé par {name}', 'ciment', {})
+        for i in range(DOCUMENTS):
+            client = shared if i % 2 else own
+            issue_pipeline.issue(IssueRequest(client, 'facture', None, '2026-05-01', f'PO-{name}-{i}', LINES, None))
+        time.sleep(0.01)  # B's edit is the later one
+        repository.update('Client Partagé', 'Client Partagé', shared.nif, shared.rc,
+                          f'adresse {name}', 'ciment', {})
+        database.close_all()
+
+    # Offline work: no automatic numbers, and a clash of typed numbers
+    share_dir = os.path.dirname(share)
+    os.rename(share_dir, share_dir + '.off')
+    for name, (local, sync) in desks.items():
+        use(local)
+        client = get_repository().get('Client Partagé')
+        with pytest.raises(replica.ShareUnavailable):
+            issue_pipeline.issue(IssueRequest(client, 'facture', None, '2026-05-02', '', LINES, None))
+        issue_pipeline.issue(IssueRequest(client, 'facture', 'F-MANUEL-1', '2026-05-02', '', LINES, None))
+        assert sync.sync_once() is None
+        assert sync.share_unreachable
+        database.close_all()
+    os.rename(share_dir + '.off', share_dir)
+
+    sync_all(desks)
+    clients, documents = assert_converged(share, desks)
+    addresses = {row[1]: row[4] for row in clients}
+    assert addresses['Client Partagé'] == 'adresse B'
+    assert len([row for row in clients if row[1] == 'Client Commun']) == 1
+    assert len(documents) == 2 * DOCUMENTS + 2
+    assert len({(row[2], row[3], row[4]) for row in documents}) == len(documents)
+    assert not any(row[4] for row in documents if row[3] != 'F-MANUEL-1')
+    conflicts = [conflict for _, sync in desks.values() for conflict in sync.take_conflicts()]
+    assert len(conflicts) == 1 and 'F-MANUEL-1' in conflicts[0]
+
+
+def test_rename_to_a_name_taken_on_the_share(share, desks):
+    local_a, sync_a = desks['A']
+    local_b, sync_b = desks['B']
+    use(local_b)
+    get_repository().add('Dupont', '', '', 'créé par B', 'ciment', {})
+    database.close_all()
+    assert sync_b.sync_once() is not None
+
+    # A has not pulled B's client yet
+    use(local_a)
+    client = get_repository().get('Client Partagé')
+    get_repository().update('Client Partagé', 'Dupont', client.nif, client.rc, 'renommé par A', 'ciment', {})
+    database.close_all()
+    assert sync_a.sync_once() is not None, sync_a.last_error
+    assert sync_a.take_conflicts() == [
+        "client « Dupont » renommé « Dupont (2) » : nom déjà utilisé par un autre client"]
+
+    sync_all(desks, 'BA')
+    clients, _ = assert_converged(share, desks)
+    addresses = {row[1]: row[4] for row in clients}
+    assert addresses == {'Dupont': 'créé par B', 'Dupont (2)': 'renommé par A'}
+
+
+def test_new_client_with_a_name_taken_on_the_share(share, desks):
+    local_a, sync_a = desks['A']
+    local_b, sync_b = desks['B']
+    use(local_b)
+    client = get_repository().get('Client Partagé')
+    get_repository().update('Client Partagé', 'Martin', client.nif, client.rc, 'renommé par B', 'ciment', {})
+    database.close_all()
+    assert sync_b.sync_once() is not None
+
+    # A knows the renamed client under its old name, and creates another
+    # client under its new one
+    use(local_a)
+    martin = get_repository().add('Martin', '', '', 'créé par A', 'beton', {})
+    issue_pipeline.issue(IssueRequest(martin, 'facture', None, '2026-05-01', '', LINES, None))
+    database.close_all()
+    assert sync_a.sync_once() is not None, sync_a.last_error
+    assert sync_a.take_conflicts() == [
+        "client « Martin » renommé « Martin (2) » : nom déjà utilisé par un autre client"]
+
+    sync_all(desks, 'BA')
+    clients, documents = assert_converged(share, desks)
+    addresses = {row[1]: row[4] for row in clients}
+    assert addresses == {'Martin': 'renommé par B', 'Martin (2)': 'créé par A'}
+    client_uids = {row[1]: row[0] for row in clients}
+    assert [row[1] for row in documents] == [client_uids['Martin (2)']]
+
+
+def test_name_taken_between_push_and_pull(share, desks):
+    local_a, sync_a = desks['A']
+    local_b, sync_b = desks['B']
+    use(local_b)
+    get_repository().add('Durand', '', '', 'créé par B', 'ciment', {})
+    database.close_all()
+    assert sync_b.sync_once() is not None
+
+    # Renamed on A once its push is done, before B's client is pulled
+    push = sync_a._push
+
+    def push_then_rename(local, hub, report):
+        more = push(local, hub, report)
+        if not more:
+            local.execute("UPDATE clients SET name='Durand', address='renommé par A' WHERE name='Client Partagé'")
+        return more
+
+    sync_a._push = push_then_rename
+    assert sync_a.sync_once() is not None, sync_a.last_error
+    del sync_a._push
+    assert sync_a.take_conflicts() == [
+        "client « Durand » renommé « Durand (2) » : nom déjà utilisé par un autre client"]
+
+    sync_all(desks, 'AB')
+    clients, _ = assert_converged(share, desks)
+    addresses = {row[1]: row[4] for row in clients}
+    assert addresses == {'Durand': 'créé par B', 'Durand (2)': 'renommé par A'}
+
+
+def test_failures_other_than_the_share_are_not_unreachable(share, desks):
+    local, sync = desks['A']
+    with open(share, 'wb') as f:
+        f.write(b'not a database' * 100)
+    assert sync.sync_once() is None
+    assert sync.last_error is not None
+    assert not sync.share_unreachable
+
+
+def test_open_replica_without_share(tmp_path):
+    saved_path = database.DB_PATH
+    local = str(tmp_path / 'desk.db')
+    try:
+        with pytest.raises(FileNotFoundError):
+            replica.open_replica(str(tmp_path / 'absent' / 'clients.db'), local)
+        assert os.listdir(tmp_path) == []
+        assert database.DB_PATH == saved_path
+    finally:
+        replica._numbering_share = None